@@ -0,0 +1,177 @@
+import os
+import gzip
+import json
+import time
+import logging
+import datetime
+import argparse
+import functools
+import threading
+
+from interaction_store import get_store
+import search_index
+import file_lock
+
+# Compaction of the interaction store. Sessions idle for longer than ARCHIVE_IDLE_DAYS are
+# moved out of the live tables into compressed per-month archive segments
+# (<archive dir>/YYYY-MM.jsonl.gz, by the month of the session's last message). Each session
+# is appended as its own gzip member holding one JSON line, and the archived_sessions table
+# of the store keeps its segment, offset and length, so one archived conversation is read
+# back with a single seek. `zcat` on a segment still gives plain JSON lines.
+#
+#   python archive.py compact --idle-days 30     (e.g. nightly from cron)
+#   python archive.py list --user dana
+#   python archive.py show <session_id>
+#
+# With ARCHIVE_INTERVAL_HOURS set, the app also runs the compaction in a background thread.
+
+logger = logging.getLogger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(script_dir, 'doc', 'archive'))
+ARCHIVE_IDLE_DAYS = float(os.getenv("ARCHIVE_IDLE_DAYS", 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 200))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", 0))
+
+
+def segment_name(timestamp):
+    try:
+        return datetime.datetime.fromisoformat(timestamp).strftime("%Y-%m") + ".jsonl.gz"
+    except (ValueError, TypeError):
+        return "undated.jsonl.gz"
+
+
+# Appends sessions to the month segments of one archive directory during a compaction batch.
+# Each append locks the segment and writes at its current end, so the recorded offset stays
+# right when other processes (another replica's scheduler, a cron run) append to it too.
+class SegmentWriter:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self._files = {}
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def append(self, summary, records):
+        segment = segment_name(summary["last_timestamp"])
+        file = self._files.get(segment)
+        if file is None:
+            file = self._files[segment] = open(os.path.join(self.archive_dir, segment), 'ab')
+        line = json.dumps({"session_id": summary["session_id"], "interactions": records}, ensure_ascii=False)
+        data = gzip.compress((line + "\n").encode('utf-8'))
+        with file_lock.locked(file):
+            offset = file.seek(0, os.SEEK_END)
+            file.write(data)
+            file.flush()
+        return segment, offset, len(data)
+
+    # Make everything appended so far durable (called before the live rows are deleted)
+    def sync(self):
+        for file in self._files.values():
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+
+# Move sessions idle since before now - idle_days into the archive, batch by batch
+def compact(store, archive_dir=ARCHIVE_DIR, idle_days=ARCHIVE_IDLE_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    before = (datetime.datetime.now() - datetime.timedelta(days=idle_days)).isoformat()
+    started = time.perf_counter()
+    # Index what is still unindexed while it is in the live tables, so archived sessions stay searchable
+    search_index.get_index(store.db_path).update(archive_dir=archive_dir)
+    archived = 0
+    writer = SegmentWriter(archive_dir)
+    try:
+        while True:
+            session_ids = store.idle_session_ids(before, limit=batch_size)
+            if not session_ids:
+                break
+            moved = store.archive_sessions(session_ids, before, writer)
+            if not moved:
+                break
+            archived += len(moved)
+    finally:
+        writer.close()
+    return {"archived_sessions": archived, "before": before, "seconds": round(time.perf_counter() - started, 3)}
+
+
+# One gzip member of a segment; archived data never changes, so reads are cached per process
+@functools.lru_cache(maxsize=64)
+def _read_member(path, offset, length):
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        data = file.read(length)
+    return json.loads(gzip.decompress(data).decode('utf-8'))
+
+
+# Interactions of an archived session, oldest first, read from its segment(s) on demand
+def read_archived_session(store, session_id, archive_dir=ARCHIVE_DIR):
+    interactions = []
+    for part in store.archived_session_parts(session_id):
+        path = os.path.join(archive_dir, part["segment"])
+        interactions.extend(_read_member(path, part["offset"], part["length"])["interactions"])
+    return interactions
+
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+
+# Run the compaction every interval_hours in a daemon thread (once per process)
+def start_scheduler(store, interval_hours=ARCHIVE_INTERVAL_HOURS, archive_dir=ARCHIVE_DIR):
+    global _scheduler_started
+    if interval_hours <= 0:
+        return False
+    with _scheduler_lock:
+        if _scheduler_started:
+            return True
+        _scheduler_started = True
+
+    def run():
+        while True:
+            try:
+                result = compact(store, archive_dir)
+                if result["archived_sessions"]:
+                    logger.info("Archived %d idle sessions in %s s", result["archived_sessions"], result["seconds"])
+            except Exception:
+                logger.exception("Archive compaction failed")
+            time.sleep(interval_hours * 3600)
+
+    threading.Thread(target=run, name="archive-compaction", daemon=True).start()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle sessions of the interaction store")
+    parser.add_argument('--db', default=os.getenv("INTERACTIONS_DB_PATH", os.path.join(script_dir, 'doc', 'interactions.db')))
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    compact_parser = commands.add_parser('compact', help="move idle sessions into the archive")
+    compact_parser.add_argument('--idle-days', type=float, default=ARCHIVE_IDLE_DAYS)
+    compact_parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    list_parser = commands.add_parser('list', help="list archived sessions, newest first")
+    list_parser.add_argument('--user')
+    list_parser.add_argument('--limit', type=int, default=50)
+    show_parser = commands.add_parser('show', help="print an archived session as JSON")
+    show_parser.add_argument('session_id')
+    args = parser.parse_args()
+
+    store = get_store(args.db)
+    if args.command == 'compact':
+        result = compact(store, args.archive_dir, args.idle_days, args.batch_size)
+        print(f"Archived {result['archived_sessions']} sessions idle since before {result['before']}"
+              f" in {result['seconds']} s")
+    elif args.command == 'list':
+        for session in store.list_archived_sessions(limit=args.limit, user=args.user):
+            print(f"{session['session_id']}\t{session['user']}\t{session['last_timestamp']}"
+                  f"\t{session['message_count']} messages\t{session['segment']}")
+    else:
+        interactions = read_archived_session(store, args.session_id, args.archive_dir)
+        print(json.dumps(interactions, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
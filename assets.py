@@ -0,0 +1,91 @@
+import os
+import sys
+import base64
+import shutil
+import functools
+
+# Branding images for the user interface. Sources in images/ are resized to the size they
+# are displayed at and written to static/, which Streamlit serves at app/static/ when
+# server.enableStaticServing is on (see .streamlit/config.toml). URLs carry a version
+# parameter so browsers may cache them for good. Without static serving the optimized
+# files are inlined as data URIs, encoded once per process.
+
+STATIC_URL_PREFIX = "app/static"
+
+# Output name -> (source file, displayed size or None to keep the original size)
+ASSETS = {
+    "logo.png": ("logo.png", (400, 300)),
+    "tamal.png": ("tamal.png", None),
+}
+
+
+# Write the optimized copy of every asset whose source is newer than its output
+def build_static_assets(source_dir, static_dir, assets=ASSETS):
+    os.makedirs(static_dir, exist_ok=True)
+    built = []
+    for name, (source_name, size) in assets.items():
+        source = os.path.join(source_dir, source_name)
+        target = os.path.join(static_dir, name)
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            continue
+        optimize_image(source, target, size)
+        built.append(name)
+    return built
+
+
+# Build the static assets once per process
+@functools.lru_cache(maxsize=None)
+def prepare_static_assets(source_dir, static_dir):
+    return build_static_assets(source_dir, static_dir)
+
+
+def optimize_image(source, target, size=None):
+    try:
+        from PIL import Image  # Installed with Streamlit
+    except ImportError:
+        shutil.copyfile(source, target)
+        return
+    with Image.open(source) as image:
+        if size and image.size != tuple(size):
+            image = image.resize(size, Image.LANCZOS)
+        image.save(target, optimize=True)
+
+
+def static_serving_enabled():
+    import streamlit as st
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+# URL of a static asset; the version changes whenever the file does
+def static_url(static_dir, name):
+    version = os.stat(os.path.join(static_dir, name)).st_mtime_ns
+    return f"{STATIC_URL_PREFIX}/{name}?v={version}"
+
+
+@functools.lru_cache(maxsize=16)
+def _data_uri(path, version):
+    with open(path, "rb") as file:
+        return f"data:image/png;base64,{base64.b64encode(file.read()).decode()}"
+
+
+def data_uri(path):
+    return _data_uri(path, os.stat(path).st_mtime_ns)
+
+
+# Image source for an asset: a cacheable static URL, or the memoized data URI as a fallback
+def asset_src(static_dir, name):
+    if static_serving_enabled():
+        return static_url(static_dir, name)
+    return data_uri(os.path.join(static_dir, name))
+
+
+if __name__ == '__main__':
+    # python assets.py [images_dir static_dir]
+    root = os.path.dirname(os.path.abspath(__file__))
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(root, 'images')
+    static_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(root, 'static')
+    for name in build_static_assets(source_dir, static_dir):
+        print(f"Built {os.path.join(static_dir, name)} ({os.path.getsize(os.path.join(static_dir, name))} bytes)")
@@ -0,0 +1,205 @@
+import os
+import copy
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from topic_cache import TopicCache, file_stamp
+from profiler import timed_import
+
+# Authentication helpers. The credentials YAML is parsed once per process and only
+# re-read when the file changes; streamlit_authenticator (and with it bcrypt, jwt and
+# the cookie component) is imported on first use.
+#
+# A successful login is remembered as a short-lived session token signed with a
+# per-process secret, kept in st.session_state and, for cookie logins, in a process-wide
+# map keyed by the re-authentication cookie. Reruns and new tabs with a valid token skip
+# the authenticator entirely. Tokens also carry the credentials file version, so editing
+# the file signs everybody in again. Password checks run on a small worker pool.
+
+SESSION_TOKEN_TTL = int(os.getenv("AUTH_SESSION_TTL", 900))
+LOGIN_WORKERS = int(os.getenv("AUTH_LOGIN_WORKERS", 4))
+MAX_COOKIE_TOKENS = int(os.getenv("AUTH_MAX_COOKIE_TOKENS", 10000))
+
+_config_cache = TopicCache(max_entries=4)
+
+_secret = secrets.token_bytes(32)
+
+_cookie_tokens = OrderedDict()
+_cookie_tokens_lock = threading.Lock()
+
+_login_pool = ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="login")
+
+
+def _read_yaml(path):
+    yaml = timed_import('yaml')
+    with open(path, encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+# Parsed credentials file, shared by all sessions; must not be mutated
+def load_config(path):
+    return _config_cache.get(('credentials', path), [path], lambda: _read_yaml(path))
+
+
+def make_authenticator(config):
+    stauth = timed_import('streamlit_authenticator')
+    # Authenticate marks users as logged in inside the credentials, so it gets its own copy
+    return stauth.Authenticate(
+        copy.deepcopy(config['credentialss']),
+        config['cookie']['name'],
+        config['cookie']['key'],
+        config['cookie']['expiry_days'],
+        config['preauthorized']
+    )
+
+
+def _config_version(path):
+    return list(file_stamp(path) or ())
+
+
+def _sign(payload):
+    body = base64.urlsafe_b64encode(json.dumps(payload, ensure_ascii=False).encode('utf-8')).decode()
+    signature = hmac.new(_secret, body.encode(), hashlib.sha256).hexdigest()
+    return f"{body}.{signature}"
+
+
+def issue_session_token(username, name, config_path):
+    return _sign({
+        "username": username,
+        "name": name,
+        "version": _config_version(config_path),
+        "expires": time.time() + SESSION_TOKEN_TTL,
+    })
+
+
+# Payload of a session token, or None if it is forged, expired or from an older credentials file
+def verify_session_token(token, config_path):
+    if not token or '.' not in token:
+        return None
+    body, signature = token.rsplit('.', 1)
+    expected = hmac.new(_secret, body.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected):
+        return None
+    payload = json.loads(base64.urlsafe_b64decode(body.encode()).decode('utf-8'))
+    if payload["expires"] < time.time() or payload["version"] != _config_version(config_path):
+        return None
+    return payload
+
+
+def _remember_cookie(cookie, token):
+    with _cookie_tokens_lock:
+        _cookie_tokens[cookie] = token
+        _cookie_tokens.move_to_end(cookie)
+        while len(_cookie_tokens) > MAX_COOKIE_TOKENS:
+            _cookie_tokens.popitem(last=False)
+
+
+def _cookie_token(cookie):
+    with _cookie_tokens_lock:
+        return _cookie_tokens.get(cookie)
+
+
+# The re-authentication cookie sent with this browser session's request, if Streamlit exposes it
+def _request_cookie(st, cookie_name):
+    cookies = getattr(getattr(st, 'context', None), 'cookies', None)
+    if not cookies:
+        return None
+    return cookies.get(cookie_name)
+
+
+# Username of a valid re-authentication cookie (the JWT streamlit_authenticator sets)
+def _cookie_username(cookie, config):
+    jwt = timed_import('jwt')
+    try:
+        payload = jwt.decode(cookie, config['cookie']['key'], algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return None
+    username = payload.get('username')
+    if username not in config['credentialss']['usernames'] or payload.get('exp_date', 0) < time.time():
+        return None
+    return username
+
+
+def check_password(password, hashed_password):
+    bcrypt = timed_import('bcrypt')
+
+    def check():
+        try:
+            return bcrypt.checkpw(password.encode(), hashed_password.encode())
+        except ValueError:
+            return False
+
+    return _login_pool.submit(check).result()
+
+
+# Let the authenticator's password check run on the login pool instead of the script thread
+def _check_passwords_on_pool(authenticator, st):
+    handler = authenticator.authentication_handler
+    original = handler.check_credentials
+
+    def check_credentials(username, password, max_concurrent_users=None, max_login_attempts=None):
+        user = handler.credentials['usernames'].get(username)
+        if user is None or max_concurrent_users is not None or max_login_attempts is not None:
+            return original(username, password, max_concurrent_users, max_login_attempts)
+        if check_password(password, user['password']):
+            return True
+        st.session_state['authentication_status'] = False
+        handler._record_failed_login_attempts(username)
+        return False
+
+    handler.check_credentials = check_credentials
+
+
+def _accept(st, token, payload):
+    st.session_state.auth_token = token
+    # Same keys streamlit_authenticator keeps, for code that reads them
+    st.session_state['name'] = payload["name"]
+    st.session_state['username'] = payload["username"]
+    st.session_state['authentication_status'] = True
+    return payload["name"], True, payload["username"]
+
+
+# Authenticate this browser session; returns (name, authentication_status, username) like
+# streamlit_authenticator's login(), only running it when no valid session token exists
+def login(config_path, location='main'):
+    import streamlit as st
+
+    # Verified earlier in this session; tokens past half their lifetime are renewed
+    token = st.session_state.get('auth_token')
+    payload = verify_session_token(token, config_path)
+    if payload is not None:
+        if payload["expires"] - time.time() < SESSION_TOKEN_TTL / 2:
+            token = issue_session_token(payload["username"], payload["name"], config_path)
+        return _accept(st, token, payload)
+
+    config = load_config(config_path)
+
+    # A re-authentication cookie: reuse its token (e.g. another tab) or verify the cookie itself
+    cookie = None if st.session_state.get('logout') else _request_cookie(st, config['cookie']['name'])
+    if cookie:
+        token = _cookie_token(cookie)
+        payload = verify_session_token(token, config_path)
+        if payload is None:
+            username = _cookie_username(cookie, config)
+            if username is not None:
+                name = config['credentialss']['usernames'][username]['name']
+                token = issue_session_token(username, name, config_path)
+                payload = verify_session_token(token, config_path)
+                _remember_cookie(cookie, token)
+        if payload is not None:
+            return _accept(st, token, payload)
+
+    # Full login through the authenticator (cookie component or login form)
+    authenticator = make_authenticator(config)
+    _check_passwords_on_pool(authenticator, st)
+    name, authentication_status, username = authenticator.login(location)
+    if authentication_status:
+        st.session_state.auth_token = issue_session_token(username, name, config_path)
+    return name, authentication_status, username
@@ -0,0 +1 @@
+# Benchmarks for the app's hot paths; run with python -m benchmarks.run
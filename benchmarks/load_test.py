@@ -0,0 +1,321 @@
+import os
+import sys
+import time
+import socket
+import random
+import argparse
+import tempfile
+import resource
+import threading
+import subprocess
+from collections import Counter
+
+# Concurrent-user load test. Simulated users and admins drive id.py through Streamlit's
+# AppTest, all in this process, against a local mock OpenAI server (benchmarks.mock_llm)
+# and a fresh interaction store:
+#   - users ask a question every --think-time seconds (routing + streamed answer) and
+#     otherwise rerun every 5 seconds like the autorefresh that polls for admin comments;
+#   - admins rerun every 3 seconds, open a conversation from the sidebar (again once users
+#     have written, if the panel opened empty), post comments to it and sometimes hand it
+#     back with "חזור ל-AI".
+# Reports throughput, time to first token (from the app's "prompt" spans), turn latency,
+# writes missing from the store, and CPU time and memory per simulated user.
+#
+#   python -m benchmarks.load_test --users 200 --admins 3 --duration 120 --mock-ttft 0.4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import QUESTIONS  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, 'id.py')
+USER_POLL_INTERVAL = 5.0
+ADMIN_REFRESH_INTERVAL = 3.0
+
+
+def write_credentials(path, users):
+    lines = [
+        "cookie:",
+        "  expiry_days: 0",
+        "  key: load_test_signature_key",
+        "  name: load_test_cookie",
+        "preauthorized:",
+        "  emails: []",
+        "credentialss:",
+        "  usernames:",
+        "    admin:",
+        "      name: Admin User",
+        "      password: not-used",
+    ]
+    for index in range(users):
+        lines += [f"    user{index}:", f"      name: משתמש {index}", "      password: not-used"]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Mock LLM server did not start on port {port}")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def memory_kb(field):
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turn_latencies = []
+        self.poll_latencies = []
+        self.refresh_latencies = []
+        self.ttfts = []
+        self.sent = Counter()         # session id -> messages the user sent
+        self.comments = Counter()     # session id -> comments the admins posted
+        self.handbacks = Counter()    # session id -> times an admin pressed "חזור ל-AI"
+        self.errors = Counter()
+
+    def record(self, name, value):
+        with self.lock:
+            getattr(self, name).append(value)
+
+    def count(self, name, key):
+        with self.lock:
+            getattr(self, name)[key] += 1
+
+
+# Collects time to first token from the app's "prompt" spans (see tracing.py)
+class PromptSpanCollector:
+    def __init__(self, results):
+        self.results = results
+
+    def export(self, span):
+        if span.name == "prompt" and span.attributes.get("ttft_ms") is not None:
+            self.results.record("ttfts", span.attributes["ttft_ms"])
+
+
+# AppTest isn't meant to run scripts from several threads at once; two things break:
+#   - it installs a mock Runtime for each run and removes it when the run ends, which fails
+#     the runs other threads have in progress ("Runtime hasn't been created!"). AppTest is
+#     pointed at a subclass whose _instance assignments keep the latest mock installed;
+#   - every run compiles the script again, and ast.parse isn't thread-safe on Python 3.11
+#     ("AST constructor recursion depth mismatch"), so compiling is done one at a time.
+def make_app_test_thread_safe():
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import magic
+    from streamlit.testing.v1 import app_test
+
+    class KeepInstalled(type(Runtime)):
+        def __setattr__(cls, name, value):
+            if name != '_instance':
+                super().__setattr__(name, value)
+            elif value is not None:
+                Runtime._instance = value
+
+    app_test.Runtime = KeepInstalled("SharedRuntime", (Runtime,), {})
+
+    add_magic = magic.add_magic
+    compile_lock = threading.Lock()
+
+    def add_magic_one_at_a_time(*args, **kwargs):
+        with compile_lock:
+            return add_magic(*args, **kwargs)
+
+    magic.add_magic = add_magic_one_at_a_time
+
+
+def timed_run(results, element, latency_name):
+    started = time.perf_counter()
+    app = element.run()
+    results.record(latency_name, time.perf_counter() - started)
+    for exception in app.exception:
+        results.count("errors", str(exception.message).splitlines()[0][:80] if exception.message else "exception")
+    return app
+
+
+def simulate_user(index, deadline, think_time, results, new_app):
+    app = new_app(f"user{index}", f"משתמש {index}")
+    timed_run(results, app, "poll_latencies")
+    if "session_id" not in app.session_state:
+        return  # The script failed before the chat started; the error is in the report
+    session_id = app.session_state["session_id"]
+    rng = random.Random(index)
+    next_prompt = time.monotonic() + rng.uniform(0, think_time)
+    turn = 0
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        if now >= next_prompt and app.chat_input:
+            turn += 1
+            # Questions differ per turn, the app ignores a repeated prompt
+            prompt = f"{rng.choice(QUESTIONS)} ({index}-{turn})"
+            app = timed_run(results, app.chat_input[0].set_value(prompt), "turn_latencies")
+            results.count("sent", session_id)
+            next_prompt = time.monotonic() + rng.expovariate(1 / think_time)
+        else:
+            time.sleep(max(0.0, min(USER_POLL_INTERVAL, next_prompt - now, deadline - now)))
+            app = timed_run(results, app, "poll_latencies")
+
+
+def simulate_admin(index, deadline, comment_rate, results, new_app):
+    app = new_app("admin", "Admin User")
+    timed_run(results, app, "refresh_latencies")
+    rng = random.Random(10000 + index)
+    while time.monotonic() < deadline:
+        time.sleep(ADMIN_REFRESH_INTERVAL)
+        session_id = app.session_state["selected_session_id"] if "selected_session_id" in app.session_state else None
+        session_buttons = [button for button in app.button if (button.key or "").startswith("session_")]
+        return_buttons = [button for button in app.button if button.label == "חזור ל-AI"]
+        if session_buttons and (session_id is None or rng.random() < 0.2):
+            # The panel opened before any user wrote, or the admin moves on to another conversation
+            app = timed_run(results, rng.choice(session_buttons).click(), "refresh_latencies")
+        elif return_buttons and rng.random() < 0.3:
+            app = timed_run(results, return_buttons[0].click(), "refresh_latencies")
+            results.count("handbacks", session_id)
+        elif session_id and app.chat_input and rng.random() < comment_rate:
+            app = timed_run(results, app.chat_input[0].set_value(f"תגובת מנהל {index}-{time.time():.3f}"), "refresh_latencies")
+            results.count("comments", session_id)
+        else:
+            app = timed_run(results, app, "refresh_latencies")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent users and admins against id.py")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of load after ramp-up")
+    parser.add_argument('--ramp-up', type=float, default=10.0, help="seconds over which users join")
+    parser.add_argument('--think-time', type=float, default=20.0, help="mean seconds between a user's questions")
+    parser.add_argument('--comment-rate', type=float, default=0.3, help="chance an admin refresh posts a comment")
+    parser.add_argument('--mock-port', type=int, default=8011)
+    parser.add_argument('--mock-ttft', type=float, default=0.4)
+    parser.add_argument('--mock-tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--mock-tokens', type=int, default=150)
+    parser.add_argument('--timeout', type=float, default=120.0, help="AppTest timeout per script run")
+    args = parser.parse_args()
+
+    # Everything the app writes goes to a scratch directory; set before the app's modules are imported
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    credentials_path = os.path.join(workdir, 'credentials.yaml')
+    write_credentials(credentials_path, args.users)
+    os.environ.update({
+        "CREDENTIALS_PATH": credentials_path,
+        "INTERACTIONS_DB_PATH": os.path.join(workdir, 'interactions.db'),
+        "E_JSON_PATH": os.path.join(workdir, 'e.json'),
+        "TRANSCRIPT_PATH": os.path.join(workdir, 'inputs_and_outputs'),
+        "ROUTING_LOG_PATH": os.path.join(workdir, 'routing_log.jsonl'),
+        "TRACE_FILE": os.path.join(workdir, 'traces.jsonl'),
+        "SESSION_STORE_URL": f"sqlite:///{os.path.join(workdir, 'sessions.db')}",
+        "KNOWLEDGE_PACK_PATH": os.path.join(workdir, 'knowledge.pack'),
+        "ARCHIVE_DIR": os.path.join(workdir, 'archive'),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1",
+        "OPENAI_API_KEY": "mock",
+    })
+
+    from streamlit.testing.v1 import AppTest
+    import auth
+    import tracing
+    from interaction_store import get_store
+
+    make_app_test_thread_safe()
+    results = Results()
+    tracing.tracer.exporters.append(PromptSpanCollector(results))
+
+    def new_app(username, name):
+        app = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+        # Signed in the way a verified browser session is (see auth.login)
+        app.session_state["auth_token"] = auth.issue_session_token(username, name, credentials_path)
+        return app
+
+    mock = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_llm", "--port", str(args.mock_port), "--ttft", str(args.mock_ttft),
+        "--tokens-per-second", str(args.mock_tokens_per_second), "--tokens", str(args.mock_tokens),
+    ], cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.mock_port)
+        rss_before = memory_kb("VmRSS")
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.monotonic()
+        deadline = started + args.ramp_up + args.duration
+
+        threads = []
+        for index in range(args.admins):
+            threads.append(threading.Thread(target=simulate_admin, daemon=True,
+                                            args=(index, deadline, args.comment_rate, results, new_app)))
+        for index in range(args.users):
+            threads.append(threading.Thread(target=simulate_user, daemon=True,
+                                            args=(index, deadline, args.think_time, results, new_app)))
+        for position, thread in enumerate(threads):
+            thread.start()
+            time.sleep(args.ramp_up / max(1, len(threads)))
+            if position % 50 == 49:
+                print(f"{position + 1} simulated clients started", flush=True)
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()) + args.timeout)
+
+        elapsed = time.monotonic() - started
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        rss_after = memory_kb("VmRSS")
+    finally:
+        mock.terminate()
+
+    # Writes the simulation made that the store doesn't have
+    store = get_store(os.environ["INTERACTIONS_DB_PATH"])
+    lost_messages = 0
+    for session_id, sent in results.sent.items():
+        lost_messages += max(0, sent - len(store.get_session_interactions(session_id)))
+    lost_comments = 0
+    for session_id, posted in results.comments.items():
+        stored = sum(len(interaction["comments"]) for interaction in store.get_session_interactions(session_id))
+        lost_comments += max(0, posted - stored)
+
+    clients = args.users + args.admins
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f} ms"
+
+    print(f"\nSimulated {args.users} users and {args.admins} admins for {elapsed:.0f} s")
+    print(f"Questions answered:     {len(results.turn_latencies)} ({len(results.turn_latencies) / elapsed:.2f}/s)")
+    print(f"Time to first token:    p50 {percentile(results.ttfts, 0.50) or 0:.0f} ms, "
+          f"p95 {percentile(results.ttfts, 0.95) or 0:.0f} ms, p99 {percentile(results.ttfts, 0.99) or 0:.0f} ms")
+    print(f"Question turn:          p50 {ms(percentile(results.turn_latencies, 0.5))}, p95 {ms(percentile(results.turn_latencies, 0.95))}")
+    print(f"User poll rerun:        p50 {ms(percentile(results.poll_latencies, 0.5))}, p95 {ms(percentile(results.poll_latencies, 0.95))}")
+    print(f"Admin refresh rerun:    p50 {ms(percentile(results.refresh_latencies, 0.5))}, p95 {ms(percentile(results.refresh_latencies, 0.95))}")
+    print(f"Lost writes:            {lost_messages} of {sum(results.sent.values())} messages, "
+          f"{lost_comments} of {sum(results.comments.values())} comments")
+    print(f"Admin actions:          {sum(results.comments.values())} comments in {len(results.comments)} "
+          f"conversations, {sum(results.handbacks.values())} hand-backs to the AI")
+    print(f"CPU per simulated user: {cpu / clients * 1000:.0f} ms total, {cpu / clients / elapsed * 100:.2f}% of a core")
+    print(f"Memory per user:        {(rss_after - rss_before) / clients:.0f} KB (RSS {rss_after / 1024:.0f} MB, "
+          f"peak {memory_kb('VmHWM') / 1024:.0f} MB)")
+    if results.errors:
+        print("Script errors:")
+        for message, count in results.errors.most_common(10):
+            print(f"  {count:>5}  {message}")
+    print(f"Scratch data: {workdir}")
+    # Without comments the admin side of the run (comments, hand-backs, user wake-ups) wasn't exercised
+    if args.admins and args.comment_rate > 0 and not results.comments:
+        sys.exit("No admin comments were posted; the admin simulation did not run")
+
+
+if __name__ == '__main__':
+    main()
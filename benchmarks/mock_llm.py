@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local OpenAI-compatible mock for load tests. POST /v1/chat/completions answers
+# streaming requests with server-sent events, one word per chunk, after a configurable
+# first-token latency and at a configurable token rate; non-streaming requests (the
+# topic router) get a topic name. A fraction of requests can be rejected with 429.
+#
+#   python -m benchmarks.mock_llm --port 8011 --ttft 0.4 --tokens-per-second 40 --tokens 200
+#
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8011/v1 OPENAI_API_KEY=mock.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import ANSWER  # noqa: E402
+
+
+class MockSettings:
+    def __init__(self, ttft=0.4, tokens_per_second=40.0, tokens=200, jitter=0.2, error_rate=0.0, topic="default"):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.topic = topic
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def delay(self, seconds):
+        return max(0.0, seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+def _answer_words(count):
+    words = ANSWER.split()
+    return [words[index % len(words)] + " " for index in range(count)]
+
+
+def make_handler(settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client closed a kept-alive connection
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with settings.lock:
+                settings.requests += 1
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            if random.random() < settings.error_rate:
+                self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "0.2"})
+                return
+
+            model = request.get("model", "mock")
+            created = int(time.time())
+            if not request.get("stream"):
+                time.sleep(settings.delay(settings.ttft))
+                self._send_json(200, {
+                    "id": "mock-completion", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": settings.topic}}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 1, "total_tokens": 101},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                time.sleep(settings.delay(settings.ttft))
+                interval = 1.0 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+                for word in _answer_words(settings.tokens):
+                    chunk = {"id": "mock-stream", "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    if interval:
+                        time.sleep(settings.delay(interval))
+                final = {"id": "mock-stream", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client cancelled the stream
+
+    return Handler
+
+
+def serve(port, settings):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock server for load tests")
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--ttft', type=float, default=0.4, help="seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--tokens', type=int, default=200, help="tokens per streamed answer")
+    parser.add_argument('--jitter', type=float, default=0.2, help="relative random variation of every delay")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--topic', default="default", help="answer to non-streaming (routing) requests")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.ttft, args.tokens_per_second, args.tokens, args.jitter, args.error_rate, args.topic)
+    server = serve(args.port, settings)
+    print(f"Mock LLM listening on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+# Benchmarks for the storage, polling and rendering hot paths on synthetic logs of
+# growing size. For every scenario and log size it reports latency percentiles, bytes
+# read and written by the process, markup rendered per call and peak Python memory,
+# and compares p50/p95 with a saved baseline.
+#
+#   python -m benchmarks.run [--sizes 1000 10000 100000] [--iterations 200]
+#                            [--baseline benchmarks/baseline.json] [--save-baseline]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interaction_store import InteractionStore  # noqa: E402
+from search_index import get_index  # noqa: E402
+from benchmarks import scenarios  # noqa: E402
+from benchmarks.stubs import StubStreamlit, StubLLMClient  # noqa: E402
+from benchmarks.synthetic import write_log, QUESTIONS  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_ITERATIONS = 200
+MEMORY_ITERATIONS = 20
+SEARCH_QUERIES = ["טופס 161", "בקשה להדפסה", "פנסיה", "ימי חופשה", "הטפסים הנדרשים", "אחזור אליך"]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+# Bytes read and written by this process (including page-cache hits); None where /proc isn't available
+def read_io():
+    try:
+        with open('/proc/self/io') as file:
+            values = dict(line.split(': ') for line in file.read().splitlines())
+        return int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+# Time step(i) over the iterations (prepare(i) runs untimed before each), then trace a few more for peak memory
+def measure(st, step, iterations, prepare=None):
+    timings = []
+    st.reset_counters()
+    io_before = read_io()
+    for index in range(iterations):
+        if prepare:
+            prepare(index)
+        started = time.perf_counter()
+        step(index)
+        timings.append(time.perf_counter() - started)
+    io_after = read_io()
+    rendered = st.bytes_sent
+
+    tracemalloc.start()
+    for index in range(iterations, iterations + MEMORY_ITERATIONS):
+        if prepare:
+            prepare(index)
+        step(index)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    result = {
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "rendered_bytes_per_call": rendered / iterations,
+        "peak_memory_kb": peak / 1024,
+    }
+    if io_before and io_after:
+        result["read_bytes_per_call"] = (io_after[0] - io_before[0]) / iterations
+        result["written_bytes_per_call"] = (io_after[1] - io_before[1]) / iterations
+    return result
+
+
+def run_size(sessions, iterations):
+    directory = tempfile.mkdtemp(prefix="bench_")
+    try:
+        json_path = os.path.join(directory, 'e.json')
+        session_ids = write_log(json_path, sessions)
+        store = InteractionStore(os.path.join(directory, 'interactions.db'))
+        started = time.perf_counter()
+        store.migrate_from_json(json_path)
+        results = {"migrate": {"seconds": time.perf_counter() - started}}
+        search_index = get_index(store.db_path)
+        started = time.perf_counter()
+        search_index.update()
+        results["search_index_build"] = {"seconds": time.perf_counter() - started}
+
+        rng = random.Random(0)
+        admin_st = StubStreamlit()
+        user_st = StubStreamlit()
+        client = StubLLMClient()
+
+        def user_writes(index):
+            if index % 10 == 0:
+                scenarios.update_json_with_conversation(store, rng.choice(QUESTIONS), "תשובה", rng.choice(session_ids), "user1")
+
+        def admin_comments(index):
+            if index % 4 == 0:
+                store.add_admin_comment(rng.choice(session_ids), "תגובת מנהל")
+
+        results["admin_refresh"] = measure(admin_st, lambda index: scenarios.admin_refresh(admin_st, store),
+                                           iterations, prepare=user_writes)
+        results["check_for_admin_comments"] = measure(
+            user_st, lambda index: scenarios.check_for_admin_comments(store, rng.choice(session_ids)),
+            iterations, prepare=admin_comments)
+        results["update_json_with_conversation"] = measure(
+            user_st, lambda index: scenarios.update_json_with_conversation(
+                store, rng.choice(QUESTIONS), "תשובה", rng.choice(session_ids), "user1"),
+            iterations)
+        results["display_all_interactions"] = measure(
+            admin_st, lambda index: scenarios.display_all_interactions(admin_st, store, rng.choice(session_ids[:50])),
+            iterations)
+        results["prompt_turn"] = measure(
+            user_st, lambda index: scenarios.prompt_turn(user_st, store, client, rng.choice(session_ids), "user1",
+                                                         rng.choice(QUESTIONS)),
+            iterations)
+        results["search"] = measure(
+            admin_st, lambda index: scenarios.search(search_index, rng.choice(SEARCH_QUERIES)),
+            iterations, prepare=user_writes)
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def change(current, previous):
+    if not previous:
+        return ""
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+def report(all_results, baseline):
+    print(f"{'scenario':<30} {'sessions':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'read B':>9} "
+          f"{'write B':>9} {'render B':>9} {'peak KB':>9} {'p50 vs base':>12} {'p95 vs base':>12}")
+    for sessions, results in all_results.items():
+        for name, result in results.items():
+            if "seconds" in result:
+                print(f"{name + ' (s)':<30} {sessions:>8} {result['seconds']:>9.2f}")
+                continue
+            previous = baseline.get(str(sessions), {}).get(name, {})
+            print(f"{name:<30} {sessions:>8} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+                  f"{result.get('read_bytes_per_call', 0):>9.0f} {result.get('written_bytes_per_call', 0):>9.0f} "
+                  f"{result['rendered_bytes_per_call']:>9.0f} {result['peak_memory_kb']:>9.0f} "
+                  f"{change(result['p50_ms'], previous.get('p50_ms')):>12} "
+                  f"{change(result['p95_ms'], previous.get('p95_ms')):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the interaction store and rendering hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="log sizes in sessions")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline results file to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run's results as the baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)["results"]
+
+    all_results = {}
+    for sessions in args.sizes:
+        all_results[sessions] = run_size(sessions, args.iterations)
+    report(all_results, baseline)
+
+    if args.save_baseline:
+        baseline.update({str(sessions): results for sessions, results in all_results.items()})
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({"python": sys.version.split()[0], "iterations": args.iterations, "results": baseline},
+                      file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import streaming
+import conversation_view
+from conversation_view import SESSIONS_PER_PAGE, MESSAGES_PER_PAGE
+
+# The app's hot paths, driven against a stub Streamlit and the interaction store. The store
+# reads and markup come from conversation_view, the same functions id.py calls; only the
+# Streamlit widget calls around them are repeated here.
+
+
+# admin_ui: follow the change feed, then read (or reuse) the sidebar page and render it
+def admin_refresh(st, store):
+    conversation_view.follow_changes(store, st.session_state)
+    conversation_view.newly_unread_sessions(st.session_state)
+    page_sessions = conversation_view.sidebar_page(store, st.session_state, "", None, None, 0)
+    for session_info in page_sessions[:SESSIONS_PER_PAGE]:
+        st.sidebar.button(conversation_view.session_button_text(session_info))
+
+
+# check_for_admin_comments
+def check_for_admin_comments(store, session_id):
+    return conversation_view.take_admin_comments(store, session_id)
+
+
+# update_json_with_conversation
+def update_json_with_conversation(store, user_input, response, session_id, user_name):
+    conversation_view.record_exchange(store, user_input, response, session_id, user_name)
+
+
+# display_all_interactions: latest page of the session, memoized fragments, one markdown block
+def display_all_interactions(st, store, session_id):
+    session_interactions = store.get_session_interactions(session_id, limit=MESSAGES_PER_PAGE + 1)
+    if not session_interactions:
+        st.write("אין אינטראקציות זמינות.")
+        return
+    if len(session_interactions) > MESSAGES_PER_PAGE:
+        session_interactions = session_interactions[1:]
+        st.button("טען הודעות קודמות")
+    store.clear_new_user_message(session_id)
+    st.markdown(conversation_view.interactions_html(st.session_state, session_interactions), unsafe_allow_html=True)
+    store.is_admin_involved(session_id)
+    st.chat_input("הוסף תגובה")
+
+
+# stream_openai_response + langchain_bot: stream the answer into a placeholder, store it, poll comments
+def prompt_turn(st, store, client, session_id, user_name, prompt):
+    renderer = streaming.ThrottledRenderer(st.empty())
+    stream = client.chat_stream(model="gpt-4o", messages=[{"role": "user", "content": prompt}])
+    for response in stream:
+        renderer.add(response.choices[0].delta.content or "")
+    stream.close()
+    full_response = renderer.finish()
+    update_json_with_conversation(store, prompt, full_response, session_id, user_name)
+    return check_for_admin_comments(store, session_id)
+
+
+# admin_ui search box: query what the background indexer has indexed
+def search(index, query):
+    return index.search(query, limit=20)
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+from benchmarks.synthetic import ANSWER
+
+# Stand-ins for the Streamlit and OpenAI layers so the app's hot paths can run outside
+# a Streamlit server. The Streamlit stub counts rendered elements and the bytes of
+# markup that would be sent to the browser; widgets are never clicked.
+
+
+class SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+class StubStreamlit:
+    def __init__(self):
+        self.session_state = SessionState()
+        self.sidebar = self
+        self.elements = 0
+        self.bytes_sent = 0
+
+    def _render(self, *parts):
+        self.elements += 1
+        self.bytes_sent += sum(len(str(part).encode('utf-8')) for part in parts)
+
+    def markdown(self, body, unsafe_allow_html=False):
+        self._render(body)
+
+    def write(self, *args, **kwargs):
+        self._render(*args)
+
+    def subheader(self, body):
+        self._render(body)
+
+    def success(self, body):
+        self._render(body)
+
+    def error(self, body):
+        self._render(body)
+
+    def button(self, label, key=None, help=None):
+        self._render(label)
+        return False
+
+    def text_input(self, label, **kwargs):
+        self._render(label)
+        return ""
+
+    def date_input(self, label, value=()):
+        self._render(label)
+        return value
+
+    def chat_input(self, placeholder):
+        self._render(placeholder)
+        return None
+
+    def columns(self, count):
+        return [self] * count
+
+    def empty(self):
+        return self
+
+    @contextmanager
+    def expander(self, label):
+        self._render(label)
+        yield self
+
+    def reset_counters(self):
+        self.elements = 0
+        self.bytes_sent = 0
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class _Stream:
+    def __init__(self, deltas):
+        self._deltas = iter(deltas)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return _chunk(next(self._deltas))
+
+    def close(self):
+        pass
+
+
+# Same interface as llm_client.LLMClientManager; streams a fixed answer word by word
+class StubLLMClient:
+    def __init__(self, answer=ANSWER, topic="default"):
+        self.answer = answer
+        self.topic = topic
+        self.calls = 0
+
+    def chat_completion(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.topic))])
+
+    def chat_stream(self, **kwargs):
+        self.calls += 1
+        words = self.answer.split(" ")
+        return _Stream(word + " " for word in words)
+
+    def metrics(self):
+        return {"calls": self.calls}
@@ -0,0 +1,56 @@
+import json
+import random
+import datetime
+
+# Synthetic interaction logs in the legacy e.json schema: a nested list of interaction
+# dicts with session_id, user, message, timestamp, ai, comments, admin_involved and
+# new_user_message. The same seed always produces the same log.
+
+QUESTIONS = [
+    "מתי מקבלים את טופס 161?",
+    "איך מגישים בקשה להדפסה?",
+    "האם מגיעה לי הודעה מוקדמת?",
+    "מה קורה עם הפנסיה אחרי הפרישה?",
+    "כמה ימי חופשה יש לי השנה?",
+]
+
+ANSWER = "שלום, לפי הנהלים יש להגיש את הבקשה דרך המערכת ולצרף את הטפסים הנדרשים. " * 4
+
+
+# Write a log with the given number of sessions; returns the session ids
+def write_log(path, sessions, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    interactions = []
+    session_ids = []
+    for index in range(sessions):
+        user = f"user{index % 500}"
+        session_id = f"{user}{1700000000 + index}"
+        session_ids.append(session_id)
+        turns = rng.randint(1, 6)
+        admin_involved = rng.random() < 0.05
+        unread = rng.random() < 0.02
+        for turn in range(turns):
+            timestamp = (start + datetime.timedelta(minutes=index * 7 + turn)).isoformat()
+            last_turn = turn == turns - 1
+            comments = []
+            if admin_involved and last_turn:
+                comments.append({
+                    "user": "Admin",
+                    "message": "אני בודקת ואחזור אליך",
+                    "timestamp": timestamp,
+                    "comment_displayed": True,
+                })
+            interactions.append({
+                "session_id": session_id,
+                "user": user,
+                "message": rng.choice(QUESTIONS),
+                "timestamp": timestamp,
+                "ai": {"message": ANSWER, "timestamp": timestamp},
+                "comments": comments,
+                "admin_involved": admin_involved and last_turn,
+                "new_user_message": unread and last_turn,
+            })
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump([interactions], file, ensure_ascii=False)
+    return session_ids
@@ -0,0 +1,86 @@
+import logging
+import threading
+from collections import deque
+
+from retrieval import estimate_tokens
+
+# Conversation memory for one user session: a ring buffer of exchanges with per-turn
+# token counts, trimmed to a token budget rather than a fixed number of chunks.
+# Turns that fall out of the window can be folded into a short running summary.
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    def __init__(self, token_budget=2000):
+        self.token_budget = token_budget
+        self.exchanges = deque()
+        self.summary = ""
+        self._evicted = []
+        self._lock = threading.Lock()
+
+    def is_empty(self):
+        with self._lock:
+            return not self.exchanges and not self.summary
+
+    @property
+    def total_tokens(self):
+        with self._lock:
+            return sum(exchange["tokens"] for exchange in self.exchanges) + estimate_tokens(self.summary)
+
+    # Add one exchange and drop the oldest ones until the window fits the budget again.
+    # The latest exchange is always kept, even if it alone is over budget.
+    def add(self, user_text, assistant_text):
+        with self._lock:
+            self.exchanges.append({
+                "user": user_text,
+                "assistant": assistant_text,
+                "tokens": estimate_tokens(user_text) + estimate_tokens(assistant_text),
+            })
+            used = sum(exchange["tokens"] for exchange in self.exchanges)
+            while len(self.exchanges) > 1 and used > self.token_budget:
+                evicted = self.exchanges.popleft()
+                used -= evicted["tokens"]
+                self._evicted.append(evicted)
+
+    # Fold evicted turns into the running summary. summarizer(summary, turns) returns the new summary;
+    # without one, evicted turns are simply forgotten.
+    def summarize_evicted(self, summarizer=None):
+        with self._lock:
+            turns, self._evicted = self._evicted, []
+            summary = self.summary
+        if not turns or summarizer is None:
+            return
+        try:
+            new_summary = summarizer(summary, turns)
+        except Exception as e:
+            logger.warning("Conversation summary failed: %s", e)
+            return
+        with self._lock:
+            self.summary = new_summary
+
+    # History as chat messages, oldest first, preceded by the running summary if there is one
+    def as_messages(self):
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+            for exchange in self.exchanges:
+                messages.append({"role": "user", "content": exchange["user"]})
+                messages.append({"role": "assistant", "content": exchange["assistant"]})
+            return messages
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "exchanges": list(self.exchanges),
+                "summary": self.summary,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        memory = cls(data.get("token_budget", 2000))
+        memory.exchanges.extend(data.get("exchanges", []))
+        memory.summary = data.get("summary", "")
+        return memory
@@ -0,0 +1,153 @@
+import datetime
+
+# Store reads and chat markup behind the admin panel and the user chat, kept out of the
+# Streamlit script so id.py and the benchmarks (benchmarks/scenarios.py) run the same code.
+# Functions take the interaction store and the Streamlit session state (or any object with
+# attribute access) explicitly.
+
+# Number of sessions listed per page in the admin sidebar
+SESSIONS_PER_PAGE = 50
+
+# Messages of the selected session shown per "load older" page, and how many rendered
+# message fragments the admin view keeps memoized
+MESSAGES_PER_PAGE = 30
+RENDERED_MESSAGES_MAX = 5000
+
+# Store changes that rerun the admin panel (any session) and a user's tab (their own session):
+# the admin is shown new messages, the user new comments and the admin joining or handing back
+ADMIN_WAKE_KINDS = frozenset({'interaction_added', 'comment_added'})
+USER_WAKE_KINDS = frozenset({'comment_added', 'admin_involvement_changed'})
+
+
+def format_timestamp(timestamp_str):
+    try:
+        timestamp = datetime.datetime.fromisoformat(timestamp_str)
+        return timestamp.strftime("%d/%m/%Y %H:%M")
+    except (ValueError, TypeError):
+        return "זמן לא ידוע"  # "Unknown Time" in Hebrew
+
+
+# HTML of one chat bubble, memoized in `rendered` per message id across refreshes (messages don't change once written)
+def message_html(rendered, cache_key, message_class, label, message, formatted_time):
+    html = rendered.get(cache_key)
+    if html is None:
+        if len(rendered) >= RENDERED_MESSAGES_MAX:
+            rendered.clear()
+        # Kept on one line so the joined fragments aren't read as an indented markdown code block
+        html = (
+            f"<div class='message {message_class}' id='message-{cache_key[0]}-{cache_key[1]}'>"
+            f"<strong>{label}:</strong> {message.replace(chr(10), '<br>')}"
+            f"<span class='timestamp'>{formatted_time}</span>"
+            f"</div>"
+        )
+        rendered[cache_key] = html
+    return html
+
+
+# One HTML block with the chat bubbles of the given interactions and their comments
+def interactions_html(state, session_interactions):
+    if 'rendered_messages' not in state:
+        state.rendered_messages = {}
+    rendered = state.rendered_messages
+    fragments = []
+    for interaction in session_interactions:
+        # User message with timestamp
+        user = interaction.get('user', 'Unknown')
+        fragments.append(message_html(
+            rendered, ('user', interaction['id']), 'user', f"משתמש ({user})",
+            interaction.get('message', '') or '', format_timestamp(interaction.get('timestamp', ''))
+        ))
+
+        # AI assistant response only if it's non-empty, with timestamp
+        ai_response = (interaction.get('ai') or {}).get('message', '') or ''
+        if ai_response.strip():
+            fragments.append(message_html(
+                rendered, ('ai', interaction['id']), 'ai', "עוזר AI",
+                ai_response, format_timestamp(interaction['ai'].get('timestamp', ''))
+            ))
+
+        # Existing comments for this interaction
+        for comment in interaction.get('comments', []):
+            user_label = "מנהל" if comment.get("user") == "Admin" else f"משתמש ({comment.get('user', 'Unknown')})"
+            message_class = "admin" if comment.get("user") == "Admin" else "user"
+            fragments.append(message_html(
+                rendered, ('comment', comment['id']), message_class, user_label,
+                comment.get('message', '') or '', format_timestamp(comment.get('timestamp', ''))
+            ))
+    return f"<div class='chat-container'>{''.join(fragments)}</div>"
+
+
+# Follow the change feed: only sessions written since the last refresh are re-read. Keeps the
+# cursor, the unread sessions and the cached sidebar pages in state; returns how many changes were read.
+def follow_changes(store, state):
+    if 'change_cursor' not in state:
+        state.change_cursor = store.latest_change_seq()
+        state.unread_sessions = store.unread_session_ids()
+        state.sidebar_pages = {}
+    change_count = 0
+    cursor, changes = store.changes_since(state.change_cursor)
+    while changes:
+        change_count += len(changes)
+        changed_sessions = {change['session_id'] for change in changes}
+        summaries = store.summarize_sessions(changed_sessions)
+        for session in summaries:
+            if session['has_new_message']:
+                state.unread_sessions.add(session['session_id'])
+            else:
+                state.unread_sessions.discard(session['session_id'])
+        # Sessions without a summary were moved to the archive
+        state.unread_sessions -= changed_sessions - {session['session_id'] for session in summaries}
+        state.sidebar_pages = {}  # Cached sidebar pages are stale now
+        state.change_cursor = cursor
+        cursor, changes = store.changes_since(cursor)
+    return change_count
+
+
+# Sessions that became unread since the previous call (for browser notifications)
+def newly_unread_sessions(state):
+    if 'prev_new_message_sessions' not in state:
+        state.prev_new_message_sessions = set()
+    current = set(state.unread_sessions)
+    new_sessions = current - state.prev_new_message_sessions
+    state.prev_new_message_sessions = current
+    return new_sessions
+
+
+# One page of the sidebar's session list (plus one extra row that tells if there is a next page),
+# unread first and then newest first. Reused from state until the change feed moves.
+def sidebar_page(store, state, user_filter, since, until, page):
+    page_key = (user_filter, since, until, page)
+    if page_key not in state.sidebar_pages:
+        state.sidebar_pages[page_key] = store.list_sessions(
+            limit=SESSIONS_PER_PAGE + 1, offset=page * SESSIONS_PER_PAGE,
+            user=user_filter, since=since, until=until
+        )
+    return state.sidebar_pages[page_key]
+
+
+def session_button_text(session_info):
+    button_text = f"שיחה {session_info['session_id']}"  # "Session {session_id}" in Hebrew
+    if session_info['has_new_message']:
+        button_text = f"🟠 {button_text}"  # Orange circle emoji to indicate a new message
+    return button_text
+
+
+# Store a user message and the AI answer to it
+def record_exchange(store, user_input, response, session_id, user_name, role="ai"):
+    # Admin comments are handled separately, so only AI interactions carry a response
+    return store.append_interaction(
+        session_id,
+        user_name,
+        user_input,
+        ai_message=response if role == "ai" else None,
+        admin_involved=role == "admin",
+        new_user_message=True
+    )
+
+
+# Messages of the session's undisplayed admin comments, acknowledged all at once
+def take_admin_comments(store, session_id):
+    pending_comments = store.pending_admin_comments(session_id)
+    if pending_comments:
+        store.acknowledge_comments([comment["id"] for comment in pending_comments])
+    return [comment["message"] for comment in pending_comments]
@@ -0,0 +1,130 @@
+import time
+import logging
+import threading
+
+# In-process publish/subscribe for interaction store changes. Writes made in this
+# process are published as soon as they commit; a single watcher thread per process
+# follows the store's change feed to pick up writes made by other processes sharing
+# the same database file. Subscribers are keyed (e.g. by Streamlit session id) so
+# subscribing again on every rerun just replaces the previous callback.
+
+logger = logging.getLogger(__name__)
+
+WATCH_INTERVAL = 0.25
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._pruned_at = float('-inf')
+
+    def subscribe(self, topic, key, callback):
+        with self._lock:
+            self._subscribers.setdefault(topic, {})[key] = callback
+
+    def unsubscribe(self, topic, key):
+        with self._lock:
+            self._subscribers.get(topic, {}).pop(key, None)
+
+    # Drop the subscriptions whose key fails is_live (e.g. browser tabs that were closed), at
+    # most once per min_interval seconds; returns how many were dropped
+    def prune(self, is_live, min_interval=0):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._pruned_at < min_interval:
+                return 0
+            self._pruned_at = now
+            removed = 0
+            for topic in list(self._subscribers):
+                callbacks = self._subscribers[topic]
+                for key in [key for key in callbacks if not is_live(key)]:
+                    del callbacks[key]
+                    removed += 1
+                if not callbacks:
+                    del self._subscribers[topic]
+            return removed
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._subscribers.values())
+
+    def publish(self, topic, payload=None):
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, {}).items())
+        for key, callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.exception("Event subscriber %s on %s failed", key, topic)
+
+
+# Topic for every change of one session
+def session_topic(session_id):
+    return f"session:{session_id}"
+
+
+# Topic for changes of any session
+ALL_SESSIONS_TOPIC = "sessions"
+
+
+class StoreEventPublisher:
+    def __init__(self, store, bus, interval=WATCH_INTERVAL):
+        self.store = store
+        self.bus = bus
+        self.interval = interval
+        self._published = set()
+        self._published_lock = threading.Lock()
+        self._cursor = store.latest_change_seq()
+
+        store.add_listener(self._publish_local)
+        self._thread = threading.Thread(target=self._watch, name="store-event-watcher", daemon=True)
+        self._thread.start()
+
+    def _publish(self, change):
+        self.bus.publish(session_topic(change["session_id"]), change)
+        self.bus.publish(ALL_SESSIONS_TOPIC, change)
+
+    # Changes committed by this process are published right away
+    def _publish_local(self, changes):
+        with self._published_lock:
+            self._published.update(change["seq"] for change in changes)
+        for change in changes:
+            self._publish(change)
+
+    # Changes committed by other processes show up in the change feed
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.store.latest_change_seq() == self._cursor:
+                    continue
+                cursor, changes = self.store.changes_since(self._cursor)
+                while changes:
+                    for change in changes:
+                        with self._published_lock:
+                            already_published = change["seq"] in self._published
+                        if not already_published:
+                            self._publish(change)
+                    self._cursor = cursor
+                    # Seqs up to the cursor won't be read again; this also drops the ones never
+                    # seen in the feed (e.g. changes of a session archived in the meantime)
+                    with self._published_lock:
+                        self._published = {seq for seq in self._published if seq > cursor}
+                    cursor, changes = self.store.changes_since(cursor)
+            except Exception as e:
+                logger.exception("Store event watcher error")
+
+
+bus = EventBus()
+
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+# Start publishing changes of the store on the process-wide bus (once per store)
+def publish_store_events(store):
+    with _publishers_lock:
+        if id(store) not in _publishers:
+            _publishers[id(store)] = StoreEventPublisher(store, bus)
+        return _publishers[id(store)]
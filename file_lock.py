@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; there, keep to one writing process per file
+    fcntl = None
+
+# Advisory locks for files appended to by several app processes (transcript, archive segments).
+
+
+# Hold an exclusive lock on an open file for the duration of the with block
+@contextmanager
+def locked(file):
+    if fcntl is None:
+        yield file
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    try:
+        yield file
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
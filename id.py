@@ -1,36 +1,208 @@
+import profiler
+run_profile = profiler.RunProfile("rerun")
+
 import os
 import json
-import yaml
+import logging
 import datetime
 import time
-import bcrypt
-import base64
+import random
+import threading
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
-import streamlit_authenticator as stauth
 import streamlit.components.v1 as components
-from openai import OpenAI  # Make sure to install the OpenAI package
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from llm_client import LLMClientManager, get_llm_client
+from interaction_store import get_store
+import event_bus
+from transcript import get_transcript_writer
+from conversation_memory import ConversationMemory
+import session_state_store
+import topic_cache
+import pipeline
+import response_cache
+import assets
+import archive
+import search_index
+from router import log_routing_decision
+import auth
+import tracing
+import streaming
+import conversation_view
+from conversation_view import SESSIONS_PER_PAGE, MESSAGES_PER_PAGE, format_timestamp
+from retrieval import estimate_tokens
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Log output of the app and its modules; LOG_LEVEL=DEBUG also shows each routing choice
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
 # Define the path to your credentials YAML file
-CREDENTIALS_FILE = os.path.join(script_dir, 'credentialss.yaml')
-
-# Load the configuration from the YAML file
-with open(CREDENTIALS_FILE, encoding='utf-8') as file:
-    config = yaml.safe_load(file)
-    
-# Initialize the authenticator
-authenticator = stauth.Authenticate(
-    config['credentialss'],
-    config['cookie']['name'],
-    config['cookie']['key'],
-    config['cookie']['expiry_days'],
-    config['preauthorized']
-)
-
-# Attempt to authenticate the user
-name, authentication_status, username = authenticator.login('main')
+CREDENTIALS_FILE = os.getenv("CREDENTIALS_PATH", os.path.join(script_dir, 'credentialss.yaml'))
+
+# Branding images: sources in images/, optimized copies served from static/ (see assets.py)
+IMAGES_DIR = os.path.join(script_dir, 'images')
+STATIC_DIR = os.path.join(script_dir, 'static')
+LOGO_PATH = os.path.join(IMAGES_DIR, 'logo.png')
+TAMAL_PATH = os.path.join(IMAGES_DIR, 'tamal.png')
+
+# Legacy interaction log and the SQLite store that replaces it
+E_JSON_FILE = os.getenv("E_JSON_PATH", os.path.join(script_dir, 'doc', 'e.json'))
+INTERACTIONS_DB_FILE = os.getenv("INTERACTIONS_DB_PATH", os.path.join(script_dir, 'doc', 'interactions.db'))
+
+# Results listed by the admin conversation search (see search_index.py)
+SEARCH_RESULTS_MAX = 20
+
+# Topic mapping and the stop words used for knowledge-base retrieval, and the knowledge pack
+# precompiled from them (built with knowledge_pack.py; without it topics are read from doc/)
+JSON_FILES_MAPPING_FILE = os.path.join(script_dir, 'doc', 'json_files_mapping.json')
+STOP_WORDS_FILE = os.path.join(script_dir, 'doc', 'heb_stopwords.txt')
+KNOWLEDGE_PACK_FILE = os.getenv("KNOWLEDGE_PACK_PATH", os.path.join(script_dir, 'doc', 'knowledge.pack'))
+
+# How many retrieved chunks of the topic file, and at most how many tokens of it, go into each prompt
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 8))
+GUIDANCE_TOKEN_BUDGET = int(os.getenv("GUIDANCE_TOKEN_BUDGET", 3000))
+
+# Local topic routing: below this confidence the LLM router decides. A fraction of confident
+# local decisions is also sent to the LLM in the background and both choices are logged.
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", 0.35))
+ROUTER_AUDIT_RATE = float(os.getenv("ROUTER_AUDIT_RATE", 0.0))
+ROUTING_LOG_FILE = os.getenv("ROUTING_LOG_PATH", os.path.join(script_dir, 'doc', 'routing_log.jsonl'))
+
+# When routing takes longer than SPECULATION_DELAY seconds (i.e. it went to the LLM), start
+# streaming the answer for the current topic right away and drop it if the router disagrees
+SPECULATIVE_STREAMING = os.getenv("SPECULATIVE_STREAMING", "1") == "1"
+SPECULATION_DELAY = float(os.getenv("SPECULATION_DELAY", 0.05))
+
+# Plain-text transcript of every exchange, written in the background (see transcript.py).
+# Runtime data kept out of git, like the databases; the tracked doc/inputs_and_outputs is left alone.
+TRANSCRIPT_FILE = os.getenv("TRANSCRIPT_PATH", os.path.join(script_dir, 'doc', 'transcripts', 'inputs_and_outputs'))
+
+# Conversation memory sent with each question is limited to this many tokens. With
+# CONVERSATION_SUMMARY=1 older turns are summarized in the background instead of dropped.
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", 2000))
+CONVERSATION_SUMMARY = os.getenv("CONVERSATION_SUMMARY", "0") == "1"
+
+# Subscriptions of closed browser tabs are dropped at most this often (seconds)
+WAKE_PRUNE_INTERVAL = 60
+
+# Widget key of the user's chat input while the AI answers
+CHAT_INPUT_KEY = "chat_prompt"
+
+# Per-user conversation state shared by all app processes, so any replica can serve any rerun
+# (sqlite:///..., memory:// or redis://..., see session_state_store.py)
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", f"sqlite:///{os.path.join(script_dir, 'doc', 'sessions.db')}")
+SHARED_SESSION_FIELDS = ('session_id', 'conversation_memory', 'chat_history', 'current_topic', 'admin_comments',
+                         'last_interaction', 'last_prompt')
+
+# Load the configuration from the YAML file (parsed once per process, re-read when it changes)
+with run_profile.phase("load credentials"):
+    config = auth.load_config(CREDENTIALS_FILE)
+
+# Attempt to authenticate the user; once verified, the session's signed token is enough
+with run_profile.phase("authenticate"):
+    name, authentication_status, username = auth.login(CREDENTIALS_FILE, 'main')
+
+# Open the shared interaction store, importing e.json the first time
+with run_profile.phase("open store"):
+    interaction_store = get_store(INTERACTIONS_DB_FILE)
+    interaction_store.migrate_from_json(E_JSON_FILE)
+
+    # Clearing cached answers in one process clears them in every process using the database
+    response_cache.cache.share_invalidation(interaction_store)
+
+    # Publish store changes (including those made by other processes) on the in-process event bus
+    event_bus.publish_store_events(interaction_store)
+
+    # Move idle sessions to the archive in the background if ARCHIVE_INTERVAL_HOURS is set (see archive.py)
+    archive.start_scheduler(interaction_store)
+
+    # Index new messages for the admin search in the background (see search_index.py)
+    search_index.index_in_background(interaction_store)
+
+# Span histograms and cache/client counters as Prometheus text on METRICS_PORT (see tracing.py)
+tracing.metrics.add_collector("openai", lambda: get_llm_client().metrics())
+tracing.metrics.add_collector("topic_cache", topic_cache.cache.stats)
+tracing.metrics.add_collector("response_cache", response_cache.cache.stats)
+tracing.metrics.add_collector("streaming", streaming.stats)
+tracing.metrics.add_collector("transcript", lambda: get_transcript_writer(TRANSCRIPT_FILE).stats())
+tracing.start_metrics_server()
+
+# Rerun this browser session when a change of one of the given kinds is published on the topic.
+# Returns False when the tab can't be woken this way (outside a Streamlit server, or under a
+# runtime without a session manager such as AppTest); the caller then falls back to polling.
+def wake_on_event(topic, kinds):
+    ctx = get_script_run_ctx()
+    if ctx is None or not Runtime.exists():
+        return False
+    # The session manager isn't public API, so only use it if it looks as expected
+    session_mgr = getattr(Runtime.instance(), '_session_mgr', None)
+    if session_mgr is None or not callable(getattr(session_mgr, 'get_active_session_info', None)):
+        return False
+    streamlit_session_id = ctx.session_id
+
+    def is_live(key):
+        return session_mgr.get_active_session_info(key) is not None
+
+    def wake(change):
+        if change['kind'] not in kinds:
+            return
+        session_info = session_mgr.get_active_session_info(streamlit_session_id)
+        if session_info is None:
+            # The browser tab is gone
+            event_bus.bus.unsubscribe(topic, streamlit_session_id)
+            return
+        session_info.session.request_rerun(None)  # None reruns with the tab's current widget state
+
+    # A tab follows one topic; moving to another conversation drops the old subscription
+    previous_topic = st.session_state.get('wake_topic')
+    if previous_topic is not None and previous_topic != topic:
+        event_bus.bus.unsubscribe(previous_topic, streamlit_session_id)
+    st.session_state.wake_topic = topic
+    event_bus.bus.subscribe(topic, streamlit_session_id, wake)
+    # Tabs closed without another event on their topic are dropped here
+    event_bus.bus.prune(is_live, min_interval=WAKE_PRUNE_INTERVAL)
+    return True
+
+# st.rerun, or st.experimental_rerun on Streamlit versions from before it was added
+def rerun():
+    (getattr(st, "rerun", None) or st.experimental_rerun)()
+
+def get_query_param(name):
+    if hasattr(st, 'query_params'):
+        return st.query_params.get(name)
+    values = st.experimental_get_query_params().get(name)
+    return values[0] if values else None
+
+def set_query_param(name, value):
+    if get_query_param(name) == value:
+        return
+    if hasattr(st, 'query_params'):
+        st.query_params[name] = value
+    else:
+        st.experimental_set_query_params(**{name: value})
+
+# Whether a conversation id taken from the URL belongs to the user: its stored state names their
+# username as owner. Display names aren't unique, so a conversation whose state expired isn't resumed.
+def owns_conversation(shared_state, session_id, username):
+    return shared_state.stored_owner(session_id) == username
+
+# Restore the user's conversation from the shared store. The conversation id is kept in the
+# page URL, so a rerun or reconnect served by another replica continues the same conversation.
+# An id from the URL that isn't the user's own starts a new conversation.
+def restore_conversation(shared_state, username):
+    session_id = st.session_state.get('session_id')
+    if not session_id:
+        session_id = get_query_param(session_state_store.SESSION_QUERY_PARAM)
+        if session_id and not owns_conversation(shared_state, session_id, username):
+            session_id = None
+    if not session_id or not shared_state.restore(st.session_state, session_id, username):
+        session_id = f"{username}{int(time.time())}"
+    st.session_state.session_id = session_id
+    set_query_param(session_state_store.SESSION_QUERY_PARAM, session_id)
+    return session_id
 
 def load_custom_css():
     custom_css = """
@@ -102,122 +274,38 @@ def admin_interface():
     load_custom_css()
     st.sidebar.title("פאנל אדמין")  # "Admin Panel" in Hebrew
 
-    # Function to format the timestamp
-    def format_timestamp(timestamp_str):
-        try:
-            timestamp = datetime.datetime.fromisoformat(timestamp_str)
-            return timestamp.strftime("%d/%m/%Y %H:%M")
-        except (ValueError, TypeError):
-            return "זמן לא ידוע"  # "Unknown Time" in Hebrew
-
-    # Load JSON file
-    def load_json_data(file_path):
-        if not os.path.exists(file_path) or os.stat(file_path).st_size == 0:
-            data = []
-        else:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                try:
-                    data = json.load(file)
-                except json.JSONDecodeError:
-                    data = []
-
-        # Initialize new_user_message flag for each interaction if not already set
-        for interaction_list in data:
-            for interaction in interaction_list:
-                if isinstance(interaction, dict):
-                    if 'new_user_message' not in interaction:
-                        interaction['new_user_message'] = False
-
-        return data
-
-    # Save JSON file
-    def save_json_data(file_path, data):
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-
-    # Function to display all interactions in a continuous chat flow
-    def display_all_interactions(session_id, data, file_path):
-        # Filter interactions by session ID
-        session_interactions = []
-        for interaction_list in data:
-            session_interactions.extend(
-                [interaction for interaction in interaction_list if interaction.get('session_id') == session_id]
-            )
+    # Function to display the latest interactions of a session in a continuous chat flow
+    def display_all_interactions(session_id):
+        if st.session_state.get('messages_session') != session_id:
+            st.session_state.messages_session = session_id
+            st.session_state.messages_limit = MESSAGES_PER_PAGE
+
+        # Fetch only the latest page(s) of the session, oldest first; one extra row tells if there is more
+        limit = st.session_state.messages_limit
+        session_interactions = interaction_store.get_session_interactions(session_id, limit=limit + 1)
 
         if not session_interactions:
             st.write("אין אינטראקציות זמינות.")  # "No interactions available for this session."
             return
 
-        # Sort messages by timestamp in ascending order (oldest first)
-        session_interactions.sort(key=lambda x: x.get('timestamp', ''))
-
-        # Reset the new user message flag
-        for interaction in session_interactions:
-            if interaction.get('new_user_message', False):
-                interaction['new_user_message'] = False
-
-        # Save the changes
-        save_json_data(file_path, data)
-
-        # Display all messages in a continuous chat-like format
-        st.write("<div class='chat-container'>", unsafe_allow_html=True)
-
-        admin_involved = False  # Track if the admin is involved
-        for interaction in session_interactions:
-            # Check if admin is involved in the current session
-            if interaction.get('admin_involved', False):
-                admin_involved = True
-
-            # Format the timestamp for user message
-            timestamp_str = interaction.get('timestamp', '')
-            formatted_time = format_timestamp(timestamp_str)
-
-            # Display user message with timestamp
-            user = interaction.get('user', 'Unknown')
-            user_message = interaction.get('message', '') or ''
-            st.markdown(
-                f"""
-                <div class='message user'>
-                    <strong>משתמש ({user}):</strong> {user_message.replace('\\n', '<br>')}
-                    <span class='timestamp'>{formatted_time}</span>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+        has_older = len(session_interactions) > limit
+        if has_older:
+            session_interactions = session_interactions[1:]
+            if st.button("טען הודעות קודמות"):  # "Load older messages"
+                st.session_state.messages_limit += MESSAGES_PER_PAGE
+                rerun()
 
-            # Display AI assistant response only if it's non-empty, with timestamp
-            ai_response = interaction.get('ai', {}).get('message', '') or ''
-            ai_timestamp_str = interaction.get('ai', {}).get('timestamp', '')
-            ai_formatted_time = format_timestamp(ai_timestamp_str)
-
-            if ai_response.strip():
-                st.markdown(
-                    f"""
-                    <div class='message ai'>
-                        <strong>עוזר AI:</strong> {ai_response.replace('\\n', '<br>')}
-                        <span class='timestamp'>{ai_formatted_time}</span>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+        # Reset the new user message flag (only written if it is actually set)
+        interaction_store.clear_new_user_message(session_id)
+
+        # Display the messages in a continuous chat-like format, as a single block
+        chat_html = conversation_view.interactions_html(st.session_state, session_interactions)
+        st.markdown(chat_html, unsafe_allow_html=True)
+        scroll_to_highlighted_message()
+        tracing.current_span().set(messages=len(session_interactions), html_bytes=len(chat_html.encode('utf-8')))
 
-            # Display existing comments for this interaction
-            if interaction.get('comments'):
-                for comment in sorted(interaction['comments'], key=lambda c: c.get('timestamp', '')):
-                    comment_time = format_timestamp(comment.get('timestamp', ''))
-                    user_label = "מנהל" if comment.get("user") == "Admin" else f"משתמש ({comment.get('user', 'Unknown')})"
-                    message_class = "admin" if comment.get("user") == "Admin" else "user"
-                    st.markdown(
-                        f"""
-                        <div class='message {message_class}'>
-                            <strong>{user_label}:</strong> {comment.get('message', '').replace('\\n', '<br>')}
-                            <span class='timestamp'>{comment_time}</span>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-
-        st.write("</div>", unsafe_allow_html=True)
+        # Check if admin is involved in the session (kept in the session summary)
+        admin_involved = interaction_store.is_admin_involved(session_id)
 
         # Add a chat input for admin comments at the bottom of the chat
         new_comment = st.chat_input("הוסף תגובה")  # "Add a comment" in Hebrew
@@ -226,28 +314,10 @@ def admin_interface():
             if new_comment.strip():
                 timestamp = datetime.datetime.now().isoformat()
 
-                # Add the new comment to the latest interaction in the session
-                if session_interactions:
-                    latest_interaction = session_interactions[-1]
-
-                    if "comments" not in latest_interaction or not isinstance(latest_interaction["comments"], list):
-                        latest_interaction["comments"] = []
-
-                    latest_interaction['comments'].append({
-                        "user": "Admin",
-                        "message": new_comment,
-                        "timestamp": timestamp,
-                        "comment_displayed": False
-                    })
-
-                    # Mark that admin is involved
-                    latest_interaction['admin_involved'] = True
-
-                    # Save updated data back to JSON
-                    save_json_data(file_path, data)
-
+                # Add the new comment to the latest interaction in the session and mark that admin is involved
+                if interaction_store.add_admin_comment(session_id, new_comment, timestamp):
                     st.success("התגובה נוספה בהצלחה!")  # "Comment added successfully!"
-                    st.experimental_rerun()
+                    rerun()
                 else:
                     st.error("אין אינטראקציות זמינות להוספת תגובה.")  # "No interactions available to add the comment."
 
@@ -255,14 +325,10 @@ def admin_interface():
         if admin_involved:
             if st.button("חזור ל-AI"):  # "Return to AI" in Hebrew
                 # Mark admin involvement as False for all interactions in the session
-                for interaction in session_interactions:
-                    interaction['admin_involved'] = False
-
-                # Save changes back to JSON
-                save_json_data(file_path, data)
+                interaction_store.set_admin_involved(session_id, False)
 
                 st.success("השליטה הוחזרה ל-AI.")  # "Control returned to AI."
-                st.experimental_rerun()
+                rerun()
 
     # Function to request browser notification permission
     def request_notification_permission():
@@ -300,122 +366,215 @@ def admin_interface():
         """
         components.html(js_code)
 
+    # Scroll to the message a search result pointed at, once, and outline it
+    def scroll_to_highlighted_message():
+        anchor = st.session_state.pop('highlighted_message', None)
+        if not anchor:
+            return
+        js_code = f"""
+        <script>
+        setTimeout(function() {{
+            var target = window.parent.document.getElementById("{anchor}");
+            if (target) {{
+                target.scrollIntoView({{block: "center"}});
+                target.style.outline = "3px solid #f5a623";
+            }}
+        }}, 300);
+        </script>
+        """
+        components.html(js_code, height=0)
+
+    # Open a search result: select its conversation (live or archived) with enough messages loaded to reach it
+    def open_search_result(result):
+        session_id = result['session_id']
+        if result['archived']:
+            st.session_state.sessions_view = "ארכיון"
+            st.session_state.selected_archived_session_id = session_id
+        else:
+            st.session_state.sessions_view = "שיחות פעילות"
+            st.session_state.selected_session_id = session_id
+            st.session_state.messages_session = session_id
+            st.session_state.messages_limit = max(
+                MESSAGES_PER_PAGE, interaction_store.interaction_position(session_id, result['interaction_id'])
+            )
+        if result['kind'] == 'comment':
+            st.session_state.highlighted_message = f"message-comment-{result['comment_id']}"
+        else:
+            st.session_state.highlighted_message = f"message-{result['kind']}-{result['interaction_id']}"
+
+    # Full-text search over user messages, AI answers and comments of all conversations
+    def search_ui():
+        with st.sidebar.expander("חיפוש בשיחות"):  # "Search conversations" in Hebrew
+            query = st.text_input("מילות חיפוש", key="search_query")  # "Search words" in Hebrew
+            search_user = st.text_input("משתמש", key="search_user")  # "User" in Hebrew
+            search_dates = st.date_input("טווח תאריכים", value=(), key="search_dates")  # "Date range" in Hebrew
+            involvement = st.selectbox(
+                "מעורבות מנהל", ["הכל", "עם מנהל", "ללא מנהל"], key="search_involvement"
+            )  # "Admin involvement": "All" / "With admin" / "Without admin"
+            if not query.strip():
+                return
+
+            with tracing.span("search") as span:
+                # Messages written in the last few seconds may not be indexed yet
+                results = search_index.get_index(INTERACTIONS_DB_FILE).search(
+                    query, user=search_user,
+                    since=search_dates[0].isoformat() if len(search_dates) > 0 else None,
+                    until=(search_dates[-1] + datetime.timedelta(days=1)).isoformat() if len(search_dates) > 0 else None,
+                    admin_involved={"עם מנהל": True, "ללא מנהל": False}.get(involvement),
+                    limit=SEARCH_RESULTS_MAX
+                )
+                span.set(results=len(results))
+
+            if not results:
+                st.write("לא נמצאו תוצאות.")  # "No results found." in Hebrew
+                return
+            for position, result in enumerate(results):
+                archived = " · ארכיון" if result['archived'] else ""  # "Archive" in Hebrew
+                button_text = f"{result['user']} · {format_timestamp(result['timestamp'])}{archived}\n\n{result['snippet']}"
+                if st.button(button_text, key=f"search_result_{position}"):
+                    open_search_result(result)
+
+    # Archived sessions in the sidebar, and the selected one read from its archive segment on demand (read only)
+    def archived_ui(user_filter, since, until):
+        if 'archive_page' not in st.session_state:
+            st.session_state.archive_page = 0
+        page = st.session_state.archive_page
+
+        archived_sessions = interaction_store.list_archived_sessions(
+            limit=SESSIONS_PER_PAGE + 1, offset=page * SESSIONS_PER_PAGE,
+            user=user_filter, since=since, until=until
+        )
+        has_next_page = len(archived_sessions) > SESSIONS_PER_PAGE
+        if archived_sessions:
+            for index, session_info in enumerate(archived_sessions[:SESSIONS_PER_PAGE]):
+                button_text = f"שיחה {session_info['session_id']} ({(session_info['last_timestamp'] or '')[:10]})"
+                if st.sidebar.button(button_text, key=f"archived_{page * SESSIONS_PER_PAGE + index}"):
+                    st.session_state.selected_archived_session_id = session_info['session_id']
+        else:
+            st.sidebar.write("אין שיחות בארכיון.")  # "No archived conversations." in Hebrew
+
+        previous_column, next_column = st.sidebar.columns(2)
+        if page > 0 and previous_column.button("הקודם", key="archive_previous_page"):  # "Previous" in Hebrew
+            st.session_state.archive_page = page - 1
+            rerun()
+        if has_next_page and next_column.button("הבא", key="archive_next_page"):  # "Next" in Hebrew
+            st.session_state.archive_page = page + 1
+            rerun()
+
+        session_id = st.session_state.get('selected_archived_session_id')
+        if not session_id:
+            st.write("בחר שיחה מהארכיון.")  # "Choose a conversation from the archive." in Hebrew
+            return
+        with tracing.span("display_archived_session"):
+            session_interactions = archive.read_archived_session(interaction_store, session_id)
+            st.caption(f"שיחה {session_id} מהארכיון, לקריאה בלבד")  # "Archived conversation, read only" in Hebrew
+            st.markdown(conversation_view.interactions_html(st.session_state, session_interactions), unsafe_allow_html=True)
+            scroll_to_highlighted_message()
+
     # Main function for the admin UI
     def admin_ui():
         # Request notification permission
         request_notification_permission()
 
-        # Set up auto-refresh every 3 seconds
-        st_autorefresh(interval=3000, key="refresh")
-
-        # Load data
-        file_path = E_JSON_FILE  # Adjust to your actual file path
-        data = load_json_data(file_path)
-
-        # Extract unique session IDs and sort them with newest first, prioritize sessions with new messages
-        unique_sessions = {}
-        for interaction_list in data:
-            for interaction in interaction_list:
-                if isinstance(interaction, dict):
-                    session_id = interaction.get('session_id')
-                    if not session_id:
-                        continue  # Skip if no session_id
-
-                    if session_id not in unique_sessions:
-                        unique_sessions[session_id] = {'has_new_message': False, 'last_timestamp': None}
+        # Rerun when a user writes a message or a comment is posted; poll every 3 seconds only if push isn't available
+        if not wake_on_event(event_bus.ALL_SESSIONS_TOPIC, conversation_view.ADMIN_WAKE_KINDS):
+            st_autorefresh(interval=3000, key="refresh")
 
-                    # Check for new messages
-                    if interaction.get('new_user_message', False):
-                        unique_sessions[session_id]['has_new_message'] = True
+        # Follow the change feed: only sessions written since the last refresh are re-read
+        with tracing.span("change_feed") as span:
+            span.set(changes=conversation_view.follow_changes(interaction_store, st.session_state))
 
-                    # Update with the latest timestamp
-                    timestamp_str = interaction.get('timestamp', '')
-                    if timestamp_str:
-                        try:
-                            timestamp = datetime.datetime.fromisoformat(timestamp_str)
-                            current_last_timestamp = unique_sessions[session_id]['last_timestamp']
-                            if current_last_timestamp is None or timestamp > current_last_timestamp:
-                                unique_sessions[session_id]['last_timestamp'] = timestamp
-                        except ValueError:
-                            pass  # Handle invalid timestamp format
-
-        # --- Notification Logic ---
-        # Maintain previous set of session IDs with new messages
-        if 'prev_new_message_sessions' not in st.session_state:
-            st.session_state.prev_new_message_sessions = set()
-
-        # Get the current set of session IDs with new messages
-        current_new_message_sessions = set()
-        for session_id, session_info in unique_sessions.items():
-            if session_info['has_new_message']:
-                current_new_message_sessions.add(session_id)
-
-        # Compare with the previous set
-        new_sessions_with_new_messages = current_new_message_sessions - st.session_state.prev_new_message_sessions
-
-        # Update the previous set
-        st.session_state.prev_new_message_sessions = current_new_message_sessions
-
-        # If there are new messages, send browser notification
-        if new_sessions_with_new_messages:
+        # Send a browser notification when a session gets a new user message
+        if conversation_view.newly_unread_sessions(st.session_state):
             notification_message = "יש לך הודעה חדשה ממשתמש!"
             send_browser_notification(notification_message)
-        # --- End of Notification Logic ---
-
-        # Function to safely get timestamp number
-        def get_timestamp_num(dt):
-            if dt is None:
-                return float('-inf')
-            else:
-                return dt.timestamp()
 
-        # Sort sessions with new messages at the top and by last interaction timestamp (newest first)
-        sorted_sessions = sorted(
-            unique_sessions.items(),
-            key=lambda x: (-int(x[1]['has_new_message']), -get_timestamp_num(x[1]['last_timestamp']))
-        )
+        # Search comes before the conversation list so an opened result selects its conversation in this run
+        search_ui()
 
         # Sidebar for session navigation using buttons
         st.sidebar.subheader("שיחות משתמשים")  # "User Conversations" in Hebrew
 
+        # Filters by user and by date of the last interaction
+        user_filter = st.sidebar.text_input("סינון לפי משתמש")  # "Filter by user" in Hebrew
+        date_range = st.sidebar.date_input("טווח תאריכים", value=())  # "Date range" in Hebrew
+        since = date_range[0].isoformat() if len(date_range) > 0 else None
+        until = (date_range[-1] + datetime.timedelta(days=1)).isoformat() if len(date_range) > 0 else None
+
+        # Live conversations, or the ones moved to the archive (see archive.py)
+        if st.sidebar.radio("תצוגה", ["שיחות פעילות", "ארכיון"], horizontal=True, key="sessions_view") == "ארכיון":  # "View": "Active conversations" / "Archive"
+            archived_ui(user_filter, since, until)
+            return
+
+        if 'session_page' not in st.session_state:
+            st.session_state.session_page = 0
+        page = st.session_state.session_page
+
+        # Sessions with new messages come first, then by last interaction timestamp (newest first).
+        # The page is read from the session summary index and reused until the change feed moves.
+        with tracing.span("sidebar_page", cached=(user_filter, since, until, page) in st.session_state.sidebar_pages):
+            page_sessions = conversation_view.sidebar_page(interaction_store, st.session_state, user_filter, since, until, page)
+        has_next_page = len(page_sessions) > SESSIONS_PER_PAGE
+        page_sessions = page_sessions[:SESSIONS_PER_PAGE]
+
         # Maintain session state for the selected session
         if 'selected_session_id' not in st.session_state:
-            if sorted_sessions:
-                st.session_state.selected_session_id = sorted_sessions[0][0]  # Default to the newest session
+            if page_sessions:
+                st.session_state.selected_session_id = page_sessions[0]['session_id']  # Default to the newest session
             else:
                 st.session_state.selected_session_id = None  # No sessions available
 
         # Create buttons for sessions
-        if sorted_sessions:
-            for index, (session_id, session_info) in enumerate(sorted_sessions):
-                # Add emoji to the button text if there's a new user message
-                button_text = f"שיחה {session_id}"  # "Session {session_id}" in Hebrew
-                if session_info['has_new_message']:
-                    button_text = f"🟠 {button_text}"  # Orange circle emoji to indicate a new message
+        if page_sessions:
+            for index, session_info in enumerate(page_sessions):
+                session_id = session_info['session_id']
+                button_text = conversation_view.session_button_text(session_info)
 
                 # Ensure unique key for each button using index
-                if st.sidebar.button(button_text, key=f"session_{index}", help="לחץ לצפייה בשיחה"):  # "Click to view session" in Hebrew
+                if st.sidebar.button(button_text, key=f"session_{page * SESSIONS_PER_PAGE + index}", help="לחץ לצפייה בשיחה"):  # "Click to view session" in Hebrew
                     st.session_state.selected_session_id = session_id
 
                     # Reset the new user message flag
-                    for interaction_list in data:
-                        for interaction in interaction_list:
-                            if isinstance(interaction, dict) and interaction.get('session_id') == session_id:
-                                interaction['new_user_message'] = False
-                    save_json_data(file_path, data)  # Save changes
+                    interaction_store.clear_new_user_message(session_id)
         else:
             st.sidebar.write("אין שיחות זמינות.")  # "No sessions available." in Hebrew
 
+        # Paging through the session list
+        previous_column, next_column = st.sidebar.columns(2)
+        if page > 0 and previous_column.button("הקודם", key="sessions_previous_page"):  # "Previous" in Hebrew
+            st.session_state.session_page = page - 1
+            rerun()
+        if has_next_page and next_column.button("הבא", key="sessions_next_page"):  # "Next" in Hebrew
+            st.session_state.session_page = page + 1
+            rerun()
+
+        # Hit/miss counters of the shared topic cache
+        with st.sidebar.expander("מטמון נושאים"):  # "Topic cache" in Hebrew
+            st.write(topic_cache.cache.stats())
+
+        # Cached answers to repeated questions, with a way to drop them after content changes
+        with st.sidebar.expander("מטמון תשובות"):  # "Response cache" in Hebrew
+            st.write(response_cache.cache.stats())
+            if st.button("נקה מטמון תשובות", key="clear_response_cache"):  # "Clear response cache" in Hebrew
+                removed = response_cache.cache.invalidate()
+                st.success(f"{removed} תשובות נמחקו מהמטמון.")  # "{removed} answers removed from the cache."
+
+        # Queue depth, retries and latency of the shared OpenAI client
+        with st.sidebar.expander("מדדי OpenAI"):  # "OpenAI metrics" in Hebrew
+            st.write(get_llm_client().metrics())
+
         # Display interactions only if a session is selected
         selected_session_id = st.session_state.selected_session_id
         if selected_session_id:
             # Display interactions for the selected session
-            display_all_interactions(selected_session_id, data, file_path)
+            with tracing.span("display_session"):
+                display_all_interactions(selected_session_id)
         else:
             st.write("אין שיחות להצגה.")  # "No sessions to display." in Hebrew
 
     # Run the admin UI
-    admin_ui()
+    with tracing.span("admin_refresh"):
+        admin_ui()
 
 def user_interface():
     load_custom_css()
@@ -425,25 +584,22 @@ def user_interface():
     # Initialize variables and functions as per your user code
     # Make sure to adjust the paths and variables
 
-    # Path to the JSON file where interactions are stored
-    file_path = E_JSON_FILE
-
     # Path to the JSON file that contains json_files mapping
     json_files_mapping_path = JSON_FILES_MAPPING_FILE
 
-    # Load json_files mapping from the external JSON file
-    def load_json_files_mapping(mapping_path):
+    # Topics from the knowledge pack, or from the mapping and topic files if no pack is built
+    def load_topics(mapping_path):
         try:
-            with open(mapping_path, 'r', encoding='utf-8') as jf:
-                return json.load(jf)
+            return topic_cache.topics(KNOWLEDGE_PACK_FILE, mapping_path, STOP_WORDS_FILE)
         except FileNotFoundError:
             st.error(f"Mapping file not found at {mapping_path}. Please ensure the file exists.")
-            return {}
+            st.stop()
         except json.JSONDecodeError:
             st.error(f"Mapping file at {mapping_path} is not a valid JSON.")
-            return {}
+            st.stop()
 
-    json_files = load_json_files_mapping(json_files_mapping_path)
+    topics = load_topics(json_files_mapping_path)
+    json_files = topics.mapping
 
     def reset_topic_after_timeout():
         current_time = datetime.datetime.now()
@@ -452,85 +608,55 @@ def user_interface():
         # Check if more than 5 minutes have passed since last interaction
         if (current_time - last_interaction).total_seconds() > 300:
             st.session_state.current_topic = 'default'
-            print("Topic reset to default due to inactivity.")
+            logger.debug("Topic reset to default due to inactivity.")
 
         # Update the last interaction time
         st.session_state.last_interaction = current_time
 
-    def load_stop_words(file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return [line.strip() for line in file.readlines()]
-
-    stop_words_path = STOP_WORDS_FILE
-    stop_words = load_stop_words(stop_words_path)
+    # Local topic router, shared by the process and rebuilt when the mapping, a topic file or the pack changes
+    topic_router = topics.topic_router()
 
-    def load_data(selected_option=None):
+    def topic_key(selected_option=None):
         if selected_option is None:
             # Default behavior: Choose the first non-default option
             for key in json_files:
                 if key != "default":
-                    selected_option = key
-                    break
-        json_file_path = json_files[selected_option]['path']
-
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            json_data = json.load(file)
-
-        json_documents = extract_text_from_json(json_data)
-
-        return json_documents, json_data
-
-    def extract_text_from_json(json_data):
-        text_list = []
-        def extract_text(obj):
-            if isinstance(obj, dict):
-                for key, value in obj.items():
-                    extract_text(value)
-            elif isinstance(obj, list):
-                for item in obj:
-                    extract_text(item)
-            elif isinstance(obj, str):
-                text_list.append(obj)
-
-        extract_text(json_data)
-        return text_list
-
-    documents, json_data = load_data()
-
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    guidance_data = json_data
-
-    def json_to_string(data, depth=0):
-        output = []
-        if isinstance(data, dict):
-            for key, value in data.items():
-                output.append(" " * depth + str(key) + ":")
-                output.append(json_to_string(value, depth + 2))
-        elif isinstance(data, list):
-            for item in data:
-                output.append(json_to_string(item, depth + 2))
-        else:
-            return " " * depth + str(data)
-        return "\n".join(output)
+                    return key
+        return selected_option
 
-    guidance_string = json_to_string(guidance_data)
+    # Shared, pooled OpenAI client (see llm_client.py)
+    client = get_llm_client()
+
+    if 'conversation_memory' not in st.session_state:
+        st.session_state.conversation_memory = ConversationMemory(CONVERSATION_TOKEN_BUDGET)
+
+    # Fold turns that fell out of the memory window into a short running summary
+    def summarize_turns(summary, turns):
+        exchanges = "\n".join(f"User: {turn['user']}\nAI Assistant: {turn['assistant']}" for turn in turns)
+        response = client.chat_completion(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "Summarize the conversation so far in at most three sentences, in the language of the conversation. Keep names, forms and numbers the user mentioned."},
+                {"role": "user", "content": f"Summary so far: {summary}\n\nNew exchanges:\n{exchanges}"}
+            ],
+            max_tokens=200,
+            temperature=0.3
+        )
+        return response.choices[0].message.content.strip()
 
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = ""
+    def update_conversation_history(memory, user_input, ai_response):
+        memory.add(user_input, ai_response)
+        if CONVERSATION_SUMMARY:
+            pipeline.executor.submit(memory.summarize_evicted, summarize_turns)
+        else:
+            memory.summarize_evicted()
 
-    MAX_EXCHANGES = 6
-    def update_conversation_history(history, user_input, ai_response):
-        exchanges = history.split('\n\n')
         # Use the user's full name instead of "Human"
         new_exchange = f"{st.session_state.user_full_name}: {user_input}\nAI Assistant: {ai_response}"
-        exchanges.append(new_exchange)
-        recent_exchanges = exchanges[-MAX_EXCHANGES:]
-
-        with open("U:\\doc\\inputs_and_outputs", 'a', encoding='utf-8') as file:
-            file.write(new_exchange + "\n\n")
+        with tracing.span("transcript_append", transcript_bytes=len(new_exchange.encode('utf-8'))):
+            get_transcript_writer(TRANSCRIPT_FILE).write(new_exchange + "\n\n")
 
-        return '\n\n'.join(recent_exchanges)
+        return memory
 
     if 'current_topic' not in st.session_state:
         st.session_state.current_topic = "default"
@@ -546,64 +672,16 @@ def user_interface():
                         mapping[keyword.strip()] = json_file.strip()
         return mapping
 
-    # Function to load JSON data
-    def load_json_data(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                # If the data is empty or malformed, initialize it
-                if not data or not isinstance(data, list) or not isinstance(data[0], list):
-                    return []  # Initialize as an empty list to start fresh
-                return data[0]  # Return the inner list of session dictionaries
-        except (json.JSONDecodeError, FileNotFoundError):
-            # Return an empty list if the JSON file is empty, invalid, or missing
-            return []
-
-    # Function to save JSON data
-    def save_json_data(file_path, data):
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump([data], file, ensure_ascii=False, indent=4)  # Save data back as a nested list
-
     # Function to update JSON with conversation including admin involvement and timestamps
     def update_json_with_conversation(user_input, response, session_id, user_name, role="ai"):
-        data = load_json_data(file_path)
-        current_time = datetime.datetime.now().isoformat()
-        new_interaction = {
-            "session_id": session_id,
-            "user": user_name,
-            "message": user_input,
-            "timestamp": current_time,  # Add timestamp for user message
-        }
-
-        if role == "ai":
-            new_interaction["ai"] = {
-                "message": response,
-                "timestamp": current_time  # Add timestamp for AI response
-            }
-        elif role == "admin":
-            # Admin comments are handled separately
-            pass  # No additional action needed here
-
-        new_interaction["comments"] = []
-        new_interaction["admin_involved"] = role == "admin"
-        new_interaction["new_user_message"] = True
-
-        data.append(new_interaction)  # Always append the new interaction to the list
-        save_json_data(file_path, data)  # Save data back as a nested list
+        # Admin comments are handled separately, so only AI interactions carry a response
+        with tracing.span("store_write"):
+            conversation_view.record_exchange(interaction_store, user_input, response, session_id, user_name, role)
 
     # Function to check for admin comments
     def check_for_admin_comments(session_id):
-        data = load_json_data(file_path)
-        new_comments = []
-        for session in data:
-            if session["session_id"] == session_id:
-                comments = session.get("comments", [])
-                for comment in comments:
-                    if not comment.get("comment_displayed", False):
-                        comment["comment_displayed"] = True
-                        save_json_data(file_path, data)
-                        new_comments.append(comment["message"])
-        return new_comments
+        # Read only this session's undisplayed comments and acknowledge them all at once
+        return conversation_view.take_admin_comments(interaction_store, session_id)
 
     # Function to display admin comments
     def display_admin_comments():
@@ -618,39 +696,55 @@ def user_interface():
                     })
             st.session_state.admin_comments = []  # Clear after displaying
 
-    # Define the stream_openai_response function
-    def stream_openai_response(conversation_history, user_input, client, guidance_string, user_full_name):
-        response_placeholder = st.empty()
-
-        background_info = f"My name is {st.session_state.user_full_name}."
+    # Build the chat messages for the answer model
+    def build_chat_messages(memory, user_input, guidance_string, user_full_name):
+        background_info = f"My name is {user_full_name}."
 
         # Only add the user's name at the start of the conversation for context.
-        if not conversation_history:
+        if memory.is_empty():
             user_input = f"My name is {user_full_name}. " + user_input
 
-        # Now, concatenate the guidance string with the conversation history and the current user input
-        full_input = f"{background_info}\n{guidance_string}\n{conversation_history}\nUser: {user_input}"
+        # The guidance comes first so that the start of the prompt is the same for every user on a topic,
+        # followed by the earlier turns as chat messages and the current user input.
+        system_content = f"{guidance_string}\n{background_info}"
+
+        return [{"role": "system", "content": system_content}, *memory.as_messages(), {"role": "user", "content": user_input}]
+
+    # Stream the answer's text deltas; safe to run outside the script thread
+    def open_chat_stream(client, messages):
+        stream = client.chat_stream(
+            model="gpt-4o",
+            messages=messages,
+            max_tokens=3000,
+            temperature=0.9,
+        )
+        try:
+            for response in stream:
+                yield response.choices[0].delta.content if response.choices[0].delta.content else ""
+        finally:
+            stream.close()
+
+    # Define the stream_openai_response function
+    def stream_openai_response(memory, user_input, client, guidance_string, user_full_name, deltas=None):
+        # Deltas are buffered and rendered every few tens of milliseconds or at sentence ends
+        renderer = streaming.ThrottledRenderer(st.empty())
 
-        full_response = ""
         try:
-            for response in client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "system", "content": full_input}, {"role": "user", "content": user_input}],
-                max_tokens=3000,
-                temperature=0.9,
-                stream=True,
-            ):
-                delta_content = response.choices[0].delta.content if response.choices[0].delta.content else ""
-                full_response += delta_content
-                response_placeholder.markdown(full_response)
+            if deltas is None:
+                messages = build_chat_messages(memory, user_input, guidance_string, user_full_name)
+                deltas = open_chat_stream(client, messages)
+            for delta_content in deltas:
+                renderer.add(delta_content)
 
         except Exception as e:
             st.error(f"An error occurred: {e}")
 
+        full_response = renderer.finish()
+        tracing.current_span().set(renders=renderer.renders, rendered_bytes=renderer.bytes_sent)
         return full_response
 
     # Function to interpret the user's input and predict intent
-    def interpret_state(translated_text: str, conversation_history: str, client: OpenAI) -> str:
+    def interpret_state(translated_text: str, memory: ConversationMemory, client: LLMClientManager) -> str:
         # Generate a reasoning prompt for the first model with descriptions
         options_with_descriptions = "\n".join([
             f'- "{key}": "{info["description"]}"' for key, info in json_files.items()
@@ -660,44 +754,82 @@ def user_interface():
             f"Given the translated text and the conversation history, determine which option from the list is most appropriate for handling the user's request based on the descriptions below. Please provide only the option name.\n\n"
             f"Options:\n{options_with_descriptions}\n\n"
             f"Text: {translated_text}\n\n"
-            f"Conversation History: {conversation_history}\n\n"
             f"Please provide only the option name."
         )
 
         # Request the model to interpret the user's intent
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that selects the most appropriate option based on the user's input."},
-                {"role": "user", "content": state_prompt}
-            ],
-            max_tokens=250,
-            temperature=0.7
-        )
+        with tracing.span("interpret_state", prompt_bytes=len(state_prompt.encode('utf-8'))) as span:
+            response = client.chat_completion(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that selects the most appropriate option based on the user's input."},
+                    *memory.as_messages(),
+                    {"role": "user", "content": state_prompt}
+                ],
+                max_tokens=250,
+                temperature=0.7
+            )
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
 
         # Get the selected option
         interpretation = response.choices[0].message.content.strip()
 
-        # Print the selected option in the console for debugging
-        print(f"Interpretation: {interpretation}")
+        # Log the selected option for debugging
+        logger.debug("Interpretation: %s", interpretation)
 
         # Find the most appropriate JSON file from the options
         for key in json_files.keys():
             if key.lower() in interpretation.lower():
-                print(f"Chosen JSON: {key}")
+                logger.debug("Chosen JSON: %s", key)
                 return key  # Return the key of the JSON file chosen by the model
 
         # If no match, use the default JSON
-        print("Chosen JSON: default")
+        logger.debug("Chosen JSON: default")
         return 'default'
 
-    def langchain_bot(user_input, conversation_history, client, guidance_string, user_full_name):
+    # Pick the topic locally and only ask the LLM (interpret_state) when the local router isn't confident
+    def route_prompt(prompt, memory, client):
+        with tracing.span("route") as span:
+            choice, method = route_prompt_untraced(prompt, memory, client)
+            span.set(topic=choice, method=method)
+            return choice
+
+    def route_prompt_untraced(prompt, memory, client):
+        local_choice, confidence, _ = topic_router.route(prompt)
+        tracing.current_span().set(local_choice=local_choice, confidence=round(confidence, 3))
+        if confidence >= ROUTER_MIN_CONFIDENCE:
+            if random.random() < ROUTER_AUDIT_RATE:
+                # Compare against the LLM choice in the background without delaying the answer
+                def audit():
+                    llm_choice = interpret_state(prompt, memory, client)
+                    log_routing_decision(ROUTING_LOG_FILE, prompt, local_choice, confidence, "local", llm_choice)
+                threading.Thread(target=audit, daemon=True).start()
+            else:
+                log_routing_decision(ROUTING_LOG_FILE, prompt, local_choice, confidence, "local")
+            return local_choice, "local"
+
+        llm_choice = interpret_state(prompt, memory, client)
+        log_routing_decision(ROUTING_LOG_FILE, prompt, local_choice, confidence, "llm", llm_choice)
+        return llm_choice, "llm"
+
+    # Guidance text for a topic, limited to the parts relevant to the prompt; safe to run outside the script thread
+    def build_guidance(selected_option, prompt):
+        with tracing.span("guidance", topic=selected_option) as span:
+            topic_index = topics.topic_index(topic_key(selected_option))
+            guidance = topic_index.build_context(prompt, RETRIEVAL_TOP_K, GUIDANCE_TOKEN_BUDGET)
+            span.set(guidance_bytes=len(guidance.encode('utf-8')), guidance_tokens=estimate_tokens(guidance))
+            return guidance
+
+    def langchain_bot(user_input, memory, client, guidance_string, user_full_name, deltas=None):
         # Generate AI response
-        lm_response = stream_openai_response(conversation_history, user_input, client, guidance_string, user_full_name)
+        with tracing.span("answer_stream") as span:
+            lm_response = stream_openai_response(memory, user_input, client, guidance_string, user_full_name, deltas)
+            span.set(response_bytes=len(lm_response.encode('utf-8')), response_tokens=estimate_tokens(lm_response))
 
-        # Update the conversation history with the new exchange
-        updated_history = update_conversation_history(conversation_history, user_input, lm_response)
-        st.session_state.conversation_history = updated_history
+        # Update the conversation memory with the new exchange
+        st.session_state.conversation_memory = update_conversation_history(memory, user_input, lm_response)
 
         # Save the interaction to e.json using update_json_with_conversation
         session_id = st.session_state.session_id
@@ -705,7 +837,8 @@ def user_interface():
         update_json_with_conversation(user_input, lm_response, session_id, user_name, role="ai")
 
         # Check for admin comments after AI response
-        new_comments = check_for_admin_comments(session_id)
+        with tracing.span("comment_poll"):
+            new_comments = check_for_admin_comments(session_id)
         if new_comments:
             st.session_state.admin_comments.extend(new_comments)
 
@@ -716,28 +849,23 @@ def user_interface():
 
     # Begin user interface code
     user_full_name = config['credentialss']['usernames'][username]['name']
-    print("Authenticated user's full name:", user_full_name)
 
     # Store user_full_name in session_state
     st.session_state.user_full_name = user_full_name
 
-    # Generate and store session_id
-    if 'session_id' not in st.session_state:
-        st.session_state.session_id = f"{username}{int(time.time())}"
-
+    # Set by restore_conversation before the interface runs
     session_id = st.session_state.session_id  # For convenience
 
     # Apply custom styles and images
     def set_images_and_background(logo_path: str, tamal_path: str):
         try:
-            with open(logo_path, "rb") as logo_file:
-                logo_encoded = base64.b64encode(logo_file.read()).decode()
-            with open(tamal_path, "rb") as tamal_file:
-                tamal_encoded = base64.b64encode(tamal_file.read()).decode()
+            assets.prepare_static_assets(os.path.dirname(logo_path), STATIC_DIR)
+            logo_src = assets.asset_src(STATIC_DIR, os.path.basename(logo_path))
+            tamal_src = assets.asset_src(STATIC_DIR, os.path.basename(tamal_path))
         except FileNotFoundError as e:
             st.error(f"Image file not found: {e}")
-            logo_encoded = ""
-            tamal_encoded = ""
+            logo_src = ""
+            tamal_src = ""
 
         css = """
         <style>
@@ -766,10 +894,10 @@ def user_interface():
         """
         st.markdown(css, unsafe_allow_html=True)
         st.markdown('<div class="color-section"></div>', unsafe_allow_html=True)
-        if logo_encoded:
-            st.markdown(f'<div class="logo-section"><img src="data:image/png;base64,{logo_encoded}" alt="Logo" width="400px" height="300px"></div>', unsafe_allow_html=True)
-        if tamal_encoded:
-            st.markdown(f'<div class="tamal-section"><img src="data:image/png;base64,{tamal_encoded}" alt="Tamal"></div>', unsafe_allow_html=True)
+        if logo_src:
+            st.markdown(f'<div class="logo-section"><img src="{logo_src}" alt="Logo" width="400px" height="300px"></div>', unsafe_allow_html=True)
+        if tamal_src:
+            st.markdown(f'<div class="tamal-section"><img src="{tamal_src}" alt="Tamal"></div>', unsafe_allow_html=True)
 
     set_images_and_background(LOGO_PATH, TAMAL_PATH)
 
@@ -783,8 +911,7 @@ def user_interface():
         st.session_state.admin_comments = []
 
     # Check if admin is involved
-    data = load_json_data(file_path)
-    admin_involved = any(session.get('admin_involved', False) for session in data if session['session_id'] == session_id)
+    admin_involved = interaction_store.is_admin_involved(session_id)
 
     # Custom CSS to ensure the admin message is always on top
     if admin_involved:
@@ -831,8 +958,10 @@ def user_interface():
         if last_admin_message_key not in st.session_state:
             st.session_state[last_admin_message_key] = None
 
-        # Input field for user to send a message to the admin
-        admin_message = st.chat_input(placeholder="Type your message here...", key=admin_input_key)
+        # Input field for user to send a message to the admin; a message sent from the AI chat input
+        # of a tab that hadn't rerun since the admin joined is the user's message all the same
+        admin_message = (st.chat_input(placeholder="Type your message here...", key=admin_input_key)
+                         or st.session_state.get(CHAT_INPUT_KEY))
 
         if admin_message and admin_message != st.session_state[last_admin_message_key]:
             st.session_state[last_admin_message_key] = admin_message  # Update last processed admin message
@@ -850,15 +979,15 @@ def user_interface():
             # Log the user input during admin interaction
             update_json_with_conversation(admin_message, "", session_id, user_name, role="admin")
 
-            st.experimental_rerun()  # Rerun to update the chat history immediately
+            rerun()  # Rerun to update the chat history immediately
 
     else:
         # Initialize last_prompt in session_state if not present
         if 'last_prompt' not in st.session_state:
             st.session_state.last_prompt = None
 
-        # User input section
-        prompt = st.chat_input("כתוב כאן:")
+        # User input section; likewise a message sent from the admin-mode input after the hand back
+        prompt = st.chat_input("כתוב כאן:", key=CHAT_INPUT_KEY) or st.session_state.get(f"user_input_{session_id}")
         if prompt and prompt != st.session_state.last_prompt:
             st.session_state.last_prompt = prompt  # Update last processed prompt
 
@@ -873,37 +1002,100 @@ def user_interface():
             st.session_state.chat_history.append({"role": "user", "content": prompt})
 
             with st.spinner('מקליד/ה..'):
-                # Use interpret_state to determine which JSON file to use based on the user input
-                selected_option = interpret_state(prompt, st.session_state.conversation_history, client)
-
-                # Load the appropriate data and update guidance_string
-                documents, json_data = load_data(selected_option)
-                guidance_string = json_to_string(json_data)
-
-                lm_response = langchain_bot(prompt, st.session_state.conversation_history, client, guidance_string, user_full_name)
-
-    # Auto-refresh every 5 seconds to check for new admin comments
-    refresh_count = st_autorefresh(interval=5000, key="datarefresh")
-
-    # Check for new comments on auto-refresh
-    if refresh_count > 0:  # Ensure it runs only after the first refresh
-        new_comments = check_for_admin_comments(session_id)
-        if new_comments:
-            st.session_state.admin_comments.extend(new_comments)
+                with tracing.span("prompt", prompt_bytes=len(prompt.encode('utf-8'))) as request_span:
+                    request_started = time.perf_counter()
+                    memory = st.session_state.conversation_memory
+                    speculative_topic = st.session_state.current_topic
+
+                    # Determine which JSON file to use based on the user input, while the guidance
+                    # for the current topic is prepared in parallel
+                    route_future = pipeline.executor.submit(tracing.wrap(route_prompt), prompt, memory, client)
+                    warm_future = pipeline.executor.submit(tracing.wrap(build_guidance), speculative_topic, prompt)
+
+                    speculative_stream = None
+                    try:
+                        try:
+                            selected_option = route_future.result(timeout=SPECULATION_DELAY)
+                        except pipeline.TimeoutError:
+                            # Routing went to the LLM: start answering for the current topic meanwhile
+                            if SPECULATIVE_STREAMING:
+                                messages = build_chat_messages(memory, prompt, warm_future.result(), user_full_name)
+                                speculative_stream = pipeline.BackgroundStream(lambda: open_chat_stream(client, messages))
+                            selected_option = route_future.result()
+
+                        # A first question asked before on the same topic file version is answered from the cache
+                        cache_key = None
+                        cached_response = None
+                        if memory.is_empty():
+                            topic_version = topics.topic_version(topic_key(selected_option))
+                            cache_key = response_cache.make_key(prompt, selected_option, topic_version)
+                            cached_response = response_cache.cache.get(cache_key)
+
+                        if cached_response is not None:
+                            guidance_string = ""
+                            deltas = [cached_response]
+                        elif speculative_stream is not None and selected_option == speculative_topic:
+                            guidance_string = warm_future.result()
+                            deltas = speculative_stream
+                        else:
+                            if selected_option == speculative_topic:
+                                guidance_string = warm_future.result()
+                            else:
+                                guidance_string = build_guidance(selected_option, prompt)
+                            messages = build_chat_messages(memory, prompt, guidance_string, user_full_name)
+                            deltas = open_chat_stream(client, messages)
+                        st.session_state.current_topic = selected_option
+
+                        timer = pipeline.FirstTokenTimer(deltas, request_started)
+                        lm_response = langchain_bot(prompt, memory, client, guidance_string, user_full_name, timer)
+                    finally:
+                        # An unused speculative answer, or one abandoned by an error, stops streaming
+                        # (cancelling one that was read to the end does nothing)
+                        if speculative_stream is not None:
+                            speculative_stream.cancel()
+
+                    # Only complete answers that don't mention any part of the user's name are reused for others
+                    if (cache_key is not None and cached_response is None and timer.completed and lm_response.strip()
+                            and not response_cache.mentions_name(lm_response, user_full_name)):
+                        response_cache.cache.put(cache_key, lm_response)
+
+                    speculation = "none" if speculative_stream is None else ("hit" if deltas is speculative_stream else "miss")
+                    request_span.set(topic=selected_option, speculation=speculation, cached=cached_response is not None,
+                                     history_tokens=memory.total_tokens, guidance_bytes=len(guidance_string.encode('utf-8')),
+                                     ttft_ms=None if timer.time_to_first_token is None else round(timer.time_to_first_token * 1000, 1))
+
+    # Rerun when the admin comments on this conversation or hands it back to the AI;
+    # poll every 5 seconds only if push isn't available
+    if not wake_on_event(event_bus.session_topic(session_id), conversation_view.USER_WAKE_KINDS):
+        st_autorefresh(interval=5000, key="datarefresh")
+
+    # Check for new comments (a cheap indexed lookup of this session's pending comments)
+    new_comments = check_for_admin_comments(session_id)
+    if new_comments:
+        st.session_state.admin_comments.extend(new_comments)
 
     # Display the admin comments after checking for updates
     display_admin_comments()
 
-    # Ensure that the conversation history is maintained
-    st.session_state.conversation_history = st.session_state.conversation_history
-
 # Main application logic
 if authentication_status:
     if username == 'admin':
-        admin_interface()
+        with run_profile.phase("admin interface"):
+            admin_interface()
     else:
-        user_interface()
+        with run_profile.phase("user interface"):
+            shared_state = session_state_store.SharedSessionState(
+                session_state_store.get_backend(SESSION_STORE_URL), SHARED_SESSION_FIELDS
+            )
+            conversation_id = restore_conversation(shared_state, username)
+            try:
+                user_interface()
+            finally:
+                # Also runs when the script stops early for a rerun
+                shared_state.persist(st.session_state, conversation_id, username)
 elif authentication_status == False:
     st.error('Username/password is incorrect')
 else:
     st.warning('Please enter your username and password')
+
+run_profile.report()
@@ -0,0 +1,643 @@
+import os
+import json
+import sqlite3
+import hashlib
+import datetime
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+
+# SQLite-backed storage for user/AI interactions and admin comments.
+# Replaces the whole-file rewrites of e.json: every write is a single row insert
+# or an in-place update, and WAL mode lets several Streamlit sessions write
+# without losing each other's changes.
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user TEXT,
+    message TEXT,
+    timestamp TEXT,
+    ai_message TEXT,
+    ai_timestamp TEXT,
+    admin_involved INTEGER NOT NULL DEFAULT 0,
+    new_user_message INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_session ON interactions (session_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    interaction_id INTEGER NOT NULL REFERENCES interactions (id),
+    session_id TEXT,
+    user TEXT,
+    message TEXT,
+    timestamp TEXT,
+    comment_displayed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_comments_interaction ON comments (interaction_id);
+
+-- Compact per-session summary, maintained on every write for the admin sidebar
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user TEXT,
+    last_timestamp TEXT,
+    has_new_message INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    admin_involved INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_order ON sessions (has_new_message, last_timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user);
+
+-- Monotonic change feed: one row per write, read by the admin panel with a cursor
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    interaction_id INTEGER,
+    comment_id INTEGER
+);
+
+-- Sessions moved out to archive segments (see archive.py): where each one is stored, plus
+-- the summary shown in the admin panel's archived view. A session written to again after
+-- it was archived is archived again later as another part.
+CREATE TABLE IF NOT EXISTS archived_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user TEXT,
+    first_timestamp TEXT,
+    last_timestamp TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    admin_involved INTEGER NOT NULL DEFAULT 0,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    archived_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_archived_sessions_session ON archived_sessions (session_id);
+CREATE INDEX IF NOT EXISTS idx_archived_sessions_last ON archived_sessions (last_timestamp);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class InteractionStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._listeners = []
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            # Comments got a session_id column so a session's pending comments can be read directly
+            comment_columns = {row["name"] for row in conn.execute("PRAGMA table_info(comments)")}
+            if 'session_id' not in comment_columns:
+                conn.execute("ALTER TABLE comments ADD COLUMN session_id TEXT")
+                conn.execute(
+                    "UPDATE comments SET session_id ="
+                    " (SELECT session_id FROM interactions WHERE interactions.id = comments.interaction_id)"
+                )
+            # Only undisplayed comments are indexed, so the per-poll lookup stays small as history grows
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_comments_pending ON comments (session_id) WHERE comment_displayed = 0"
+            )
+            # Databases created before the summary table existed get it filled once
+            if (conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM interactions LIMIT 1").fetchone() is not None):
+                self._rebuild_session_summaries(conn)
+
+    # Each Streamlit session runs in its own thread, so keep one connection per thread
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    # Convert an interaction row (and its comments) back to the e.json record layout
+    @staticmethod
+    def _to_record(row, comments):
+        record = {
+            "id": row["id"],
+            "session_id": row["session_id"],
+            "user": row["user"],
+            "message": row["message"],
+            "timestamp": row["timestamp"],
+        }
+        if row["ai_message"] is not None:
+            record["ai"] = {"message": row["ai_message"], "timestamp": row["ai_timestamp"]}
+        record["comments"] = [
+            {
+                "id": comment["id"],
+                "user": comment["user"],
+                "message": comment["message"],
+                "timestamp": comment["timestamp"],
+                "comment_displayed": bool(comment["comment_displayed"]),
+            }
+            for comment in comments
+        ]
+        record["admin_involved"] = bool(row["admin_involved"])
+        record["new_user_message"] = bool(row["new_user_message"])
+        return record
+
+    def _record_change(self, conn, session_id, kind, interaction_id=None, comment_id=None):
+        cursor = conn.execute(
+            "INSERT INTO changes (session_id, kind, interaction_id, comment_id) VALUES (?, ?, ?, ?)",
+            (session_id, kind, interaction_id, comment_id)
+        )
+        self._local.changes.append({
+            "seq": cursor.lastrowid,
+            "session_id": session_id,
+            "kind": kind,
+            "interaction_id": interaction_id,
+            "comment_id": comment_id,
+        })
+
+    # Write transaction; once it commits, listeners get the changes it recorded. A failing
+    # listener is logged and doesn't affect the write, which has already committed.
+    # immediate=True takes the write lock up front, for transactions that read before writing.
+    @contextmanager
+    def _transaction(self, immediate=False):
+        conn = self._connect()
+        self._local.changes = []
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+        changes, self._local.changes = self._local.changes, []
+        if changes:
+            for listener in list(self._listeners):
+                try:
+                    listener(changes)
+                except Exception:
+                    logger.exception("Store listener %r failed", listener)
+
+    # Register a callback receiving the list of changes of every committed write made through this store
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Recompute session summaries from the interactions table (used after bulk imports)
+    @staticmethod
+    def _rebuild_session_summaries(conn, session_ids=None):
+        where = ""
+        params = []
+        if session_ids is not None:
+            session_ids = list(session_ids)
+            if not session_ids:
+                return
+            where = f" WHERE i.session_id IN ({', '.join('?' for _ in session_ids)})"
+            params = session_ids
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, user, last_timestamp, has_new_message, message_count,"
+            " comment_count, admin_involved)"
+            " SELECT i.session_id, MAX(i.user), MAX(i.timestamp), MAX(i.new_user_message), COUNT(*),"
+            " (SELECT COUNT(*) FROM comments c JOIN interactions j ON j.id = c.interaction_id"
+            "  WHERE j.session_id = i.session_id), MAX(i.admin_involved)"
+            f" FROM interactions i{where} GROUP BY i.session_id",
+            params
+        )
+
+    # admin_involved marks the interaction as written while an admin had the conversation; only
+    # add_admin_comment and set_admin_involved change who has it, so a message sent from a tab
+    # that missed the hand back to the AI doesn't take it back
+    def append_interaction(self, session_id, user, message, ai_message=None, timestamp=None,
+                           admin_involved=False, new_user_message=True):
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO interactions (session_id, user, message, timestamp, ai_message, ai_timestamp,"
+                " admin_involved, new_user_message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, user, message, timestamp, ai_message,
+                 timestamp if ai_message is not None else None,
+                 int(admin_involved), int(new_user_message))
+            )
+            conn.execute(
+                "INSERT INTO sessions (session_id, user, last_timestamp, has_new_message, message_count, admin_involved)"
+                " VALUES (?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT (session_id) DO UPDATE SET"
+                " user = excluded.user,"
+                " last_timestamp = MAX(COALESCE(last_timestamp, ''), excluded.last_timestamp),"
+                " has_new_message = MAX(has_new_message, excluded.has_new_message),"
+                " message_count = message_count + 1",
+                (session_id, user, timestamp, int(new_user_message), int(admin_involved))
+            )
+            self._record_change(conn, session_id, 'interaction_added', interaction_id=cursor.lastrowid)
+        return cursor.lastrowid
+
+    # Interactions of a session, oldest first; with a limit only the latest `limit` of them
+    def get_session_interactions(self, session_id, limit=None):
+        conn = self._connect()
+        if limit is None:
+            rows = conn.execute(
+                "SELECT * FROM interactions WHERE session_id = ? ORDER BY timestamp, id", (session_id,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM (SELECT * FROM interactions WHERE session_id = ?"
+                " ORDER BY timestamp DESC, id DESC LIMIT ?) ORDER BY timestamp, id", (session_id, limit)
+            ).fetchall()
+        if not rows:
+            return []
+
+        comments_by_interaction = {}
+        if limit is None:
+            comments = conn.execute(
+                "SELECT c.* FROM comments c JOIN interactions i ON i.id = c.interaction_id"
+                " WHERE i.session_id = ? ORDER BY c.timestamp, c.id", (session_id,)
+            )
+        else:
+            ids = [row["id"] for row in rows]
+            comments = conn.execute(
+                f"SELECT * FROM comments WHERE interaction_id IN ({', '.join('?' for _ in ids)})"
+                " ORDER BY timestamp, id", ids
+            )
+        for comment in comments:
+            comments_by_interaction.setdefault(comment["interaction_id"], []).append(comment)
+
+        return [self._to_record(row, comments_by_interaction.get(row["id"], [])) for row in rows]
+
+    # Session summaries, unread first and then newest first, optionally filtered by user and date range.
+    # since/until are ISO strings compared against the session's last timestamp (until is exclusive).
+    def list_sessions(self, limit=None, offset=0, user=None, since=None, until=None):
+        conditions = []
+        params = []
+        if user:
+            conditions.append("user LIKE ?")
+            params.append(f"%{user.strip()}%")
+        if since:
+            conditions.append("last_timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("last_timestamp < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.extend([limit if limit is not None else -1, offset])
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT * FROM sessions{where} ORDER BY has_new_message DESC, last_timestamp DESC LIMIT ? OFFSET ?",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Summaries of the given sessions only
+    def summarize_sessions(self, session_ids):
+        session_ids = list(session_ids)
+        if not session_ids:
+            return []
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in session_ids)
+        rows = conn.execute(
+            f"SELECT * FROM sessions WHERE session_id IN ({placeholders})", session_ids
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def unread_session_ids(self):
+        conn = self._connect()
+        return {row["session_id"] for row in conn.execute("SELECT session_id FROM sessions WHERE has_new_message = 1")}
+
+    # Cursor to start following the change feed from "now"
+    def latest_change_seq(self):
+        conn = self._connect()
+        row = conn.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM changes").fetchone()
+        return row["seq"]
+
+    # Interactions and comments added or changed after the cursor, plus the cursor to pass next time
+    def changes_since(self, cursor, limit=1000):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT seq, session_id, kind, interaction_id, comment_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (cursor, limit)
+        ).fetchall()
+        if rows:
+            cursor = rows[-1]["seq"]
+        return cursor, [dict(row) for row in rows]
+
+    def is_admin_involved(self, session_id):
+        conn = self._connect()
+        row = conn.execute("SELECT admin_involved FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None and bool(row["admin_involved"])
+
+    # Attach an admin comment to the latest interaction of the session; returns False if the session is empty
+    def add_admin_comment(self, session_id, message, timestamp=None):
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        with self._transaction() as conn:
+            latest = conn.execute(
+                "SELECT id FROM interactions WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1",
+                (session_id,)
+            ).fetchone()
+            if latest is None:
+                return False
+            cursor = conn.execute(
+                "INSERT INTO comments (interaction_id, session_id, user, message, timestamp, comment_displayed)"
+                " VALUES (?, ?, 'Admin', ?, ?, 0)",
+                (latest["id"], session_id, message, timestamp)
+            )
+            conn.execute("UPDATE interactions SET admin_involved = 1 WHERE id = ?", (latest["id"],))
+            conn.execute(
+                "UPDATE sessions SET admin_involved = 1, comment_count = comment_count + 1 WHERE session_id = ?",
+                (session_id,)
+            )
+            self._record_change(conn, session_id, 'comment_added',
+                                interaction_id=latest["id"], comment_id=cursor.lastrowid)
+        return True
+
+    def clear_new_user_message(self, session_id):
+        # Most calls find nothing to clear; check the summary first so they don't take the write lock
+        row = self._connect().execute(
+            "SELECT has_new_message FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is not None and not row["has_new_message"]:
+            return 0
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE interactions SET new_user_message = 0 WHERE session_id = ? AND new_user_message = 1",
+                (session_id,)
+            )
+            if cursor.rowcount:
+                conn.execute("UPDATE sessions SET has_new_message = 0 WHERE session_id = ?", (session_id,))
+                self._record_change(conn, session_id, 'flags_changed')
+        return cursor.rowcount
+
+    def set_admin_involved(self, session_id, value):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE interactions SET admin_involved = ? WHERE session_id = ? AND admin_involved != ?",
+                (int(value), session_id, int(value))
+            )
+            if cursor.rowcount:
+                conn.execute("UPDATE sessions SET admin_involved = ? WHERE session_id = ?", (int(value), session_id))
+                self._record_change(conn, session_id, 'admin_involvement_changed')
+
+    # Comments of one session that haven't been shown to the user yet, oldest first
+    def pending_admin_comments(self, session_id):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT id, interaction_id, user, message, timestamp FROM comments"
+            " WHERE session_id = ? AND comment_displayed = 0 ORDER BY timestamp, id",
+            (session_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Mark a batch of comments as displayed in one transaction; returns how many changed
+    def acknowledge_comments(self, comment_ids):
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return 0
+        placeholders = ", ".join("?" for _ in comment_ids)
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT id, session_id, interaction_id FROM comments WHERE id IN ({placeholders})"
+                " AND comment_displayed = 0",
+                comment_ids
+            ).fetchall()
+            if not rows:
+                return 0
+            conn.execute(
+                f"UPDATE comments SET comment_displayed = 1 WHERE id IN ({', '.join('?' for _ in rows)})",
+                [row["id"] for row in rows]
+            )
+            for row in rows:
+                self._record_change(conn, row["session_id"], 'comment_displayed',
+                                    interaction_id=row["interaction_id"], comment_id=row["id"])
+        return len(rows)
+
+    # Conditions on sessions (aliased s) that may be archived: nothing the admin hasn't read and
+    # no comment the user hasn't been shown yet
+    _ARCHIVABLE = (
+        "s.last_timestamp < ? AND s.has_new_message = 0"
+        " AND NOT EXISTS (SELECT 1 FROM comments c WHERE c.session_id = s.session_id AND c.comment_displayed = 0)"
+    )
+
+    # Sessions whose last interaction is older than `before` (an ISO string) and that have nothing
+    # unread or unacknowledged, oldest first
+    def idle_session_ids(self, before, limit=None):
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT s.session_id FROM sessions s WHERE {self._ARCHIVABLE} ORDER BY s.last_timestamp LIMIT ?",
+            (before, limit if limit is not None else -1)
+        ).fetchall()
+        return [row["session_id"] for row in rows]
+
+    # Move sessions that are still idle (and read) before `before` out of the live tables. The
+    # sessions are read in one snapshot and handed to segment_writer.append(summary, records),
+    # which returns (segment, offset, length) for the index, and segment_writer.sync() makes the
+    # segments durable; none of that holds the write lock. A short write transaction then
+    # indexes and deletes the sessions that are still archivable and unchanged, so a crash never
+    # loses a conversation. A session written to meanwhile stays live (its copy in the segment
+    # is left unreferenced) and is archived by a later run.
+    def archive_sessions(self, session_ids, before, segment_writer):
+        session_ids = list(session_ids)
+        if not session_ids:
+            return []
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in session_ids)
+        with conn:
+            conn.execute("BEGIN")  # A read snapshot; WAL readers don't block writers
+            summaries = conn.execute(
+                f"SELECT * FROM sessions s WHERE s.session_id IN ({placeholders}) AND {self._ARCHIVABLE}",
+                session_ids + [before]
+            ).fetchall()
+            sessions = [(dict(summary), self.get_session_interactions(summary["session_id"])) for summary in summaries]
+        written = []
+        for summary, records in sessions:
+            if records:
+                written.append((summary, records, *segment_writer.append(summary, records)))
+        if not written:
+            return []
+        segment_writer.sync()
+
+        archived = []
+        archived_at = datetime.datetime.now().isoformat()
+        with self._transaction(immediate=True) as conn:
+            for summary, records, segment, offset, length in written:
+                current = conn.execute(
+                    f"SELECT * FROM sessions s WHERE s.session_id = ? AND {self._ARCHIVABLE}",
+                    (summary["session_id"], before)
+                ).fetchone()
+                if current is None or dict(current) != summary:
+                    continue  # Written to, or flagged, since it was read
+                conn.execute(
+                    "INSERT INTO archived_sessions (session_id, user, first_timestamp, last_timestamp, message_count,"
+                    " comment_count, admin_involved, segment, offset, length, archived_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (summary["session_id"], summary["user"], records[0]["timestamp"], summary["last_timestamp"],
+                     len(records), sum(len(record["comments"]) for record in records),
+                     summary["admin_involved"], segment, offset, length, archived_at)
+                )
+                archived.append(summary["session_id"])
+            if not archived:
+                return []
+
+            placeholders = ", ".join("?" for _ in archived)
+            conn.execute(f"DELETE FROM comments WHERE session_id IN ({placeholders})", archived)
+            conn.execute(f"DELETE FROM interactions WHERE session_id IN ({placeholders})", archived)
+            conn.execute(f"DELETE FROM sessions WHERE session_id IN ({placeholders})", archived)
+            conn.execute(f"DELETE FROM changes WHERE session_id IN ({placeholders})", archived)
+            for session_id in archived:
+                self._record_change(conn, session_id, 'session_archived')
+        return archived
+
+    # How many interactions of the session there are from this one to the latest (its position from the end)
+    def interaction_position(self, session_id, interaction_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT COUNT(*) AS position FROM interactions i JOIN interactions target ON target.id = ?"
+            " WHERE i.session_id = ? AND (i.timestamp > target.timestamp"
+            " OR (i.timestamp = target.timestamp AND i.id >= target.id))",
+            (interaction_id, session_id)
+        ).fetchone()
+        return row["position"]
+
+    # Index entries of archived sessions, newest first, with the same filters as list_sessions
+    def list_archived_sessions(self, limit=None, offset=0, user=None, since=None, until=None):
+        conditions = []
+        params = []
+        if user:
+            conditions.append("user LIKE ?")
+            params.append(f"%{user.strip()}%")
+        if since:
+            conditions.append("last_timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("last_timestamp < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.extend([limit if limit is not None else -1, offset])
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT * FROM archived_sessions{where} ORDER BY last_timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Integer counter in the meta table, shared by every process using the database
+    def read_counter(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row["value"]) if row else 0
+
+    # Add one to the counter and return its new value
+    def increment_counter(self, key):
+        with self._transaction(immediate=True) as conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, '1')"
+                " ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key,)
+            )
+            return int(conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()["value"])
+
+    # Where the parts of one archived session are stored, oldest first
+    def archived_session_parts(self, session_id):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT * FROM archived_sessions WHERE session_id = ? ORDER BY first_timestamp, id", (session_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Import of the legacy nested-list e.json; safe to call on every start. Records are matched
+    # by session, timestamp and message (comments by their interaction, timestamp and message)
+    # and only the ones not in the store or the archive yet are added, so a file the old app keeps writing to
+    # during the rollout can be imported again. The check and the inserts run in one write
+    # transaction, so processes starting together import each record once. A marker keyed by
+    # the file's content skips parsing a file that hasn't changed since the last import.
+    def migrate_from_json(self, json_path):
+        try:
+            with open(json_path, 'rb') as file:
+                raw = file.read()
+        except FileNotFoundError:
+            return 0
+        if not raw.strip():
+            return 0
+        marker = f"migrated:sha256:{hashlib.sha256(raw).hexdigest()}"
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            # Left unmarked, so the file is imported once it is fixed
+            logger.error("Not importing %s, it is not valid JSON: %s", json_path, e)
+            return 0
+
+        migrated = 0
+        migrated_sessions = set()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for interaction_list in data if isinstance(data, list) else []:
+                if isinstance(interaction_list, dict):
+                    interaction_list = [interaction_list]
+                for interaction in interaction_list:
+                    if not isinstance(interaction, dict) or not interaction.get('session_id'):
+                        continue
+                    session_id = interaction['session_id']
+                    existing = conn.execute(
+                        "SELECT id FROM interactions WHERE session_id = ? AND timestamp IS ? AND message IS ?",
+                        (session_id, interaction.get('timestamp'), interaction.get('message'))
+                    ).fetchone()
+                    if existing is not None:
+                        interaction_id = existing["id"]
+                    elif conn.execute(
+                        "SELECT 1 FROM archived_sessions WHERE session_id = ? AND ? BETWEEN first_timestamp AND last_timestamp",
+                        (session_id, interaction.get('timestamp'))
+                    ).fetchone():
+                        continue  # Moved to the archive since it was imported
+                    else:
+                        ai = interaction.get('ai') or {}
+                        interaction_id = conn.execute(
+                            "INSERT INTO interactions (session_id, user, message, timestamp, ai_message, ai_timestamp,"
+                            " admin_involved, new_user_message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (session_id, interaction.get('user'), interaction.get('message'),
+                             interaction.get('timestamp'), ai.get('message'), ai.get('timestamp'),
+                             int(bool(interaction.get('admin_involved', False))),
+                             int(bool(interaction.get('new_user_message', False))))
+                        ).lastrowid
+                        migrated += 1
+                        migrated_sessions.add(session_id)
+                    for comment in interaction.get('comments') or []:
+                        if conn.execute(
+                            "SELECT 1 FROM comments WHERE interaction_id = ? AND timestamp IS ? AND message IS ?",
+                            (interaction_id, comment.get('timestamp'), comment.get('message'))
+                        ).fetchone():
+                            continue
+                        conn.execute(
+                            "INSERT INTO comments (interaction_id, session_id, user, message, timestamp, comment_displayed)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (interaction_id, session_id, comment.get('user'), comment.get('message'),
+                             comment.get('timestamp'), int(bool(comment.get('comment_displayed', False))))
+                        )
+                        migrated_sessions.add(session_id)
+            self._rebuild_session_summaries(conn, migrated_sessions)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         (marker, datetime.datetime.now().isoformat()))
+        return migrated
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+# Process-wide store per database file, shared by every Streamlit session
+def get_store(db_path):
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = InteractionStore(db_path)
+        return _stores[db_path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate a legacy e.json file into the interaction store")
+    parser.add_argument('json_path')
+    parser.add_argument('db_path')
+    args = parser.parse_args()
+    count = get_store(args.db_path).migrate_from_json(args.json_path)
+    print(f"Migrated {count} interactions from {args.json_path} into {args.db_path}")
@@ -0,0 +1,386 @@
+import os
+import sys
+import glob
+import json
+import mmap
+import time
+import struct
+import hashlib
+import datetime
+import argparse
+import threading
+from pathlib import PureWindowsPath
+from collections import Counter
+
+from retrieval import TopicIndex, chunk_json, json_to_string, estimate_tokens, tokenize, load_stop_words
+from router import TopicRouter
+
+# Knowledge pack: the topics of json_files_mapping.json compiled ahead of time into one
+# file, so the app doesn't parse and flatten topic JSON at request time.
+#
+#   python knowledge_pack.py build [--output doc/knowledge.pack] [--budget 3000]
+#
+# The build validates every mapping entry, resolves its path against the deployment's doc/
+# directory (the mapping holds paths from the authors' Windows machines), and stores for
+# each topic its flattened guidance text, retrieval chunks with token and term counts, and
+# the router's mined keywords. It then reports the topics whose prompt is over budget.
+#
+# Layout: MAGIC | format (uint16) | header length (uint32) | header JSON | topic sections.
+# The header holds the mapping, router keywords, content version and each topic's
+# offset and length, plus the mtime, size and sha256 of every source file so the app can
+# tell when a topic was edited after the build; sections are UTF-8 JSON. Opening a pack
+# maps the file and parses only the header; a topic's section is decoded the first time
+# it is used.
+#
+# A running app keeps its pack mapped, and on Windows a mapped file can't be replaced. So a
+# build writes a new file named after its content (knowledge.pack.<hash>) and then replaces
+# the small file at the output path that names it; opening the output path opens the pack it
+# names. The build before last's pack is removed once no app has it open any more.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+PACK_MAGIC = b"KPACK"
+PACK_FORMAT = 4  # 2: chunks split recursively to fit chunk_chars; 3: source stamps in the header; 4: pinned keys matched whole
+_PREFIX = struct.Struct("<5sHI")
+
+DOC_DIR = os.path.join(script_dir, 'doc')
+MAPPING_FILE = os.path.join(DOC_DIR, 'json_files_mapping.json')
+STOP_WORDS_FILE = os.path.join(DOC_DIR, 'heb_stopwords.txt')
+PACK_FILE = os.getenv("KNOWLEDGE_PACK_PATH", os.path.join(DOC_DIR, 'knowledge.pack'))
+
+GUIDANCE_TOKEN_BUDGET = int(os.getenv("GUIDANCE_TOKEN_BUDGET", 3000))
+CHUNK_CHARS = 800
+
+
+class PackFormatError(Exception):
+    pass
+
+
+# Path of a topic file in this deployment: the path as written if it exists, else relative
+# to the mapping's directory, else the file of the same name in doc_dir
+def resolve_topic_path(path, doc_dir):
+    if not path:
+        return None
+    candidates = [path, os.path.join(doc_dir, path), os.path.join(doc_dir, PureWindowsPath(path).name)]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+
+# Mapping with every path resolved, plus a list of problems found (entries that can't be used are left out)
+def resolve_mapping(mapping, doc_dir):
+    resolved = {}
+    problems = []
+    if not isinstance(mapping, dict):
+        return resolved, ["the mapping is not a JSON object"]
+    for key, info in mapping.items():
+        if not isinstance(info, dict):
+            problems.append(f"{key}: entry is not an object")
+            continue
+        if not str(info.get('description', '')).strip():
+            problems.append(f"{key}: no description (the routers will only see the topic name)")
+        path = resolve_topic_path(info.get('path'), doc_dir)
+        if path is None:
+            problems.append(f"{key}: topic file {info.get('path')!r} not found in {doc_dir}")
+            continue
+        resolved[key] = dict(info, path=path)
+    if 'default' not in mapping:
+        problems.append("default: missing; it is used when no topic matches")
+    return resolved, problems
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    with open(path, 'rb') as file:
+        return _sha256(file.read())
+
+
+# What the pack records about a source file to notice later edits
+def _source_stamp(path, raw):
+    stat = os.stat(path)
+    return {"source_mtime_ns": stat.st_mtime_ns, "source_size": stat.st_size, "source_sha256": _sha256(raw)}
+
+
+# Compile the mapping's topics into a pack at output_path; returns (report rows, problems)
+def build(mapping_path=MAPPING_FILE, stop_words_path=STOP_WORDS_FILE, output_path=PACK_FILE,
+          budget=GUIDANCE_TOKEN_BUDGET, chunk_chars=CHUNK_CHARS):
+    doc_dir = os.path.dirname(os.path.abspath(mapping_path))
+    with open(mapping_path, 'rb') as file:
+        mapping_raw = file.read()
+    mapping = json.loads(mapping_raw.decode('utf-8'))
+    resolved, problems = resolve_mapping(mapping, doc_dir)
+    stop_words = frozenset(load_stop_words(stop_words_path))
+
+    sections = []
+    topics = {}
+    report = []
+    offset = 0
+    for key, info in list(resolved.items()):
+        with open(info['path'], 'rb') as file:
+            raw = file.read()
+        try:
+            json_data = json.loads(raw.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            problems.append(f"{key}: {info['path']} is not valid JSON ({e})")
+            del resolved[key]
+            continue
+
+        guidance = json_to_string(json_data)
+        chunks = chunk_json(json_data, chunk_chars)
+        section = json.dumps({
+            "guidance": guidance,
+            "chunks": chunks,
+            "terms": [Counter(tokenize(chunk["text"], stop_words)) for chunk in chunks],
+        }, ensure_ascii=False).encode('utf-8')
+        sections.append(section)
+
+        tokens = estimate_tokens(guidance)
+        pinned_tokens = sum(chunk["tokens"] for chunk in chunks if chunk["pinned"])
+        largest_chunk = max((chunk["tokens"] for chunk in chunks), default=0)
+        largest_retrieved = max((chunk["tokens"] for chunk in chunks if not chunk["pinned"]), default=0)
+        topics[key] = {
+            "description": info.get('description', ''),
+            "source": os.path.relpath(info['path'], doc_dir),
+            **_source_stamp(info['path'], raw),
+            "offset": offset,
+            "length": len(section),
+            "tokens": tokens,
+            "chunks": len(chunks),
+        }
+        offset += len(section)
+
+        # A topic over the budget is sent as its pinned rules plus retrieved chunks; that only
+        # works if the pinned rules fit and every other chunk fits in what they leave
+        problems_over_budget = []
+        if tokens > budget and pinned_tokens > budget:
+            problems_over_budget.append(f"pinned rules alone take {pinned_tokens} tokens")
+        elif tokens > budget and largest_retrieved > budget - pinned_tokens:
+            problems_over_budget.append(f"a {largest_retrieved}-token chunk doesn't fit beside "
+                                        f"the {pinned_tokens} pinned tokens")
+        report.append({
+            "topic": key, "source": topics[key]["source"], "tokens": tokens, "chunks": len(chunks),
+            "pinned_tokens": pinned_tokens, "largest_chunk": largest_chunk,
+            "retrieved": tokens > budget, "over_budget": problems_over_budget,
+        })
+
+    keywords = TopicRouter(resolved, stop_words, keywords={}).mine_keywords()
+    with open(stop_words_path, 'rb') as file:
+        stop_words_raw = file.read()
+    stop_words_sha = _sha256(stop_words_raw)
+    header = {
+        "format": PACK_FORMAT,
+        "built_at": datetime.datetime.now().isoformat(),
+        "version": _sha256(b"".join([stop_words_sha.encode()] + sections))[:16],
+        "stop_words_sha256": stop_words_sha,
+        "mapping_file": _source_stamp(mapping_path, mapping_raw),
+        "stop_words_file": _source_stamp(stop_words_path, stop_words_raw),
+        "budget": budget,
+        "chunk_chars": chunk_chars,
+        "topics": topics,
+        "keywords": keywords,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    content = b"".join([_PREFIX.pack(PACK_MAGIC, PACK_FORMAT, len(header_bytes)), header_bytes] + sections)
+    pack_name = f"{os.path.basename(output_path)}.{_sha256(content)[:16]}"
+    _write_file(os.path.join(os.path.dirname(os.path.abspath(output_path)), pack_name), content)
+    try:
+        previous_path = pack_file_path(output_path)
+    except (OSError, PackFormatError):
+        previous_path = None
+    _write_file(output_path, pack_name.encode('utf-8'))
+    _remove_old_packs(output_path, keep={pack_name, os.path.basename(previous_path or '')})
+    return report, problems
+
+
+# Written next to the target and moved into place, so a running app never sees half a file.
+# On Windows the target can't be replaced while another process is reading it; that only
+# lasts a moment, so the move is retried.
+def _write_file(path, content, attempts=20):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    for attempt in range(attempts):
+        try:
+            os.replace(temporary_path, path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+# Packs of earlier builds; one still mapped by an app can't be removed on Windows and is
+# left for a later build
+def _remove_old_packs(output_path, keep):
+    for path in glob.glob(f"{glob.escape(output_path)}.*"):
+        name = os.path.basename(path)
+        if name in keep or name.endswith(".tmp"):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# The pack file a path names: the path itself if it holds a pack (or the start of one), else
+# the versioned pack whose name it holds (see build)
+def pack_file_path(path):
+    with open(path, 'rb') as file:
+        start = file.read(len(PACK_MAGIC))
+        if PACK_MAGIC.startswith(start):
+            return path
+        name = (start + file.read(256)).decode('utf-8', errors='replace').strip()
+    if os.path.basename(name) != name or not name.startswith(os.path.basename(path) + "."):
+        raise PackFormatError(f"{path} is not a knowledge pack")
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name)
+
+
+class KnowledgePack:
+    def __init__(self, path):
+        self.path = pack_file_path(path)
+        self._sections = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+        try:
+            self._file = open(self.path, 'rb')
+        except FileNotFoundError:
+            raise PackFormatError(f"{path} names a pack that doesn't exist; rebuild it with knowledge_pack.py build")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise PackFormatError(f"{self.path} is empty")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+        self.version = self.header["version"]
+
+        doc_dir = os.path.dirname(os.path.abspath(self.path))
+        self.mapping = {
+            key: {"path": os.path.join(doc_dir, topic["source"]), "description": topic["description"]}
+            for key, topic in self.header["topics"].items()
+        }
+
+    def _read_header(self):
+        if len(self._map) < _PREFIX.size:
+            raise PackFormatError(f"{self.path} is too short to be a knowledge pack")
+        magic, pack_format, header_length = _PREFIX.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC:
+            raise PackFormatError(f"{self.path} is not a knowledge pack")
+        if pack_format != PACK_FORMAT:
+            raise PackFormatError(f"{self.path} has pack format {pack_format}; rebuild it with knowledge_pack.py build")
+        self._sections_start = _PREFIX.size + header_length
+        if len(self._map) < self._sections_start:
+            raise PackFormatError(f"{self.path} is truncated")
+        try:
+            self.header = json.loads(self._map[_PREFIX.size:self._sections_start].decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise PackFormatError(f"{self.path} has a damaged header ({e})")
+
+    @property
+    def closed(self):
+        return self._map.closed
+
+    def _section(self, topic_key):
+        with self._lock:
+            section = self._sections.get(topic_key)
+            if section is None:
+                if self._map.closed:
+                    raise PackFormatError(f"{self.path} was closed after a rebuild")
+                topic = self.header["topics"][topic_key]
+                start = self._sections_start + topic["offset"]
+                section = json.loads(self._map[start:start + topic["length"]].decode('utf-8'))
+                self._sections[topic_key] = section
+            return section
+
+    def _get(self, key, builder):
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+        value = builder()
+        with self._lock:
+            return self._derived.setdefault(key, value)
+
+    # Flattened guidance text of a topic (json_to_string of its file)
+    def guidance_string(self, topic_key):
+        return self._section(topic_key)["guidance"]
+
+    def topic_index(self, topic_key, stop_words):
+        def build_index():
+            section = self._section(topic_key)
+            return TopicIndex.from_chunks(section["chunks"], section["guidance"], section["terms"], stop_words)
+        return self._get(('index', topic_key, stop_words), build_index)
+
+    def topic_router(self, stop_words):
+        return self._get(('router', stop_words),
+                         lambda: TopicRouter(self.mapping, stop_words, keywords=self.header["keywords"]))
+
+    # Changes whenever the topic's content changes, for keying cached answers
+    def topic_version(self, topic_key):
+        return self.header["topics"][topic_key]["source_sha256"]
+
+    # Unmap the file; sections decoded before stay readable
+    def close(self):
+        with self._lock:
+            self._map.close()
+            self._file.close()
+
+
+def print_report(report, problems, budget):
+    print(f"{'topic':<16} {'source':<22} {'tokens':>7} {'chunks':>7} {'pinned':>7} {'largest':>8}  prompt")
+    for row in report:
+        if row["over_budget"]:
+            status = f"OVER BUDGET: {'; '.join(row['over_budget'])}"
+        elif row["retrieved"]:
+            status = "retrieved chunks"
+        else:
+            status = "sent whole"
+        print(f"{row['topic']:<16} {row['source']:<22} {row['tokens']:>7} {row['chunks']:>7} "
+              f"{row['pinned_tokens']:>7} {row['largest_chunk']:>8}  {status}")
+    over_budget = [row["topic"] for row in report if row["over_budget"]]
+    print(f"\n{len(report)} topics, {len(over_budget)} over the {budget}-token guidance budget"
+          + (f": {', '.join(over_budget)}" if over_budget else ""))
+    if problems:
+        print("\nMapping problems:")
+        for problem in problems:
+            print(f"  - {problem}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the topic files into a knowledge pack")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="validate the mapping and write the pack")
+    build_parser.add_argument('--mapping', default=MAPPING_FILE)
+    build_parser.add_argument('--stop-words', default=STOP_WORDS_FILE)
+    build_parser.add_argument('--output', default=PACK_FILE)
+    build_parser.add_argument('--budget', type=int, default=GUIDANCE_TOKEN_BUDGET, help="guidance tokens per prompt")
+    build_parser.add_argument('--strict', action='store_true', help="fail on mapping problems or over-budget topics")
+    info_parser = commands.add_parser('info', help="print the header of a pack")
+    info_parser.add_argument('path', nargs='?', default=PACK_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        pack = KnowledgePack(args.path)
+        header = dict(pack.header, keywords=f"{len(pack.header['keywords'])} topics")
+        print(json.dumps(header, ensure_ascii=False, indent=2))
+        return
+
+    report, problems = build(args.mapping, args.stop_words, args.output, args.budget)
+    print_report(report, problems, args.budget)
+    pack_path = pack_file_path(args.output)
+    print(f"\nWrote {pack_path} ({os.path.getsize(pack_path)} bytes) and pointed {args.output} at it")
+    if args.strict and (problems or any(row["over_budget"] for row in report)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+from profiler import timed_import
+
+# One OpenAI client per process, shared by every session so its keep-alive connection
+# pool is reused. Calls go through a semaphore that caps in-flight requests, get a
+# per-call timeout, and are retried with exponential backoff on 429, 5xx and
+# connection errors. The client honours OPENAI_BASE_URL, so it can be pointed at a
+# local OpenAI-compatible mock server.
+
+DEFAULT_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", 8))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 4))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LLMClientManager:
+    def __init__(self, api_key=None, base_url=None, timeout=DEFAULT_TIMEOUT, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=0.5, backoff_max=20.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=1000)
+        self.wait_times = deque(maxlen=1000)
+
+    # The openai package is imported on first use, so processes that never call the model don't load it
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                OpenAI = timed_import('openai').OpenAI
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+            return self._client
+
+    def _acquire(self):
+        started = time.perf_counter()
+        with self._metrics_lock:
+            self.waiting += 1
+        self._semaphore.acquire()
+        with self._metrics_lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.wait_times.append(time.perf_counter() - started)
+
+    def _release(self, started, failed=False):
+        self._semaphore.release()
+        with self._metrics_lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if failed:
+                self.failures += 1
+            else:
+                self.latencies.append(time.perf_counter() - started)
+
+    @staticmethod
+    def _is_retryable(error):
+        import openai
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def _backoff(self, attempt, error):
+        # Honour Retry-After when the server sends one, otherwise exponential backoff with full jitter
+        delay = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                delay = float(response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                delay = None
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        with self._metrics_lock:
+            self.retries += 1
+        time.sleep(min(delay, self.backoff_max))
+
+    def _create(self, kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                self._backoff(attempt, e)
+                attempt += 1
+
+    def chat_completion(self, **kwargs):
+        self._acquire()
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self._create(kwargs)
+            failed = False
+            return response
+        finally:
+            self._release(started, failed)
+
+    # Streaming completion; the in-flight slot is held until the stream is exhausted or closed.
+    # Only opening the stream is retried, never a stream that already produced output.
+    def chat_stream(self, **kwargs):
+        kwargs['stream'] = True
+        self._acquire()
+        started = time.perf_counter()
+        failed = True
+        stream = None
+        try:
+            stream = self._create(kwargs)
+            for chunk in stream:
+                yield chunk
+            failed = False
+        except GeneratorExit:
+            failed = False  # Closed early by the caller (e.g. a cancelled speculative answer)
+            raise
+        finally:
+            if stream is not None:
+                stream.close()
+            self._release(started, failed)
+
+    def metrics(self):
+        with self._metrics_lock:
+            latencies = list(self.latencies)
+            wait_times = list(self.wait_times)
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "latency_p50": percentile(latencies, 0.5),
+                "latency_p95": percentile(latencies, 0.95),
+                "wait_p95": percentile(wait_times, 0.95),
+            }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+# Process-wide client manager configured from the environment
+def get_llm_client():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = LLMClientManager(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+        return _manager
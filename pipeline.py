@@ -0,0 +1,74 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Helpers for running the prompt path concurrently: routing and guidance warm-up run
+# on a shared thread pool, and a model stream can be started speculatively on its own
+# thread and either consumed or cancelled once the topic is known.
+
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("PIPELINE_WORKERS", 16)), thread_name_prefix="prompt-pipeline")
+
+_DONE = object()
+
+
+class BackgroundStream:
+    # open_stream is called on a background thread and must return an iterator of text deltas.
+    # The deltas are buffered until the script thread iterates over this object.
+    def __init__(self, open_stream):
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(open_stream,), daemon=True)
+        self._thread.start()
+
+    def _run(self, open_stream):
+        deltas = None
+        try:
+            deltas = open_stream()
+            for delta in deltas:
+                if self._cancelled.is_set():
+                    break
+                self._queue.put(delta)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            # Closing the generator closes the underlying HTTP response as well
+            close = getattr(deltas, 'close', None)
+            if close is not None:
+                close()
+            self._queue.put(_DONE)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+# Passes deltas through, records when the first non-empty one arrives and whether the stream completed
+class FirstTokenTimer:
+    def __init__(self, deltas, started_at):
+        self.deltas = deltas
+        self.started_at = started_at
+        self.first_token_at = None
+        self.completed = False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            if delta and self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            yield delta
+        self.completed = True
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import importlib
+import threading
+from contextlib import contextmanager
+
+# Opt-in startup/rerun profiler (APP_PROFILE=1). Streamlit re-executes id.py on every
+# rerun, so each run gets a RunProfile with per-phase timings; the first run of the
+# process additionally reports how long the heavy imports and the process start took.
+# When disabled every call is a no-op.
+
+ENABLED = os.getenv("APP_PROFILE", "0") == "1"
+
+PROCESS_STARTED = time.perf_counter()
+
+# Module name -> seconds spent importing it the first time (later imports are cached lookups)
+_import_times = {}
+_reported_imports = False
+_lock = threading.Lock()
+
+
+# Import a module, recording how long the first import took
+def timed_import(name):
+    if name in sys.modules or not ENABLED:
+        return importlib.import_module(name)
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        _import_times.setdefault(name, time.perf_counter() - started)
+    return module
+
+
+class RunProfile:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        if not ENABLED:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self):
+        global _reported_imports
+        if not ENABLED:
+            return
+        total = time.perf_counter() - self.started
+        lines = [f"[profile] {self.label}: {total * 1000:.1f} ms"]
+        for name, elapsed in self.phases:
+            lines.append(f"[profile]   {name:<28} {elapsed * 1000:9.1f} ms")
+        with _lock:
+            first_report = not _reported_imports
+            _reported_imports = True
+            imports = sorted(_import_times.items(), key=lambda item: item[1], reverse=True)
+        if first_report:
+            lines.append(f"[profile] process start to first run end: {(time.perf_counter() - PROCESS_STARTED) * 1000:.1f} ms")
+            for name, elapsed in imports:
+                lines.append(f"[profile]   import {name:<21} {elapsed * 1000:9.1f} ms")
+        print("\n".join(lines))
@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from retrieval import NIQQUD_PATTERN, TOKEN_PATTERN, HEBREW_PREFIXES
+
+# Process-wide cache of model answers to repeated questions. Keys combine the
+# normalized question, the topic key and the version of the topic (the content hash of
+# its file, whether read from the file or the knowledge pack), so editing a topic file
+# naturally stops serving answers built from the old one. With a shared store, clearing
+# the cache in one process bumps a stamp in the store's database, and every process stops
+# serving the entries it cached under an older stamp.
+
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+# How often the shared invalidation stamp is re-read
+STAMP_REFRESH_SECONDS = float(os.getenv("RESPONSE_CACHE_STAMP_REFRESH", 2))
+STAMP_KEY = "response_cache:stamp"
+
+
+# Lowercase, drop niqqud and punctuation, collapse whitespace
+def normalize_question(text):
+    text = NIQQUD_PATTERN.sub('', str(text).lower())
+    return " ".join(TOKEN_PATTERN.findall(text))
+
+
+def make_key(question, topic_key, topic_version):
+    return normalize_question(question), topic_key, topic_version
+
+
+# Whether the text contains any part of the name as a word, also behind a one-letter Hebrew
+# prefix ("לדנה"); such answers address one user and aren't reused for others
+def mentions_name(text, full_name):
+    parts = {part for part in normalize_question(full_name).split() if len(part) > 1}
+    if not parts:
+        return False
+    for word in normalize_question(text).split():
+        if word in parts or (word[:1] in HEBREW_PREFIXES and word[1:] in parts):
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, stamp_refresh=STAMP_REFRESH_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stamp_refresh = stamp_refresh
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = None
+        self._stamp = 0
+        self._stamp_read_at = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # Share invalidations with every process using the store's database (see invalidate)
+    def share_invalidation(self, store):
+        with self._lock:
+            self._store = store
+            self._stamp_read_at = None
+
+    # Called with the lock held; the stamp is read from the store at most every stamp_refresh seconds
+    def _current_stamp(self):
+        if self._store is None:
+            return 0
+        now = time.monotonic()
+        if self._stamp_read_at is None or now - self._stamp_read_at >= self.stamp_refresh:
+            self._stamp = self._store.read_counter(STAMP_KEY)
+            self._stamp_read_at = now
+        return self._stamp
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time() or entry[1] != self._current_stamp():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, self._current_stamp(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Drop every entry, or only those of one topic; returns how many were removed here. With a
+    # shared store, the other processes drop all of theirs (the stamp isn't per topic).
+    def invalidate(self, topic_key=None):
+        with self._lock:
+            keys = [key for key in self._entries if topic_key is None or key[1] == topic_key]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            if self._store is not None:
+                self._stamp = self._store.increment_counter(STAMP_KEY)
+                self._stamp_read_at = time.monotonic()
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "stamp": self._stamp,
+            }
+
+
+cache = ResponseCache()
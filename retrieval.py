@@ -0,0 +1,240 @@
+import re
+import math
+import logging
+from collections import Counter
+
+# Local retrieval over a topic JSON: the topic is split into chunks at load time,
+# indexed with BM25 over Hebrew-aware tokens, and only the chunks relevant to the
+# user's question are put into the prompt.
+
+logger = logging.getLogger(__name__)
+
+# Top-level keys holding the assistant's role and rules; these chunks are always sent. Keys are
+# compared whole and case-insensitively; numbered copies ("Constraints 2", "Constraints3") count too.
+PINNED_KEYS = frozenset({
+    'your hights mission and moral value', 'role', 'context', 'constraints', 'most important', 'special',
+    'prompt', 'name',
+})
+TRAILING_NUMBER_PATTERN = re.compile(r'[\s_]*\d+$')
+
+# One-letter Hebrew prefixes (ו, ה, ב, ל, מ, ש, כ) that are stripped to get an extra base-form token
+HEBREW_PREFIXES = 'והבלמשכ'
+
+NIQQUD_PATTERN = re.compile(r'[֑-ׇ]')
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+LINE_BREAK_PATTERN = re.compile(r'\n')
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])\s+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def json_to_string(data, depth=0):
+    output = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            output.append(" " * depth + str(key) + ":")
+            output.append(json_to_string(value, depth + 2))
+    elif isinstance(data, list):
+        for item in data:
+            output.append(json_to_string(item, depth + 2))
+    else:
+        return " " * depth + str(data)
+    return "\n".join(output)
+
+
+# Rough token count for budgeting; Hebrew averages about three characters per model token
+def estimate_tokens(text):
+    return len(text) // 3 + 1
+
+
+def load_stop_words(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return {line.strip() for line in file if line.strip()}
+
+
+def tokenize(text, stop_words=frozenset()):
+    tokens = []
+    text = NIQQUD_PATTERN.sub('', str(text).lower())
+    for token in TOKEN_PATTERN.findall(text):
+        if token in stop_words:
+            continue
+        tokens.append(token)
+        # Also index the word without its prefix letter, e.g. "בטופס" -> "טופס"
+        if len(token) > 3 and token[0] in HEBREW_PREFIXES:
+            stripped = token[1:]
+            if stripped not in stop_words:
+                tokens.append(stripped)
+    return tokens
+
+
+def is_pinned_key(key):
+    return TRAILING_NUMBER_PATTERN.sub('', str(key).strip().lower()) in PINNED_KEYS
+
+
+# Pieces of text of at most max_chars, cut at line ends, else at sentence ends, else between
+# words; only a single word longer than max_chars is cut in the middle.
+def split_text(text, max_chars):
+    if len(text) <= max_chars:
+        return [text]
+    for pattern, joiner in ((LINE_BREAK_PATTERN, "\n"), (SENTENCE_END_PATTERN, " "), (WHITESPACE_PATTERN, " ")):
+        parts = pattern.split(text)
+        if len(parts) > 1:
+            break
+    else:
+        return [text[start:start + max_chars] for start in range(0, len(text), max_chars)]
+
+    pieces = []
+    current = ""
+    for part in parts:
+        for piece in split_text(part, max_chars):
+            candidate = f"{current}{joiner}{piece}" if current else piece
+            if len(candidate) <= max_chars:
+                current = candidate
+            else:
+                pieces.append(current)
+                current = piece
+    pieces.append(current)
+    return [piece for piece in pieces if piece.strip()]
+
+
+# Split a topic JSON into chunks of at most max_chars each. Every chunk keeps the path of
+# keys it came from as a header so the model still sees where the text belongs. Dicts are
+# split between keys and lists between items; an item too long for one chunk is split
+# inside (nested dicts and lists recursively, long strings at line or sentence ends).
+def chunk_json(json_data, max_chars=800):
+    chunks = []
+
+    def add_chunk(header, parts, pinned):
+        body = "\n".join(parts)
+        text = f"{header}:\n{body}" if header else body
+        chunks.append({"text": text, "tokens": estimate_tokens(text), "pinned": pinned})
+
+    def split(header, value, pinned):
+        # Deeply nested paths are shortened from the left so the header can't crowd out the text
+        if len(header) > max_chars // 4:
+            header = "…" + header[-(max_chars // 4 - 1):]
+        limit = max_chars - len(header) - 2 if header else max_chars
+
+        parts = []
+        size = 0
+
+        def flush():
+            nonlocal parts, size
+            if parts:
+                add_chunk(header, parts, pinned)
+            parts = []
+            size = 0
+
+        if isinstance(value, list):
+            entries = [(None, item) for item in value]
+        elif isinstance(value, dict):
+            entries = list(value.items())
+        else:
+            entries = [(None, value)]
+        for key, item in entries:
+            text = json_to_string(item, 2) if key is None else json_to_string({key: item}, 2)
+            if len(text) > limit:
+                if key is not None:
+                    flush()
+                    split(f"{header} > {key}" if header else str(key), item, pinned)
+                    continue
+                if isinstance(item, (dict, list)):
+                    flush()
+                    split(header, item, pinned)
+                    continue
+                pieces = split_text(text, limit)
+            else:
+                pieces = [text]
+            for piece in pieces:
+                if parts and size + len(piece) > limit:
+                    flush()
+                parts.append(piece)
+                size += len(piece) + 1
+        flush()
+
+    if isinstance(json_data, dict):
+        for key, value in json_data.items():
+            split(str(key), value, is_pinned_key(key))
+    else:
+        split("", json_data, False)
+    return chunks
+
+
+class TopicIndex:
+    def __init__(self, json_data, stop_words=frozenset(), max_chars=800, k1=1.5, b=0.75):
+        chunks = chunk_json(json_data, max_chars)
+        term_frequencies = [Counter(tokenize(chunk["text"], stop_words)) for chunk in chunks]
+        self._set_up(chunks, json_to_string(json_data), term_frequencies, stop_words, k1, b)
+
+    # Index from chunks and term counts computed ahead of time (see knowledge_pack.py)
+    @classmethod
+    def from_chunks(cls, chunks, full_text, term_frequencies, stop_words=frozenset(), k1=1.5, b=0.75):
+        index = cls.__new__(cls)
+        index._set_up(chunks, full_text, [Counter(frequencies) for frequencies in term_frequencies], stop_words, k1, b)
+        return index
+
+    def _set_up(self, chunks, full_text, term_frequencies, stop_words, k1, b):
+        self.stop_words = stop_words
+        self.k1 = k1
+        self.b = b
+        self.chunks = chunks
+        self.full_text = full_text
+
+        # BM25 statistics
+        self.term_frequencies = term_frequencies
+        self.document_frequency = Counter()
+        for frequencies in term_frequencies:
+            self.document_frequency.update(frequencies.keys())
+        self.lengths = [sum(frequencies.values()) for frequencies in self.term_frequencies]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.pinned_tokens = sum(chunk["tokens"] for chunk in chunks if chunk["pinned"])
+        self._warned_budget = None
+
+    def idf(self, term):
+        count = len(self.chunks)
+        frequency = self.document_frequency.get(term, 0)
+        return math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+
+    # Indices of the best matching chunks with their BM25 scores, best first
+    def search(self, query, top_k=8):
+        query_terms = set(tokenize(query, self.stop_words))
+        scores = []
+        for index, frequencies in enumerate(self.term_frequencies):
+            score = 0.0
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.average_length or 1))
+            for term in query_terms:
+                frequency = frequencies.get(term)
+                if frequency:
+                    score += self.idf(term) * frequency * (self.k1 + 1) / (frequency + length_norm)
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(reverse=True)
+        return [(index, score) for score, index in scores[:top_k]]
+
+    # Guidance text for one question: pinned instruction chunks, then the top-k matches,
+    # stopping before the token budget is exceeded. The pinned block comes first and is the
+    # same for every question on the topic, so it forms a stable prefix for provider-side
+    # prompt caching; retrieved chunks follow in their original order.
+    def build_context(self, query, top_k=8, token_budget=3000):
+        if estimate_tokens(self.full_text) <= token_budget:
+            return self.full_text  # Small topics are sent whole
+
+        if self.pinned_tokens > token_budget and self._warned_budget != token_budget:
+            # Logged once per budget: the rules that don't fit are left out of every prompt
+            self._warned_budget = token_budget
+            logger.warning("Pinned rules take %d tokens, over the %d-token guidance budget; the rules that"
+                           " don't fit are left out", self.pinned_tokens, token_budget)
+
+        pinned = []
+        retrieved = []
+        used = 0
+        for index, chunk in enumerate(self.chunks):
+            if chunk["pinned"] and used + chunk["tokens"] <= token_budget:
+                pinned.append(index)
+                used += chunk["tokens"]
+        for index, _ in self.search(query, top_k):
+            tokens = self.chunks[index]["tokens"]
+            if index in pinned or used + tokens > token_budget:
+                continue
+            retrieved.append(index)
+            used += tokens
+        return "\n".join(self.chunks[index]["text"] for index in pinned + sorted(retrieved))
@@ -0,0 +1,117 @@
+import json
+import math
+import datetime
+from collections import Counter
+
+from retrieval import tokenize, json_to_string
+from transcript import get_transcript_writer
+
+# Local topic routing: scores the user's text against each mapping entry's description
+# and keywords mined from its topic file, so the LLM router (interpret_state) is only
+# needed when the local decision is not confident.
+
+# Number of distinctive keywords mined from each topic file
+KEYWORDS_PER_TOPIC = 40
+
+# Weight of the topic name and description terms relative to mined keywords
+NAME_WEIGHT = 4
+DESCRIPTION_WEIGHT = 3
+
+
+class TopicRouter:
+    # keywords: mined keywords per topic computed ahead of time (see knowledge_pack.py);
+    # by default they are mined from the topic files
+    def __init__(self, json_files, stop_words=frozenset(), k1=1.2, b=0.5, keywords=None):
+        self.json_files = json_files
+        self.stop_words = stop_words
+        self.k1 = k1
+        self.b = b
+
+        # Term counts per topic document: name + description, plus mined keywords
+        topic_terms = {}
+        for key, info in json_files.items():
+            terms = Counter()
+            for term in tokenize(key, stop_words):
+                terms[term] += NAME_WEIGHT
+            for term in tokenize(info.get('description', ''), stop_words):
+                terms[term] += DESCRIPTION_WEIGHT
+            topic_terms[key] = terms
+
+        if keywords is None:
+            keywords = self.mine_keywords()
+        for key, topic_keywords in keywords.items():
+            for term in topic_keywords:
+                if key in topic_terms:
+                    topic_terms[key][term] += 1
+
+        self.topic_terms = topic_terms
+        self.document_frequency = Counter()
+        for terms in topic_terms.values():
+            self.document_frequency.update(terms.keys())
+        self.lengths = {key: sum(terms.values()) for key, terms in topic_terms.items()}
+        self.average_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+
+    # Terms that are frequent in one topic file and rare in the others (TF-IDF across topics)
+    def mine_keywords(self):
+        counts = {}
+        for key, info in self.json_files.items():
+            try:
+                with open(info['path'], 'r', encoding='utf-8') as file:
+                    counts[key] = Counter(tokenize(json_to_string(json.load(file)), self.stop_words))
+            except (OSError, KeyError, json.JSONDecodeError):
+                continue  # Topics whose file can't be read are routed by description only
+
+        document_frequency = Counter()
+        for terms in counts.values():
+            document_frequency.update(terms.keys())
+
+        keywords = {}
+        for key, terms in counts.items():
+            total = sum(terms.values()) or 1
+            weighted = {
+                term: (count / total) * (len(counts) / document_frequency[term])
+                for term, count in terms.items()
+                if len(term) > 1 and (not term.isdigit() or document_frequency[term] == 1)
+            }
+            keywords[key] = sorted(weighted, key=weighted.get, reverse=True)[:KEYWORDS_PER_TOPIC]
+        return keywords
+
+    def score(self, text):
+        count = len(self.topic_terms)
+        query_terms = set(tokenize(text, self.stop_words))
+        scores = {}
+        for key, terms in self.topic_terms.items():
+            total = 0.0
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[key] / (self.average_length or 1))
+            for term in query_terms:
+                frequency = terms.get(term)
+                if frequency:
+                    df = self.document_frequency[term]
+                    idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                    total += idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+            scores[key] = total
+        return scores
+
+    # Best topic key and a confidence in [0, 1] based on how far it is ahead of the runner-up
+    def route(self, text, min_score=1.0):
+        scores = self.score(text)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < min_score:
+            return 'default', 0.0, scores
+        best_key, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return best_key, (best_score - runner_up) / best_score, scores
+
+
+# Append one routing decision to a JSONL log for comparing local routing against the LLM.
+# Records go through the log's background writer, so the prompt never waits on the disk.
+def log_routing_decision(log_path, text, local_choice, confidence, method, llm_choice=None):
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "text": text,
+        "local_choice": local_choice,
+        "confidence": round(confidence, 3),
+        "method": method,
+        "llm_choice": llm_choice,
+    }
+    get_transcript_writer(log_path).write(json.dumps(record, ensure_ascii=False) + "\n")
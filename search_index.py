@@ -0,0 +1,319 @@
+import os
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+
+from retrieval import tokenize, load_stop_words, TOKEN_PATTERN, NIQQUD_PATTERN
+
+# Full-text search over all conversations for the admin panel. User messages, AI answers
+# and admin comments are tokenized like topic retrieval does (prefix letters stripped,
+# heb_stopwords.txt dropped) and added to an SQLite FTS5 inverted index in the store's
+# database, next to a table with each document's session, message and filter fields.
+# Interactions and comments are never edited, so update() only indexes rows above the
+# last indexed ids and costs one read when nothing is new. The app keeps the index up to
+# date in a background thread (index_in_background), so a search only reads what is
+# already indexed. Compaction updates the index before sessions leave the live tables,
+# so archived conversations stay searchable.
+
+logger = logging.getLogger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+STOP_WORDS_FILE = os.path.join(script_dir, 'doc', 'heb_stopwords.txt')
+
+# Characters of each message kept for result snippets
+SEARCH_TEXT_CHARS = 1000
+SNIPPET_CHARS = 160
+
+# Seconds between checks for messages written by other processes
+SEARCH_INDEX_INTERVAL = float(os.getenv("SEARCH_INDEX_INTERVAL", 5))
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_terms USING fts5(
+    terms, content='', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS search_docs (
+    doc INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    interaction_id INTEGER NOT NULL,
+    comment_id INTEGER,
+    user TEXT,
+    timestamp TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_search_docs_timestamp ON search_docs (timestamp);
+"""
+
+LAST_INTERACTION_KEY = "search:last_interaction_id"
+LAST_COMMENT_KEY = "search:last_comment_id"
+
+
+class SearchIndex:
+    def __init__(self, db_path, stop_words=frozenset()):
+        self.db_path = db_path
+        self.stop_words = stop_words
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _mark(conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row["value"]) if row else None
+
+    # A row for search_docs and its terms, or None for a text with no terms
+    def _document(self, kind, session_id, interaction_id, comment_id, user, timestamp, text):
+        terms = tokenize(text, self.stop_words)
+        if not terms:
+            return None
+        return (kind, session_id, interaction_id, comment_id, user, timestamp, text[:SEARCH_TEXT_CHARS]), " ".join(terms)
+
+    def _interaction_documents(self, interaction):
+        if interaction["message"]:
+            yield self._document('user', interaction["session_id"], interaction["id"], None,
+                                 interaction["user"], interaction["timestamp"], interaction["message"])
+        if interaction["ai_message"]:
+            yield self._document('ai', interaction["session_id"], interaction["id"], None,
+                                 interaction["user"], interaction["ai_timestamp"], interaction["ai_message"])
+
+    def _comment_documents(self, comment):
+        if comment["message"]:
+            yield self._document('comment', comment["session_id"], comment["interaction_id"], comment["id"],
+                                 comment["session_user"], comment["timestamp"], comment["message"])
+
+    # Sessions archived before the index existed are read back from their segments in archive_dir once
+    def _archived_documents(self, conn, archive_dir=None):
+        if conn.execute("SELECT name FROM sqlite_master WHERE name = 'archived_sessions'").fetchone() is None:
+            return
+        import archive  # Imported here; archive updates this index before compaction
+        for part in conn.execute("SELECT * FROM archived_sessions").fetchall():
+            path = os.path.join(archive_dir or archive.ARCHIVE_DIR, part["segment"])
+            try:
+                interactions = archive._read_member(path, part["offset"], part["length"])["interactions"]
+            except OSError:
+                continue
+            for interaction in interactions:
+                ai = interaction.get("ai") or {}
+                yield from self._interaction_documents({
+                    "id": interaction["id"], "session_id": interaction["session_id"], "user": interaction["user"],
+                    "message": interaction["message"], "timestamp": interaction["timestamp"],
+                    "ai_message": ai.get("message"), "ai_timestamp": ai.get("timestamp"),
+                })
+                for comment in interaction.get("comments", []):
+                    yield from self._comment_documents(dict(comment, session_id=interaction["session_id"],
+                                                            interaction_id=interaction["id"],
+                                                            session_user=interaction["user"]))
+
+    # Index interactions and comments written since the last update; returns how many rows were read.
+    # archive_dir is where compaction writes its segments (archive.ARCHIVE_DIR by default). Rows
+    # are read and tokenized without the write lock, which is only taken to insert a batch, so
+    # building the index of a large store doesn't hold up the users' writes.
+    def update(self, batch_size=1000, archive_dir=None):
+        conn = self._connect()
+        indexed = 0
+        while True:
+            last_interaction = self._mark(conn, LAST_INTERACTION_KEY)
+            last_comment = self._mark(conn, LAST_COMMENT_KEY) or 0
+            documents = [] if last_interaction is not None else list(self._archived_documents(conn, archive_dir))
+            interactions = conn.execute(
+                "SELECT id, session_id, user, message, timestamp, ai_message, ai_timestamp FROM interactions"
+                " WHERE id > ? ORDER BY id LIMIT ?", (last_interaction or 0, batch_size)
+            ).fetchall()
+            comments = conn.execute(
+                "SELECT c.id, c.session_id, c.interaction_id, c.message, c.timestamp, i.user AS session_user"
+                " FROM comments c LEFT JOIN interactions i ON i.id = c.interaction_id"
+                " WHERE c.id > ? ORDER BY c.id LIMIT ?", (last_comment, batch_size)
+            ).fetchall()
+            # Most calls find nothing new
+            if last_interaction is not None and not interactions and not comments:
+                return indexed
+            for interaction in interactions:
+                documents.extend(self._interaction_documents(interaction))
+            for comment in comments:
+                documents.extend(self._comment_documents(comment))
+
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if (self._mark(conn, LAST_INTERACTION_KEY) != last_interaction
+                        or (self._mark(conn, LAST_COMMENT_KEY) or 0) != last_comment):
+                    continue  # Another process indexed these rows meanwhile
+                for row, terms in filter(None, documents):
+                    cursor = conn.execute(
+                        "INSERT INTO search_docs (kind, session_id, interaction_id, comment_id, user, timestamp, text)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)", row
+                    )
+                    conn.execute("INSERT INTO search_terms (rowid, terms) VALUES (?, ?)", (cursor.lastrowid, terms))
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?), (?, ?)",
+                    (LAST_INTERACTION_KEY, str(interactions[-1]["id"] if interactions else last_interaction or 0),
+                     LAST_COMMENT_KEY, str(comments[-1]["id"] if comments else last_comment))
+                )
+            indexed += len(interactions) + len(comments)
+            if len(interactions) < batch_size and len(comments) < batch_size:
+                return indexed
+
+    # Terms of each query word: the word as written and without its prefix letter (stop words dropped)
+    def query_terms(self, query):
+        groups = []
+        for word in TOKEN_PATTERN.findall(NIQQUD_PATTERN.sub('', query.lower())):
+            variants = list(dict.fromkeys(tokenize(word, self.stop_words)))
+            if variants:
+                groups.append(variants)
+        return groups
+
+    # Matching messages, most recently indexed first; the FTS index walks its postings in that
+    # order and stops at the limit, so common words cost no more than rare ones. user matches the session's user name (substring),
+    # since/until are ISO strings (until exclusive), admin_involved=True/False filters by
+    # whether an admin took part in the session.
+    def search(self, query, user=None, since=None, until=None, admin_involved=None, limit=50):
+        groups = self.query_terms(query)
+        if not groups:
+            return []
+        # Every word of the query must match
+        expression = " AND ".join("(" + " OR ".join(f'"{term}"' for term in group) + ")" for group in groups)
+        conditions = ["search_terms MATCH ?"]
+        params = [expression]
+        if user:
+            conditions.append("d.user LIKE ?")
+            params.append(f"%{user.strip()}%")
+        if since:
+            conditions.append("d.timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("d.timestamp < ?")
+            params.append(until)
+        if admin_involved is not None:
+            conditions.append(
+                f"d.session_id {'IN' if admin_involved else 'NOT IN'} (SELECT session_id FROM sessions"
+                " WHERE admin_involved = 1 UNION SELECT session_id FROM archived_sessions WHERE admin_involved = 1)"
+            )
+        params.append(limit)
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT d.* FROM search_terms JOIN search_docs d ON d.doc = search_terms.rowid"
+            f" WHERE {' AND '.join(conditions)} ORDER BY search_terms.rowid DESC LIMIT ?",
+            params
+        ).fetchall()
+        if not rows:
+            return []
+
+        session_ids = list({row["session_id"] for row in rows})
+        live = {
+            row["session_id"] for row in conn.execute(
+                f"SELECT session_id FROM sessions WHERE session_id IN ({', '.join('?' for _ in session_ids)})",
+                session_ids
+            )
+        }
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["archived"] = row["session_id"] not in live
+            result["snippet"] = snippet(row["text"] or "", [term for group in groups for term in group])
+            results.append(result)
+        return results
+
+
+# Part of the text around the first query term found in it
+def snippet(text, terms, width=SNIPPET_CHARS):
+    lowered = text.lower()
+    positions = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    excerpt = text[start:start + width].replace("\n", " ")
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + width < len(text) else "")
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# Process-wide search index per database file
+def get_index(db_path, stop_words_path=STOP_WORDS_FILE):
+    with _indexes_lock:
+        if db_path not in _indexes:
+            stop_words = load_stop_words(stop_words_path) if os.path.exists(stop_words_path) else frozenset()
+            _indexes[db_path] = SearchIndex(db_path, stop_words)
+        return _indexes[db_path]
+
+
+# Indexes a store's new messages in a daemon thread: right after this process's writes (as a
+# store listener) and every interval seconds for the writes of other processes
+class BackgroundIndexer:
+    def __init__(self, store, index, interval=SEARCH_INDEX_INTERVAL):
+        self.index = index
+        self.interval = interval
+        self._pending = threading.Event()
+        self._pending.set()  # Catch up with whatever was written before the process started
+
+        store.add_listener(lambda changes: self._pending.set())
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._pending.wait(self.interval)
+            self._pending.clear()
+            try:
+                self.index.update()
+            except Exception:
+                logger.exception("Search indexing failed")
+
+
+_indexers = {}
+_indexers_lock = threading.Lock()
+
+
+# Start keeping the search index of the store up to date (once per store)
+def index_in_background(store):
+    with _indexers_lock:
+        if id(store) not in _indexers:
+            _indexers[id(store)] = BackgroundIndexer(store, get_index(store.db_path))
+        return _indexers[id(store)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the conversation search index")
+    parser.add_argument('--db', default=os.getenv("INTERACTIONS_DB_PATH", os.path.join(script_dir, 'doc', 'interactions.db')))
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help="index messages written since the last update")
+    update_parser.add_argument('--archive-dir', help="segments of sessions archived before the index existed")
+    query_parser = commands.add_parser('query', help="search all conversations")
+    query_parser.add_argument('query')
+    query_parser.add_argument('--user')
+    query_parser.add_argument('--since')
+    query_parser.add_argument('--until')
+    query_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    from interaction_store import get_store
+    get_store(args.db)  # Creates the store's tables in a new database
+    index = get_index(args.db)
+    started = time.perf_counter()
+    if args.command == 'update':
+        count = index.update(archive_dir=args.archive_dir)
+        print(f"Indexed {count} messages in {time.perf_counter() - started:.2f} s")
+        return
+    results = index.search(args.query, user=args.user, since=args.since, until=args.until, limit=args.limit)
+    elapsed = time.perf_counter() - started
+    for result in results:
+        archived = " (archived)" if result["archived"] else ""
+        print(f"{result['timestamp']}\t{result['session_id']}{archived}\t{result['kind']}\t{result['snippet']}")
+    print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+
+from conversation_memory import ConversationMemory
+
+# Shared store for per-user conversation state, so that any Streamlit replica can serve
+# any user's rerun. A user's fields are restored from the store at the start of a run and
+# written back at the end (only if they changed), keyed by the conversation's session id,
+# which the browser keeps in the page URL. Backends are chosen by URL:
+#   sqlite:///path/to/sessions.db   one host, several processes (SQLite file locking)
+#   memory://                        this process only (single replica, tests)
+#   redis://host:6379/0              any client with Redis-style get/set(ex=) semantics
+# Other networked stores plug in through register_backend().
+
+SESSION_STATE_TTL = int(os.getenv("SESSION_STATE_TTL", 7 * 24 * 3600))
+
+# URL query parameter holding the conversation's session id
+SESSION_QUERY_PARAM = "session"
+
+
+def _encode(value):
+    if isinstance(value, ConversationMemory):
+        return {"__memory__": value.to_dict()}
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"Cannot store {type(value).__name__} in shared session state")
+
+
+def _decode(value):
+    if "__memory__" in value:
+        return ConversationMemory.from_dict(value["__memory__"])
+    if "__datetime__" in value:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    return value
+
+
+def dumps(state):
+    return json.dumps(state, ensure_ascii=False, sort_keys=True, default=_encode)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class SQLiteSessionBackend:
+    def __init__(self, db_path, ttl=SESSION_STATE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_purge = 0.0
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_sessions ("
+            " key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_updated ON user_sessions (updated_at)")
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT state FROM user_sessions WHERE key = ? AND updated_at >= ?", (key, time.time() - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, text):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT INTO user_sessions (key, state, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (key, text, now)
+            )
+            # Expired conversations are dropped at most once an hour
+            if now - self._last_purge > 3600:
+                self._last_purge = now
+                conn.execute("DELETE FROM user_sessions WHERE updated_at < ?", (now - self.ttl,))
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM user_sessions WHERE key = ?", (key,))
+
+
+# Local stand-in for a networked key-value store (same get/set(ex=)/delete calls as a Redis client)
+class LocalKeyValueClient:
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._values.pop(key, None) is not None else 0
+
+
+class KeyValueSessionBackend:
+    def __init__(self, client, prefix="session-state:", ttl=SESSION_STATE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, text):
+        self.client.set(self.prefix + key, text, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def _redis_backend(url):
+    import redis  # Optional; only needed for redis:// URLs
+    return KeyValueSessionBackend(redis.Redis.from_url(url))
+
+
+_backend_factories = {
+    "sqlite": lambda url: SQLiteSessionBackend(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite://"):]),
+    "memory": lambda url: KeyValueSessionBackend(LocalKeyValueClient()),
+    "redis": _redis_backend,
+    "rediss": _redis_backend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(scheme, factory):
+    _backend_factories[scheme] = factory
+
+
+# Process-wide backend for a store URL
+def get_backend(url):
+    with _backends_lock:
+        if url not in _backends:
+            scheme = url.split("://", 1)[0]
+            if scheme not in _backend_factories:
+                raise ValueError(f"Unknown session store '{scheme}' in {url}")
+            _backends[url] = _backend_factories[scheme](url)
+        return _backends[url]
+
+
+class SharedSessionState:
+    # Key in st.session_state holding the stored text this session last read or wrote
+    SNAPSHOT_KEY = "_shared_state_snapshot"
+
+    def __init__(self, backend, fields):
+        self.backend = backend
+        self.fields = tuple(fields)
+
+    # Owner recorded with the state stored under key, or None if nothing is stored
+    def stored_owner(self, key):
+        text = self.backend.get(key)
+        return None if text is None else loads(text).get("owner")
+
+    # Bring st.session_state up to date with the store. Returns False if the key holds another
+    # user's conversation. If the stored text is what this session wrote last, the local
+    # objects are kept as they are. Nothing stored counts as success, so a key taken from
+    # outside the session (the URL) must be checked with stored_owner first.
+    def restore(self, session_state, key, owner):
+        text = self.backend.get(key)
+        if text is None or text == session_state.get(self.SNAPSHOT_KEY):
+            return True
+        state = loads(text)
+        if state.get("owner") != owner:
+            return False
+        for field in self.fields:
+            if field in state:
+                session_state[field] = state[field]
+        session_state[self.SNAPSHOT_KEY] = text
+        return True
+
+    # Write the fields back if they changed during the run
+    def persist(self, session_state, key, owner):
+        state = {field: session_state[field] for field in self.fields if field in session_state}
+        state["owner"] = owner
+        text = dumps(state)
+        if text != session_state.get(self.SNAPSHOT_KEY):
+            self.backend.set(key, text)
+            session_state[self.SNAPSHOT_KEY] = text
@@ -0,0 +1,69 @@
+import os
+import re
+import time
+import threading
+
+# Renders a streamed answer into a Streamlit placeholder without re-sending the whole
+# text for every token. Deltas are collected in a list and the placeholder is updated
+# at most every FLUSH_INTERVAL seconds, or as soon as a sentence ends; finish() always
+# renders the exact final text. Render counts and bytes sent are kept per renderer and
+# per process so the saving can be measured.
+
+FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", 0.05))
+
+SENTENCE_END = re.compile(r'[.!?:\n]\s*$')
+
+_totals = {"streams": 0, "renders": 0, "bytes_sent": 0, "deltas": 0}
+_totals_lock = threading.Lock()
+
+
+class ThrottledRenderer:
+    def __init__(self, placeholder, flush_interval=FLUSH_INTERVAL):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self._parts = []
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.deltas = 0
+        self.renders = 0
+        self.bytes_sent = 0
+
+    @property
+    def text(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def add(self, delta):
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._dirty = True
+        self.deltas += 1
+        if SENTENCE_END.search(delta) or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        text = self.text
+        self.placeholder.markdown(text)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.renders += 1
+        self.bytes_sent += len(text.encode('utf-8'))
+
+    # Render whatever is still pending and return the full text
+    def finish(self):
+        self.flush()
+        with _totals_lock:
+            _totals["streams"] += 1
+            _totals["renders"] += self.renders
+            _totals["bytes_sent"] += self.bytes_sent
+            _totals["deltas"] += self.deltas
+        return self.text
+
+
+def stats():
+    with _totals_lock:
+        return dict(_totals)
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Spans of the app aren't exported to doc/traces.jsonl during the tests
+os.environ.setdefault("TRACING", "0")
+
+APP_PATH = os.path.join(ROOT, 'id.py')
+
+
+# id.py under Streamlit's AppTest, with every file the app writes kept in tmp_path. Yields a
+# factory returning an app signed in as the given user (see auth.login); the users are
+# admin ("Admin User") and user0, user1, ... ("משתמש 0", ...).
+@pytest.fixture
+def app_factory(tmp_path, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.load_test import write_credentials
+    import auth
+
+    credentials_path = str(tmp_path / "credentials.yaml")
+    write_credentials(credentials_path, 3)
+    for name, value in {
+        "CREDENTIALS_PATH": credentials_path,
+        "INTERACTIONS_DB_PATH": str(tmp_path / "interactions.db"),
+        "E_JSON_PATH": str(tmp_path / "e.json"),
+        "TRANSCRIPT_PATH": str(tmp_path / "inputs_and_outputs"),
+        "ROUTING_LOG_PATH": str(tmp_path / "routing_log.jsonl"),
+        "SESSION_STORE_URL": f"sqlite:///{tmp_path / 'sessions.db'}",
+        "KNOWLEDGE_PACK_PATH": str(tmp_path / "knowledge.pack"),
+        "OPENAI_API_KEY": "test",
+    }.items():
+        monkeypatch.setenv(name, value)
+
+    def new_app(username, name):
+        app = AppTest.from_file(APP_PATH, default_timeout=60)
+        app.session_state["auth_token"] = auth.issue_session_token(username, name, credentials_path)
+        return app
+
+    new_app.db_path = str(tmp_path / "interactions.db")
+    return new_app
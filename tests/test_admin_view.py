@@ -0,0 +1,75 @@
+from archive import SegmentWriter
+from conversation_view import SESSIONS_PER_PAGE
+from interaction_store import get_store
+
+LOAD_OLDER = "טען הודעות קודמות"
+
+
+def rendered_messages(app):
+    return sum(element.value.count("class='message user'") for element in app.markdown)
+
+
+def labelled(app, label):
+    return [button for button in app.button if button.label == label]
+
+
+def test_admin_loads_older_messages_a_page_at_a_time(app_factory):
+    store = get_store(app_factory.db_path)
+    for number in range(40):
+        store.append_interaction("user01", "משתמש 0", f"question {number}", ai_message=f"answer {number}",
+                                 timestamp=f"2024-01-01T10:{number:02d}:00")
+    app = app_factory("admin", "Admin User")
+    app.run()
+    assert not app.exception
+    assert rendered_messages(app) == 30
+    app = labelled(app, LOAD_OLDER)[0].click().run()
+    assert not app.exception
+    assert rendered_messages(app) == 40
+    assert labelled(app, LOAD_OLDER) == []
+
+
+def session_buttons(app):
+    return [button for button in app.button if button.key.startswith("session_")]
+
+
+def archived_buttons(app):
+    return [button for button in app.button if button.key.startswith("archived_")]
+
+
+def test_admin_pages_through_the_archive(app_factory, tmp_path):
+    store = get_store(app_factory.db_path)
+    session_ids = [f"user01-{number:02d}" for number in range(SESSIONS_PER_PAGE + 5)]
+    for session_id in session_ids:
+        store.append_interaction(session_id, "משתמש 0", "question", timestamp="2024-01-01T10:00:00",
+                                 new_user_message=False)
+    writer = SegmentWriter(str(tmp_path / "archive"))
+    assert len(store.archive_sessions(session_ids, "2024-02-01", writer)) == len(session_ids)
+    writer.close()
+
+    app = app_factory("admin", "Admin User")
+    app.run()
+    app = app.sidebar.radio(key="sessions_view").set_value("ארכיון").run()
+    assert not app.exception
+    assert len(archived_buttons(app)) == SESSIONS_PER_PAGE
+    app = app.button(key="archive_next_page").click().run()
+    assert not app.exception
+    assert len(archived_buttons(app)) == 5
+    app = app.button(key="archive_previous_page").click().run()
+    assert not app.exception
+    assert len(archived_buttons(app)) == SESSIONS_PER_PAGE
+
+
+def test_admin_pages_through_the_sessions(app_factory):
+    store = get_store(app_factory.db_path)
+    for number in range(SESSIONS_PER_PAGE + 5):
+        store.append_interaction(f"user01-{number:02d}", "משתמש 0", "question",
+                                 timestamp=f"2024-01-01T10:{number % 60:02d}:00")
+    app = app_factory("admin", "Admin User")
+    app.run()
+    assert len(session_buttons(app)) == SESSIONS_PER_PAGE
+    app = app.button(key="sessions_next_page").click().run()
+    assert not app.exception
+    assert len(session_buttons(app)) == 5
+    app = app.button(key="sessions_previous_page").click().run()
+    assert not app.exception
+    assert len(session_buttons(app)) == SESSIONS_PER_PAGE
@@ -0,0 +1,44 @@
+import os
+
+import archive
+from archive import SegmentWriter
+from interaction_store import InteractionStore
+from search_index import SearchIndex
+
+
+def test_writers_sharing_a_segment_record_correct_offsets(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+    # Two writers stand in for two processes compacting at once; both keep their files open
+    first = SegmentWriter(archive_dir)
+    second = SegmentWriter(archive_dir)
+    locations = {}
+    for number in range(6):
+        writer = first if number % 2 == 0 else second
+        summary = {"session_id": f"s{number}", "last_timestamp": "2024-01-05T10:00:00"}
+        records = [{"id": number, "message": "x" * (number * 50)}]
+        locations[f"s{number}"] = writer.append(summary, records)
+    first.sync()
+    second.sync()
+    first.close()
+    second.close()
+
+    for session_id, (segment, offset, length) in locations.items():
+        assert segment == "2024-01.jsonl.gz"
+        member = archive._read_member(os.path.join(archive_dir, segment), offset, length)
+        assert member["session_id"] == session_id
+
+
+def test_sessions_archived_before_the_index_are_read_from_the_given_dir(tmp_path):
+    db_path = str(tmp_path / "interactions.db")
+    archive_dir = str(tmp_path / "custom-archive")
+    store = InteractionStore(db_path)
+    store.append_interaction("s1", "dana", "where is the parking form", timestamp="2024-01-01T10:00:00",
+                             new_user_message=False)
+    writer = SegmentWriter(archive_dir)
+    assert store.archive_sessions(["s1"], "2024-02-01", writer) == ["s1"]
+    writer.close()
+
+    index = SearchIndex(db_path)
+    index.update(archive_dir=archive_dir)
+    results = index.search("parking")
+    assert [(result["session_id"], result["archived"]) for result in results] == [("s1", True)]
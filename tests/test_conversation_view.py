@@ -0,0 +1,93 @@
+import pytest
+
+import conversation_view
+from benchmarks.stubs import SessionState
+from interaction_store import InteractionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return InteractionStore(str(tmp_path / "interactions.db"))
+
+
+def test_follow_changes_reads_only_new_changes(store):
+    store.append_interaction("s1", "dana", "question", timestamp="2024-01-01T10:00:00")
+    state = SessionState()
+    assert conversation_view.follow_changes(store, state) == 0
+    assert state.unread_sessions == {"s1"}
+
+    store.append_interaction("s2", "noa", "question", timestamp="2024-01-02T10:00:00")
+    store.clear_new_user_message("s1")
+    assert conversation_view.follow_changes(store, state) == 2
+    assert state.unread_sessions == {"s2"}
+    assert conversation_view.follow_changes(store, state) == 0
+
+
+def test_sidebar_pages_are_reused_until_the_feed_moves(store):
+    store.append_interaction("s1", "dana", "question", timestamp="2024-01-01T10:00:00")
+    state = SessionState()
+    conversation_view.follow_changes(store, state)
+    page = conversation_view.sidebar_page(store, state, "", None, None, 0)
+    assert [session["session_id"] for session in page] == ["s1"]
+
+    # Without following the feed the cached page is served
+    store.append_interaction("s2", "noa", "question", timestamp="2024-01-02T10:00:00")
+    assert conversation_view.sidebar_page(store, state, "", None, None, 0) is page
+    conversation_view.follow_changes(store, state)
+    page = conversation_view.sidebar_page(store, state, "", None, None, 0)
+    assert [session["session_id"] for session in page] == ["s2", "s1"]
+
+
+def test_archived_sessions_are_no_longer_unread(store):
+    store.append_interaction("s1", "dana", "question", timestamp="2024-01-01T10:00:00", new_user_message=False)
+    state = SessionState()
+    conversation_view.follow_changes(store, state)
+    state.unread_sessions.add("s1")  # Read in another process after this state was loaded
+
+    class NullWriter:
+        def append(self, summary, records):
+            return "2024-01.jsonl.gz", 0, 0
+
+        def sync(self):
+            pass
+
+    assert store.archive_sessions(["s1"], "2024-02-01", NullWriter()) == ["s1"]
+    conversation_view.follow_changes(store, state)
+    assert state.unread_sessions == set()
+
+
+def test_newly_unread_sessions_are_reported_once(store):
+    state = SessionState()
+    conversation_view.follow_changes(store, state)
+    store.append_interaction("s1", "dana", "question")
+    conversation_view.follow_changes(store, state)
+    assert conversation_view.newly_unread_sessions(state) == {"s1"}
+    assert conversation_view.newly_unread_sessions(state) == set()
+
+
+def test_take_admin_comments_acknowledges_the_session_batch(store):
+    store.append_interaction("s1", "dana", "question")
+    store.append_interaction("s2", "noa", "question")
+    store.add_admin_comment("s1", "first")
+    store.add_admin_comment("s1", "second")
+    store.add_admin_comment("s2", "for noa")
+    assert conversation_view.take_admin_comments(store, "s1") == ["first", "second"]
+    assert conversation_view.take_admin_comments(store, "s1") == []
+    # Other sessions' comments stay pending
+    assert conversation_view.take_admin_comments(store, "s2") == ["for noa"]
+
+
+def test_comment_posted_during_a_poll_is_delivered_by_the_next(store, monkeypatch):
+    store.append_interaction("s1", "dana", "question")
+    store.add_admin_comment("s1", "first")
+    read_pending = store.pending_admin_comments
+
+    def pending_then_comment(session_id):
+        pending = read_pending(session_id)
+        store.add_admin_comment(session_id, "posted meanwhile")
+        return pending
+
+    monkeypatch.setattr(store, "pending_admin_comments", pending_then_comment)
+    assert conversation_view.take_admin_comments(store, "s1") == ["first"]
+    monkeypatch.undo()
+    assert conversation_view.take_admin_comments(store, "s1") == ["posted meanwhile"]
@@ -0,0 +1,79 @@
+import time
+
+from interaction_store import InteractionStore
+from event_bus import EventBus, StoreEventPublisher, session_topic
+from conversation_view import USER_WAKE_KINDS, record_exchange
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_local_and_other_process_changes_are_published_once(tmp_path):
+    db_path = str(tmp_path / "interactions.db")
+    store = InteractionStore(db_path)
+    bus = EventBus()
+    received = []
+    bus.subscribe(session_topic("s1"), "tab", lambda change: received.append(change["seq"]))
+    publisher = StoreEventPublisher(store, bus, interval=0.02)
+
+    store.append_interaction("s1", "dana", "local write")
+    # A second store on the same file stands in for another process
+    InteractionStore(db_path).append_interaction("s1", "dana", "remote write")
+    assert wait_for(lambda: len(received) == 2)
+    time.sleep(0.1)
+    assert sorted(received) == sorted(set(received))
+    # Every published seq has been read back from the feed, so nothing is kept
+    assert wait_for(lambda: not publisher._published)
+
+
+def test_failing_subscriber_does_not_stop_others():
+    bus = EventBus()
+    received = []
+
+    def broken(payload):
+        raise RuntimeError("subscriber bug")
+
+    bus.subscribe("topic", "broken", broken)
+    bus.subscribe("topic", "working", received.append)
+    bus.publish("topic", "payload")
+    assert received == ["payload"]
+
+
+def test_user_tab_wakes_when_the_admin_hands_back_to_the_ai(tmp_path):
+    store = InteractionStore(str(tmp_path / "interactions.db"))
+    bus = EventBus()
+    woken = []
+    bus.subscribe(session_topic("s1"), "tab",
+                  lambda change: change["kind"] in USER_WAKE_KINDS and woken.append(change["kind"]))
+    StoreEventPublisher(store, bus, interval=0.02)
+
+    record_exchange(store, "question", "answer", "s1", "dana")
+    store.add_admin_comment("s1", "the admin joins")
+    assert store.is_admin_involved("s1")
+    # Seeing the message in the admin panel is no reason to rerun the user's tab
+    store.clear_new_user_message("s1")
+    assert woken == ['comment_added']
+
+    # "חזור ל-AI"
+    store.set_admin_involved("s1", False)
+    assert woken == ['comment_added', 'admin_involvement_changed']
+    # A message sent from a tab still showing the admin mode doesn't take the conversation back
+    record_exchange(store, "are you there?", "", "s1", "dana", role="admin")
+    assert not store.is_admin_involved("s1")
+
+
+def test_prune_drops_subscriptions_of_closed_tabs():
+    bus = EventBus()
+    bus.subscribe("session:s1", "open tab", lambda change: None)
+    bus.subscribe("session:s2", "closed tab", lambda change: None)
+    bus.subscribe("sessions", "closed tab", lambda change: None)
+    assert bus.prune(lambda key: key == "open tab", min_interval=60) == 2
+    assert bus.subscriber_count() == 1
+    # Within the interval nothing is checked again
+    bus.subscribe("session:s3", "closed tab", lambda change: None)
+    assert bus.prune(lambda key: False, min_interval=60) == 0
+    assert bus.subscriber_count() == 2
@@ -0,0 +1,278 @@
+import json
+import shutil
+import threading
+
+import pytest
+
+from interaction_store import InteractionStore
+
+
+LEGACY_INTERACTIONS = [
+    [
+        {"session_id": "s1", "user": "dana", "message": "שלום", "timestamp": "2024-01-01T10:00:00",
+         "ai": {"message": "hello", "timestamp": "2024-01-01T10:00:05"}, "new_user_message": True,
+         "comments": [{"user": "Admin", "message": "checked", "timestamp": "2024-01-01T11:00:00",
+                       "comment_displayed": False}]},
+        {"session_id": "s1", "user": "dana", "message": "again", "timestamp": "2024-01-01T10:01:00",
+         "ai": {"message": "reply", "timestamp": "2024-01-01T10:01:05"}},
+    ],
+    [
+        {"session_id": "s2", "user": "noa", "message": "hi", "timestamp": "2024-01-02T09:00:00", "ai": None},
+    ],
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return InteractionStore(str(tmp_path / "interactions.db"))
+
+
+@pytest.fixture
+def legacy_json(tmp_path):
+    path = tmp_path / "e.json"
+    path.write_text(json.dumps(LEGACY_INTERACTIONS, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_migrate_imports_interactions_and_comments(store, legacy_json):
+    assert store.migrate_from_json(legacy_json) == 3
+    records = store.get_session_interactions("s1")
+    assert [record["message"] for record in records] == ["שלום", "again"]
+    assert records[0]["ai"]["message"] == "hello"
+    assert records[0]["comments"][0]["message"] == "checked"
+    assert [comment["message"] for comment in store.pending_admin_comments("s1")] == ["checked"]
+    summaries = {session["session_id"]: session for session in store.list_sessions()}
+    assert summaries["s1"]["message_count"] == 2
+    assert summaries["s1"]["comment_count"] == 1
+    assert summaries["s1"]["has_new_message"] == 1
+    assert summaries["s2"]["user"] == "noa"
+
+
+def test_migrate_is_idempotent(store, legacy_json):
+    assert store.migrate_from_json(legacy_json) == 3
+    assert store.migrate_from_json(legacy_json) == 0
+    assert len(store.get_session_interactions("s1")) == 2
+
+
+def test_migrate_skips_moved_file_with_same_content(store, legacy_json, tmp_path):
+    assert store.migrate_from_json(legacy_json) == 3
+    moved = tmp_path / "moved" / "e.json"
+    moved.parent.mkdir()
+    shutil.move(legacy_json, moved)
+    assert store.migrate_from_json(str(moved)) == 0
+    assert len(store.list_sessions()) == 2
+
+
+def test_edited_file_imports_only_new_records(store, legacy_json):
+    assert store.migrate_from_json(legacy_json) == 3
+    # The old app is still writing to e.json during the rollout
+    edited = json.loads(json.dumps(LEGACY_INTERACTIONS))
+    edited[1][0]["comments"] = [{"user": "Admin", "message": "late comment", "timestamp": "2024-01-02T10:00:00"}]
+    edited[1].append({"session_id": "s2", "user": "noa", "message": "more", "timestamp": "2024-01-02T09:05:00"})
+    with open(legacy_json, 'w', encoding='utf-8') as file:
+        json.dump(edited, file, ensure_ascii=False)
+    assert store.migrate_from_json(legacy_json) == 1
+    records = store.get_session_interactions("s2")
+    assert [record["message"] for record in records] == ["hi", "more"]
+    assert [comment["message"] for comment in records[0]["comments"]] == ["late comment"]
+    assert len(store.get_session_interactions("s1")) == 2
+    assert {session["session_id"]: session["comment_count"] for session in store.list_sessions()}["s2"] == 1
+
+
+def test_invalid_json_is_not_marked_as_imported(store, legacy_json):
+    valid = open(legacy_json, encoding='utf-8').read()
+    with open(legacy_json, 'w', encoding='utf-8') as file:
+        file.write(valid[:-5])
+    assert store.migrate_from_json(legacy_json) == 0
+    with open(legacy_json, 'w', encoding='utf-8') as file:
+        file.write(valid)
+    assert store.migrate_from_json(legacy_json) == 3
+
+
+def test_migrate_missing_or_empty_file_leaves_no_marker(store, tmp_path):
+    path = tmp_path / "e.json"
+    assert store.migrate_from_json(str(path)) == 0
+    path.write_text("", encoding='utf-8')
+    assert store.migrate_from_json(str(path)) == 0
+    # Content that shows up later is still imported
+    path.write_text(json.dumps(LEGACY_INTERACTIONS), encoding='utf-8')
+    assert store.migrate_from_json(str(path)) == 3
+
+
+def test_concurrent_migrations_import_once(tmp_path, legacy_json):
+    db_path = str(tmp_path / "interactions.db")
+    InteractionStore(db_path)
+    barrier = threading.Barrier(4)
+    results = []
+
+    def migrate():
+        # A store per thread, like separate app processes sharing the database
+        migrating_store = InteractionStore(db_path)
+        barrier.wait()
+        results.append(migrating_store.migrate_from_json(legacy_json))
+
+    threads = [threading.Thread(target=migrate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [0, 0, 0, 3]
+    assert len(InteractionStore(db_path).get_session_interactions("s1")) == 2
+
+
+def test_append_and_limit(store):
+    for minute in range(5):
+        store.append_interaction("s1", "dana", f"message {minute}", ai_message=f"answer {minute}",
+                                 timestamp=f"2024-01-01T10:0{minute}:00")
+    records = store.get_session_interactions("s1", limit=2)
+    assert [record["message"] for record in records] == ["message 3", "message 4"]
+    assert records[-1]["ai"]["message"] == "answer 4"
+    assert len(store.get_session_interactions("s1")) == 5
+    assert store.get_session_interactions("missing") == []
+
+
+def test_list_sessions_orders_unread_first_and_filters(store):
+    store.append_interaction("old", "dana", "a", timestamp="2024-01-01T10:00:00")
+    store.append_interaction("new", "noa", "b", timestamp="2024-02-01T10:00:00")
+    store.clear_new_user_message("new")
+    assert [session["session_id"] for session in store.list_sessions()] == ["old", "new"]
+    assert [session["session_id"] for session in store.list_sessions(user="noa")] == ["new"]
+    assert [session["session_id"] for session in store.list_sessions(since="2024-01-15")] == ["new"]
+    assert [session["session_id"] for session in store.list_sessions(until="2024-01-15")] == ["old"]
+    assert store.unread_session_ids() == {"old"}
+
+
+def test_session_summaries_are_kept_on_write(store):
+    store.append_interaction("s1", "dana", "first", timestamp="2024-01-01T10:00:00", new_user_message=False)
+    store.append_interaction("s1", "dana", "second", timestamp="2024-01-01T10:05:00", new_user_message=False)
+    store.add_admin_comment("s1", "comment")
+    # Written out of order, e.g. by a slow process
+    store.append_interaction("s1", "dana", "late write of an earlier message", timestamp="2024-01-01T10:01:00",
+                             new_user_message=False)
+    summary = store.summarize_sessions(["s1"])[0]
+    assert (summary["user"], summary["last_timestamp"], summary["message_count"], summary["comment_count"]) == \
+        ("dana", "2024-01-01T10:05:00", 3, 1)
+    assert not summary["has_new_message"] and summary["admin_involved"]
+
+
+def test_list_sessions_pages(store):
+    for number in range(5):
+        store.append_interaction(f"s{number}", "dana", "question", timestamp=f"2024-01-0{number + 1}T10:00:00",
+                                 new_user_message=False)
+    pages = [[session["session_id"] for session in store.list_sessions(limit=2, offset=offset)]
+             for offset in (0, 2, 4)]
+    assert pages == [["s4", "s3"], ["s2", "s1"], ["s0"]]
+
+
+def test_admin_comments_pending_and_acknowledged(store):
+    assert store.add_admin_comment("s1", "nothing to attach to") is False
+    store.append_interaction("s1", "dana", "question")
+    assert store.add_admin_comment("s1", "first")
+    assert store.add_admin_comment("s1", "second")
+    assert store.is_admin_involved("s1")
+    pending = store.pending_admin_comments("s1")
+    assert [comment["message"] for comment in pending] == ["first", "second"]
+    assert store.acknowledge_comments([pending[0]["id"]]) == 1
+    assert store.acknowledge_comments([pending[0]["id"]]) == 0
+    assert [comment["message"] for comment in store.pending_admin_comments("s1")] == ["second"]
+
+
+def test_change_feed_and_listeners(store):
+    received = []
+    store.add_listener(received.extend)
+    cursor = store.latest_change_seq()
+    store.append_interaction("s1", "dana", "question")
+    store.add_admin_comment("s1", "comment")
+    store.clear_new_user_message("s1")
+    cursor, changes = store.changes_since(cursor)
+    assert [change["kind"] for change in changes] == ['interaction_added', 'comment_added', 'flags_changed']
+    assert [change["kind"] for change in received] == ['interaction_added', 'comment_added', 'flags_changed']
+    assert cursor == store.latest_change_seq()
+    assert store.changes_since(cursor) == (cursor, [])
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.sessions = []
+        self.synced = False
+
+    def append(self, summary, records):
+        self.sessions.append((summary["session_id"], records))
+        return "2024-01.jsonl.gz", len(self.sessions) * 100, 100
+
+    def sync(self):
+        self.synced = True
+
+
+def test_archive_sessions_moves_idle_sessions(store):
+    store.append_interaction("idle", "dana", "old question", timestamp="2024-01-01T10:00:00",
+                             new_user_message=False)
+    store.append_interaction("active", "noa", "recent question", timestamp="2024-03-01T10:00:00")
+    assert store.idle_session_ids("2024-02-01") == ["idle"]
+    writer = MemoryWriter()
+    assert store.archive_sessions(["idle", "active"], "2024-02-01", writer) == ["idle"]
+    assert writer.synced
+    assert [session_id for session_id, _ in writer.sessions] == ["idle"]
+    assert store.get_session_interactions("idle") == []
+    assert [session["session_id"] for session in store.list_sessions()] == ["active"]
+    archived = store.list_archived_sessions()
+    assert [(session["session_id"], session["message_count"]) for session in archived] == [("idle", 1)]
+    assert store.archived_session_parts("idle")[0]["segment"] == "2024-01.jsonl.gz"
+
+
+def test_session_written_to_while_archiving_stays_live(store):
+    store.append_interaction("idle", "dana", "old question", timestamp="2024-01-01T10:00:00",
+                             new_user_message=False)
+    store.append_interaction("quiet", "noa", "old question", timestamp="2024-01-01T10:00:00",
+                             new_user_message=False)
+
+    class WriterRacingAUser(MemoryWriter):
+        def append(self, summary, records):
+            if summary["session_id"] == "idle":
+                # The segment is written without holding the write lock, so users aren't blocked
+                store.append_interaction("idle", "dana", "a late follow-up", timestamp="2024-01-01T10:05:00",
+                                         new_user_message=False)
+            return super().append(summary, records)
+
+    writer = WriterRacingAUser()
+    assert store.archive_sessions(["idle", "quiet"], "2024-02-01", writer) == ["quiet"]
+    assert [session_id for session_id, _ in writer.sessions] == ["idle", "quiet"]
+    assert [record["message"] for record in store.get_session_interactions("idle")] == \
+        ["old question", "a late follow-up"]
+    assert [session["session_id"] for session in store.list_archived_sessions()] == ["quiet"]
+
+
+def test_failing_listener_does_not_break_the_write(store):
+    received = []
+
+    def broken(changes):
+        raise RuntimeError("listener bug")
+
+    store.add_listener(broken)
+    store.add_listener(received.extend)
+    interaction_id = store.append_interaction("s1", "dana", "question")
+    assert interaction_id
+    assert [change["kind"] for change in received] == ['interaction_added']
+    assert len(store.get_session_interactions("s1")) == 1
+
+
+def test_unread_or_uncommented_sessions_are_not_idle(store):
+    store.append_interaction("unread", "dana", "question", timestamp="2024-01-01T10:00:00")
+    store.append_interaction("pending", "noa", "question", timestamp="2024-01-01T10:00:00", new_user_message=False)
+    store.add_admin_comment("pending", "answer from the admin", timestamp="2024-01-01T11:00:00")
+    store.append_interaction("read", "tal", "question", timestamp="2024-01-01T10:00:00", new_user_message=False)
+    assert store.idle_session_ids("2024-02-01") == ["read"]
+    assert store.archive_sessions(["unread", "pending", "read"], "2024-02-01", MemoryWriter()) == ["read"]
+
+    store.clear_new_user_message("unread")
+    store.acknowledge_comments([comment["id"] for comment in store.pending_admin_comments("pending")])
+    assert sorted(store.idle_session_ids("2024-02-01")) == ["pending", "unread"]
+
+
+def test_archived_sessions_are_not_imported_again(store, legacy_json):
+    assert store.migrate_from_json(legacy_json) == 3
+    assert store.archive_sessions(["s2"], "2024-02-01", MemoryWriter()) == ["s2"]
+    with open(legacy_json, 'a', encoding='utf-8') as file:
+        file.write("\n")  # Any edit changes the content marker
+    assert store.migrate_from_json(legacy_json) == 0
+    assert store.get_session_interactions("s2") == []
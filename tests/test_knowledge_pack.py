@@ -0,0 +1,139 @@
+import os
+import json
+
+import pytest
+
+import knowledge_pack
+import topic_cache
+from knowledge_pack import KnowledgePack, PackFormatError
+
+DOC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'doc')
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+
+
+@pytest.fixture
+def doc_dir(tmp_path):
+    write_json(tmp_path / "forms.json", {
+        "role": "You help employees fill in forms.",
+        "forms": [{"name": f"form {number}", "steps": "Open the form. Fill it in. Send it."} for number in range(40)],
+    })
+    write_json(tmp_path / "default.json", {"role": "You answer general questions."})
+    write_json(tmp_path / "json_files_mapping.json", {
+        "forms": {"path": "C:\\\\topics\\\\forms.json", "description": "filling in forms"},
+        "default": {"path": "default.json", "description": "anything else"},
+    })
+    (tmp_path / "stopwords.txt").write_text("the\na\n", encoding='utf-8')
+    return tmp_path
+
+
+def build(doc_dir, budget=3000):
+    return knowledge_pack.build(str(doc_dir / "json_files_mapping.json"), str(doc_dir / "stopwords.txt"),
+                                str(doc_dir / "knowledge.pack"), budget=budget)
+
+
+def test_build_and_read_back(doc_dir):
+    report, problems = build(doc_dir)
+    assert problems == []
+    pack = KnowledgePack(str(doc_dir / "knowledge.pack"))
+    try:
+        assert set(pack.mapping) == {"forms", "default"}
+        assert "form 39" in pack.guidance_string("forms")
+        assert pack.topic_index("forms", frozenset()).search("form 12")
+    finally:
+        pack.close()
+
+
+def test_chunks_must_fit_beside_the_pinned_rules(doc_dir):
+    report, _ = build(doc_dir, budget=300)
+    forms = next(row for row in report if row["topic"] == "forms")
+    assert forms["retrieved"]
+    assert forms["over_budget"] == []
+
+    # Pinned rules taking most of the budget leave no room for the other chunks
+    write_json(doc_dir / "forms.json", {
+        "role": "Rule. " * 120,
+        "forms": [{"name": f"form {number}", "steps": "Open the form. Fill it in. Send it."} for number in range(40)],
+    })
+    report, _ = build(doc_dir, budget=300)
+    forms = next(row for row in report if row["topic"] == "forms")
+    assert forms["pinned_tokens"] <= 300
+    assert any("pinned tokens" in problem for problem in forms["over_budget"])
+
+
+@pytest.mark.parametrize("content", [b"", b"KPA", b"KPACK\x04\x00\xff\xff\x00\x00{}", b"NOTAPACKATALL"])
+def test_damaged_packs_raise_pack_format_error(tmp_path, content):
+    path = tmp_path / "knowledge.pack"
+    path.write_bytes(content)
+    with pytest.raises(PackFormatError):
+        KnowledgePack(str(path))
+
+
+def test_edited_topic_is_read_from_its_file(doc_dir):
+    build(doc_dir)
+    mapping_path = str(doc_dir / "json_files_mapping.json")
+    stop_words_path = str(doc_dir / "stopwords.txt")
+    topics = topic_cache.topics(str(doc_dir / "knowledge.pack"), mapping_path, stop_words_path)
+    assert isinstance(topics, topic_cache.PackTopics)
+    packed_version = topics.topic_version("forms")
+    # Cached answers stay valid when the same content is read from the file instead
+    assert topic_cache.SourceTopics(mapping_path, stop_words_path).topic_version("forms") == packed_version
+
+    write_json(doc_dir / "forms.json", {"role": "You help employees fill in the new forms."})
+    topics = topic_cache.topics(str(doc_dir / "knowledge.pack"), mapping_path, stop_words_path)
+    assert "new forms" in topics.guidance_string("forms")
+    assert topics.topic_version("forms") != packed_version
+    assert topics.topic_version("forms") == knowledge_pack.file_sha256(str(doc_dir / "forms.json"))
+    # Untouched topics still come from the pack
+    assert not topics._from_source("default")
+
+
+def test_rebuilt_pack_closes_the_old_one(doc_dir):
+    pack_path = str(doc_dir / "knowledge.pack")
+    build(doc_dir)
+    old = topic_cache.knowledge_pack_file(pack_path)
+    write_json(doc_dir / "default.json", {"role": "You answer general questions briefly."})
+    build(doc_dir)
+    new = topic_cache.knowledge_pack_file(pack_path)
+    assert new is not old
+    assert old.closed and not new.closed
+    new.close()
+
+
+def test_shipped_topics_fit_the_budget(tmp_path):
+    report, _ = knowledge_pack.build(os.path.join(DOC_DIR, 'json_files_mapping.json'),
+                                     os.path.join(DOC_DIR, 'heb_stopwords.txt'), str(tmp_path / "knowledge.pack"))
+    assert [row["topic"] for row in report if row["over_budget"]] == []
+
+
+def test_rebuild_leaves_the_mapped_pack_in_place(doc_dir):
+    build(doc_dir)
+    # A running app keeps its pack mapped; Windows can't replace or remove a mapped file
+    running = KnowledgePack(str(doc_dir / "knowledge.pack"))
+    write_json(doc_dir / "default.json", {"role": "You answer general questions briefly."})
+    build(doc_dir)
+    rebuilt = KnowledgePack(str(doc_dir / "knowledge.pack"))
+    try:
+        assert rebuilt.path != running.path and os.path.exists(running.path)
+        assert "briefly" not in running.guidance_string("default")
+        assert "briefly" in rebuilt.guidance_string("default")
+    finally:
+        running.close()
+        rebuilt.close()
+
+    # Packs from before the previous build are removed
+    build(doc_dir, budget=2000)
+    assert not os.path.exists(running.path)
+    assert os.path.exists(rebuilt.path)
+
+
+def test_unreadable_pack_is_reported_once(doc_dir, caplog):
+    (doc_dir / "knowledge.pack").write_bytes(b"KPACK\x01\x00")
+    mapping_path = str(doc_dir / "json_files_mapping.json")
+    for _ in range(3):
+        topics = topic_cache.topics(str(doc_dir / "knowledge.pack"), mapping_path, str(doc_dir / "stopwords.txt"))
+        assert isinstance(topics, topic_cache.SourceTopics)
+    assert [record.levelname for record in caplog.records if record.name == "topic_cache"] == ["WARNING"]
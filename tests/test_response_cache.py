@@ -0,0 +1,40 @@
+
+from interaction_store import InteractionStore
+from response_cache import ResponseCache, make_key, mentions_name
+
+
+def test_mentions_any_part_of_the_name():
+    assert mentions_name("שלום דנה, הנה התשובה", "דנה כהן")
+    assert mentions_name("Thanks, Cohen.", "Dana Cohen")
+    assert mentions_name("תודה לדנה", "דנה כהן")
+    assert not mentions_name("Here is how to fill the form.", "Dana Cohen")
+    assert not mentions_name("anything", "  ")
+
+
+def test_invalidation_is_shared_between_processes(tmp_path):
+    db_path = str(tmp_path / "interactions.db")
+    # Two caches on one database, like two app replicas
+    first = ResponseCache(stamp_refresh=0)
+    second = ResponseCache(stamp_refresh=0)
+    first.share_invalidation(InteractionStore(db_path))
+    second.share_invalidation(InteractionStore(db_path))
+    key = make_key("How do I fill form 161?", "161", "v1")
+    first.put(key, "answer")
+    second.put(key, "answer")
+
+    assert first.invalidate() == 1
+    assert first.get(key) is None
+    assert second.get(key) is None
+    second.put(key, "new answer")
+    assert second.get(key) == "new answer"
+
+
+def test_without_a_store_invalidation_is_local():
+    cache = ResponseCache()
+    key = make_key("question", "topic", "v1")
+    cache.put(key, "answer")
+    assert cache.get(make_key("Question?", "topic", "v1")) == "answer"
+    assert cache.invalidate(topic_key="other") == 0
+    assert cache.get(key) == "answer"
+    assert cache.invalidate() == 1
+    assert cache.get(key) is None
@@ -0,0 +1,73 @@
+import os
+import glob
+import json
+
+import pytest
+
+from retrieval import TopicIndex, chunk_json, is_pinned_key, split_text, tokenize
+
+DOC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'doc')
+
+
+def test_split_text_prefers_line_then_sentence_ends():
+    text = "first line\n" + "A sentence. " * 20 + "\nlast line"
+    pieces = split_text(text, 50)
+    assert all(len(piece) <= 50 for piece in pieces)
+    assert pieces[0].startswith("first line")
+    assert all(piece.rstrip().endswith((".", "line")) for piece in pieces)
+
+
+def test_split_text_cuts_words_longer_than_the_limit():
+    pieces = split_text("x" * 25, 10)
+    assert pieces == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_nested_values_are_split_with_their_path():
+    data = {
+        "role": "assistant",
+        "program": {"steps": [{"title": f"step {number}", "text": "Do this. " * 30} for number in range(5)]},
+    }
+    chunks = chunk_json(data, 200)
+    assert all(len(chunk["text"]) <= 200 for chunk in chunks)
+    assert any(chunk["text"].startswith("program > steps") for chunk in chunks)
+    assert [chunk["pinned"] for chunk in chunks if chunk["text"].startswith("role")] == [True]
+    # Nothing is lost: every step's title is in some chunk
+    for number in range(5):
+        assert any(f"step {number}" in chunk["text"] for chunk in chunks)
+
+
+def test_small_topic_is_one_chunk_per_key():
+    chunks = chunk_json({"a": "one", "b": ["two", "three"]}, 800)
+    assert [chunk["text"] for chunk in chunks] == ["a:\n  one", "b:\n  two\n  three"]
+
+
+def test_pinned_keys_are_matched_whole():
+    assert is_pinned_key("Role")
+    assert is_pinned_key("Constraints 2")
+    assert is_pinned_key("Constraints3")
+    assert is_pinned_key("YOUR HIGHTS MISSION AND MORAL VALUE")
+    assert not is_pinned_key("prompts")
+    assert not is_pinned_key("file_name")
+    assert not is_pinned_key("Additional_software_Guidance")
+
+
+def test_pinned_rules_over_the_budget_are_logged_once(caplog):
+    index = TopicIndex({"role": "Rule number one. " * 200, "info": "Details. " * 200})
+    with caplog.at_level("WARNING", logger="retrieval"):
+        index.build_context("details", token_budget=500)
+        index.build_context("details", token_budget=500)
+    assert len([record for record in caplog.records if "Pinned rules" in record.getMessage()]) == 1
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(DOC_DIR, '*.json'))), ids=os.path.basename)
+def test_topic_chunks_stay_within_budget(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError:
+            pytest.skip("not valid JSON")
+    chunks = chunk_json(data, 800)
+    assert max(len(chunk["text"]) for chunk in chunks) <= 800
+    # Splitting keeps every word of the topic's unsplit chunks
+    words = set(tokenize(" ".join(chunk["text"] for chunk in chunk_json(data, 10 ** 9))))
+    assert words <= set(tokenize(" ".join(chunk["text"] for chunk in chunks)))
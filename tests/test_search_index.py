@@ -0,0 +1,84 @@
+import time
+import threading
+
+import pytest
+
+from interaction_store import InteractionStore
+from search_index import SearchIndex, BackgroundIndexer
+
+
+@pytest.fixture
+def store(tmp_path):
+    return InteractionStore(str(tmp_path / "interactions.db"))
+
+
+@pytest.fixture
+def index(store):
+    return SearchIndex(store.db_path, frozenset({"the"}))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_search_matches_every_word_and_filters(store, index):
+    store.append_interaction("s1", "dana", "how do I renew the parking permit", ai_message="Open the parking form",
+                             timestamp="2024-01-01T10:00:00")
+    store.append_interaction("s2", "noa", "parking for guests", timestamp="2024-02-01T10:00:00")
+    store.add_admin_comment("s2", "guests park at gate 3", timestamp="2024-02-01T11:00:00")
+    index.update()
+
+    assert {(result["session_id"], result["kind"]) for result in index.search("parking")} == \
+        {("s1", "user"), ("s1", "ai"), ("s2", "user")}
+    assert [result["session_id"] for result in index.search("parking permit")] == ["s1"]
+    assert [result["kind"] for result in index.search("gate")] == ["comment"]
+    assert {result["session_id"] for result in index.search("parking", user="noa")} == {"s2"}
+    assert {result["session_id"] for result in index.search("parking", since="2024-01-15")} == {"s2"}
+    assert {result["session_id"] for result in index.search("parking", admin_involved=True)} == {"s2"}
+    assert index.search("the") == []
+    assert "parking" in index.search("permit")[0]["snippet"]
+
+
+def test_update_indexes_only_new_rows(store, index):
+    store.append_interaction("s1", "dana", "first question", ai_message="first answer")
+    assert index.update() == 1
+    assert index.update() == 0
+
+    store.append_interaction("s1", "dana", "second question")
+    store.add_admin_comment("s1", "a comment")
+    assert index.update() == 2
+    assert len(index.search("question")) == 2
+    assert len(index.search("first")) == 2
+
+
+def test_concurrent_updates_index_each_row_once(store, index):
+    for number in range(250):
+        store.append_interaction(f"s{number}", "dana", f"question number {number}")
+    barrier = threading.Barrier(3)
+    results = []
+
+    def update():
+        # An index per thread, like separate app processes sharing the database
+        updating_index = SearchIndex(store.db_path, frozenset({"the"}))
+        barrier.wait()
+        results.append(updating_index.update(batch_size=10))
+
+    threads = [threading.Thread(target=update) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(results) == 250
+    assert len(index.search("question", limit=1000)) == 250
+
+
+def test_background_indexer_indexes_new_messages(store, index):
+    store.append_interaction("s1", "dana", "written before the indexer started")
+    BackgroundIndexer(store, index, interval=60)
+    assert wait_for(lambda: index.search("before"))
+    # This process's writes wake the indexer without waiting for the interval
+    store.append_interaction("s1", "dana", "written afterwards")
+    assert wait_for(lambda: index.search("afterwards"))
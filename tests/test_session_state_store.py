@@ -0,0 +1,21 @@
+
+from session_state_store import SharedSessionState, KeyValueSessionBackend, LocalKeyValueClient
+
+
+def test_restore_and_owner():
+    shared = SharedSessionState(KeyValueSessionBackend(LocalKeyValueClient()), ["chat_history"])
+    assert shared.stored_owner("dana1") is None
+
+    writer_state = {"chat_history": [{"role": "user", "content": "שלום"}]}
+    shared.persist(writer_state, "dana1", "dana")
+    assert shared.stored_owner("dana1") == "dana"
+
+    # Another replica serving dana's next rerun gets her history
+    reader_state = {}
+    assert shared.restore(reader_state, "dana1", "dana")
+    assert reader_state["chat_history"] == writer_state["chat_history"]
+
+    # Someone else's id is refused and leaves the state alone
+    other_state = {}
+    assert not shared.restore(other_state, "dana1", "noa")
+    assert "chat_history" not in other_state
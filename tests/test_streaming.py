@@ -0,0 +1,46 @@
+import streaming
+from streaming import ThrottledRenderer
+
+
+class Placeholder:
+    def __init__(self):
+        self.rendered = []
+
+    def markdown(self, body):
+        self.rendered.append(body)
+
+
+def test_deltas_are_rendered_at_sentence_ends_and_finish_exactly():
+    placeholder = Placeholder()
+    renderer = ThrottledRenderer(placeholder, flush_interval=60)
+    for delta in ["Open ", "the ", "form.", " Fill ", "it ", "in"]:
+        renderer.add(delta)
+    assert placeholder.rendered == ["Open the form."]
+    assert renderer.finish() == "Open the form. Fill it in"
+    assert placeholder.rendered[-1] == "Open the form. Fill it in"
+    assert renderer.renders == 2
+    assert renderer.deltas == 6
+    assert renderer.bytes_sent == sum(len(text.encode('utf-8')) for text in placeholder.rendered)
+
+
+def test_long_sentences_are_rendered_on_the_interval():
+    placeholder = Placeholder()
+    renderer = ThrottledRenderer(placeholder, flush_interval=0)
+    renderer.add("word ")
+    renderer.add("")
+    renderer.add("word ")
+    assert placeholder.rendered == ["word ", "word word "]
+    # Nothing new since the last render
+    renderer.finish()
+    assert len(placeholder.rendered) == 2
+
+
+def test_finished_streams_are_counted_per_process():
+    before = streaming.stats()
+    renderer = ThrottledRenderer(Placeholder(), flush_interval=60)
+    renderer.add("answer")
+    renderer.finish()
+    after = streaming.stats()
+    assert after["streams"] == before["streams"] + 1
+    assert after["renders"] == before["renders"] + 1
+    assert after["bytes_sent"] == before["bytes_sent"] + len("answer")
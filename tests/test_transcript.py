@@ -0,0 +1,57 @@
+import os
+import glob
+import gzip
+import datetime
+import threading
+
+from transcript import TranscriptWriter
+
+
+def read_all(path):
+    lines = []
+    for segment in sorted(glob.glob(f"{path}.*.gz")):
+        with gzip.open(segment, 'rt', encoding='utf-8') as file:
+            lines.extend(file.read().splitlines())
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            lines.extend(file.read().splitlines())
+    return lines
+
+
+def test_writers_sharing_a_file_lose_nothing_across_rotations(tmp_path):
+    path = str(tmp_path / "inputs_and_outputs")
+    # Several writers on one file stand in for several app processes
+    writers = [TranscriptWriter(path, flush_interval=0.01, flush_size=5, rotate_bytes=2000) for _ in range(3)]
+
+    def write(number, writer):
+        for line in range(200):
+            writer.write(f"writer {number} line {line}\n")
+
+    threads = [threading.Thread(target=write, args=(number, writer)) for number, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in writers:
+        writer.close()
+
+    lines = read_all(path)
+    assert len(lines) == 600
+    assert len(set(lines)) == 600
+    assert glob.glob(f"{path}.*.gz")
+
+
+def test_rotates_a_segment_started_on_an_earlier_day(tmp_path):
+    path = str(tmp_path / "inputs_and_outputs")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("yesterday\n")
+    with open(f"{path}.lock", 'w', encoding='utf-8') as file:
+        file.write((datetime.date.today() - datetime.timedelta(days=1)).isoformat())
+    writer = TranscriptWriter(path, flush_interval=0.01)
+    writer.write("today\n")
+    writer.close()
+    with open(path, 'r', encoding='utf-8') as file:
+        assert file.read() == "today\n"
+    assert read_all(path) == ["yesterday", "today"]
+    with open(f"{path}.lock", 'r', encoding='utf-8') as file:
+        assert file.read() == datetime.date.today().isoformat()
@@ -0,0 +1,45 @@
+from interaction_store import get_store
+from session_state_store import SESSION_QUERY_PARAM
+
+
+def test_conversation_id_in_the_url_is_only_resumed_by_its_owner(app_factory):
+    owner = app_factory("user0", "משתמש 0")
+    owner.run()
+    assert not owner.exception
+    session_id = owner.session_state["session_id"]
+
+    other = app_factory("user1", "משתמש 1")
+    other.query_params[SESSION_QUERY_PARAM] = session_id
+    other.run()
+    assert not other.exception
+    assert other.session_state["session_id"] != session_id
+
+    returning = app_factory("user0", "משתמש 0")
+    returning.query_params[SESSION_QUERY_PARAM] = session_id
+    returning.run()
+    assert returning.session_state["session_id"] == session_id
+
+
+def test_matching_display_name_is_not_enough(app_factory):
+    # A conversation without stored state, written under the display name of the user opening it
+    get_store(app_factory.db_path).append_interaction("user01700000000", "משתמש 1", "question")
+    app = app_factory("user1", "משתמש 1")
+    app.query_params[SESSION_QUERY_PARAM] = "user01700000000"
+    app.run()
+    assert not app.exception
+    assert app.session_state["session_id"] != "user01700000000"
+
+
+def test_message_sent_as_the_admin_joins_is_kept(app_factory):
+    app = app_factory("user0", "משתמש 0")
+    app.run()
+    session_id = app.session_state["session_id"]
+    store = get_store(app_factory.db_path)
+    store.append_interaction(session_id, "משתמש 0", "question", ai_message="answer")
+    store.add_admin_comment(session_id, "the admin joins")
+
+    # The tab still shows the AI chat input when the user sends the message
+    app = app.chat_input[0].set_value("are you a person?").run()
+    assert not app.exception
+    assert [record["message"] for record in store.get_session_interactions(session_id)] == \
+        ["question", "are you a person?"]
@@ -0,0 +1,229 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from retrieval import TopicIndex, json_to_string, load_stop_words
+from router import TopicRouter
+import knowledge_pack
+
+# Process-wide cache for the files under doc/ and everything derived from them
+# (parsed topic JSON, flattened guidance strings, retrieval indexes, the router).
+# Entries are validated against the mtime and size of their source files on every
+# access, so editing a file in doc/ reloads it on the next request. Cached values
+# are shared by all sessions and must not be mutated.
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("TOPIC_CACHE_MAX_ENTRIES", 64))
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class TopicCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    # Return the cached value for key, rebuilding it if any of its source files changed
+    def get(self, key, paths, builder):
+        stamp = tuple(file_stamp(path) for path in paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self.reloads += 1
+
+        # Build outside the lock so a slow file doesn't block other sessions' cache hits
+        value = builder()
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
+
+
+cache = TopicCache()
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_json(path):
+    return cache.get(('json', path), [path], lambda: _read_json(path))
+
+
+def stop_words(path):
+    return cache.get(('stop_words', path), [path], lambda: frozenset(load_stop_words(path)))
+
+
+def guidance_string(path):
+    return cache.get(('guidance', path), [path], lambda: json_to_string(load_json(path)))
+
+
+def topic_index(path, stop_words_path):
+    return cache.get(
+        ('index', path, stop_words_path), [path, stop_words_path],
+        lambda: TopicIndex(load_json(path), stop_words(stop_words_path))
+    )
+
+
+# Topic mapping with every path resolved in this deployment (see knowledge_pack.resolve_topic_path)
+def topic_mapping(mapping_path):
+    doc_dir = os.path.dirname(os.path.abspath(mapping_path))
+    return cache.get(('mapping', mapping_path), [mapping_path],
+                     lambda: knowledge_pack.resolve_mapping(load_json(mapping_path), doc_dir)[0])
+
+
+# The router depends on the mapping, the stop words and every topic file it mines keywords from
+def topic_router(mapping_path, stop_words_path):
+    json_files = topic_mapping(mapping_path)
+    paths = [mapping_path, stop_words_path] + [info.get('path', '') for info in json_files.values()]
+    return cache.get(
+        ('router', mapping_path, stop_words_path), paths,
+        lambda: TopicRouter(json_files, stop_words(stop_words_path))
+    )
+
+
+_open_packs = {}
+_open_packs_lock = threading.Lock()
+
+
+# Opened knowledge pack, or None if none is built; reopened when the pack file is rebuilt,
+# and the pack it replaces is closed (PackTopics still in use fall back to the topic files)
+def knowledge_pack_file(pack_path):
+    pack = None
+    if file_stamp(pack_path) is not None:
+        pack = cache.get(('pack', pack_path), [pack_path], lambda: knowledge_pack.KnowledgePack(pack_path))
+    with _open_packs_lock:
+        previous = _open_packs.pop(pack_path, None)
+        if pack is not None:
+            _open_packs[pack_path] = pack
+    if previous is not None and previous is not pack:
+        previous.close()
+    return pack
+
+
+# sha256 of a file's content (None if it is missing), hashed once per version of the file
+def source_sha256(path):
+    if file_stamp(path) is None:
+        return None
+    return cache.get(('sha256', path), [path], lambda: knowledge_pack.file_sha256(path))
+
+
+# Whether a file differs from what a knowledge pack recorded about it. The content is only
+# hashed when the mtime or size changed.
+def source_changed(recorded, path):
+    stamp = file_stamp(path)
+    if stamp is None or stamp == (recorded.get("source_mtime_ns"), recorded.get("source_size")):
+        return False
+    return source_sha256(path) != recorded["source_sha256"]
+
+
+# Topic content read from the files in doc/
+class SourceTopics:
+    def __init__(self, mapping_path, stop_words_path):
+        self.mapping_path = mapping_path
+        self.stop_words_path = stop_words_path
+        self.mapping = topic_mapping(mapping_path)
+
+    def guidance_string(self, topic_key):
+        return guidance_string(self.mapping[topic_key]['path'])
+
+    def topic_index(self, topic_key):
+        return topic_index(self.mapping[topic_key]['path'], self.stop_words_path)
+
+    def topic_router(self):
+        return topic_router(self.mapping_path, self.stop_words_path)
+
+    # The content hash, like a knowledge pack records, so a cached answer outlives a pack build
+    def topic_version(self, topic_key):
+        return source_sha256(self.mapping[topic_key]['path'])
+
+
+# Topic content precompiled in a knowledge pack. A topic whose file was edited after the
+# build is read from the file like SourceTopics does, so edits show up before the next build.
+class PackTopics:
+    def __init__(self, pack, mapping_path, stop_words_path):
+        self.pack = pack
+        self.mapping_path = mapping_path
+        self.stop_words_path = stop_words_path
+        self.mapping = pack.mapping
+
+    def _from_source(self, topic_key):
+        return self.pack.closed or source_changed(self.pack.header["topics"][topic_key], self.mapping[topic_key]['path'])
+
+    def guidance_string(self, topic_key):
+        if self._from_source(topic_key):
+            return guidance_string(self.mapping[topic_key]['path'])
+        return self.pack.guidance_string(topic_key)
+
+    def topic_index(self, topic_key):
+        if self._from_source(topic_key):
+            return topic_index(self.mapping[topic_key]['path'], self.stop_words_path)
+        return self.pack.topic_index(topic_key, stop_words(self.stop_words_path))
+
+    # The router mines keywords from every topic, so one edited topic means the source router
+    def topic_router(self):
+        if any(self._from_source(topic_key) for topic_key in self.mapping):
+            return topic_router(self.mapping_path, self.stop_words_path)
+        return self.pack.topic_router(stop_words(self.stop_words_path))
+
+    def topic_version(self, topic_key):
+        if self._from_source(topic_key):
+            return source_sha256(self.mapping[topic_key]['path'])
+        return self.pack.topic_version(topic_key)
+
+
+_reported_pack_errors = set()
+
+
+# The knowledge pack if one is built (python knowledge_pack.py build) and the mapping and
+# stop words haven't changed since, otherwise the topic files. A pack that can't be read is
+# reported once per problem, not on every rerun.
+def topics(pack_path, mapping_path, stop_words_path):
+    try:
+        pack = knowledge_pack_file(pack_path)
+    except knowledge_pack.PackFormatError as e:
+        if str(e) not in _reported_pack_errors:
+            _reported_pack_errors.add(str(e))
+            logger.warning("Ignoring knowledge pack: %s", e)
+        pack = None
+    if (pack is not None and not source_changed(pack.header["mapping_file"], mapping_path)
+            and not source_changed(pack.header["stop_words_file"], stop_words_path)):
+        return PackTopics(pack, mapping_path, stop_words_path)
+    return SourceTopics(mapping_path, stop_words_path)
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import logging
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from transcript import TranscriptWriter
+
+# Lightweight request tracing. A span times one phase of the prompt path or the admin
+# refresh and carries attributes such as token counts and byte sizes; nested spans share
+# the trace id of their root. Finished spans are appended as JSON lines to a rotating
+# file (written in the background by a TranscriptWriter) and aggregated into Prometheus
+# histograms, served as text at http://localhost:$METRICS_PORT/metrics when the port is set.
+# Work handed to another thread keeps its parent span when submitted through wrap().
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TRACING", "1") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doc', 'traces.jsonl'))
+TRACE_ROTATE_BYTES = int(os.getenv("TRACE_ROTATE_BYTES", 20 * 1024 * 1024))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+# Stand-in returned when tracing is disabled
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+class JsonlExporter:
+    def __init__(self, path, rotate_bytes=TRACE_ROTATE_BYTES):
+        self.writer = TranscriptWriter(path, rotate_bytes=rotate_bytes, rotate_daily=False)
+
+    def export(self, span):
+        self.writer.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+class PrometheusExporter:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._attribute_totals = {}
+        self._errors = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            histogram = self._histograms.setdefault(span.name, {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0})
+            for index, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += span.duration
+            if span.status != "ok":
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+            # Token and byte counts add up across spans
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(('_tokens', '_bytes')):
+                    self._attribute_totals[(span.name, key)] = self._attribute_totals.get((span.name, key), 0) + value
+
+    # Also publish the numeric values of collect() (e.g. a cache's stats()) as gauges
+    def add_collector(self, prefix, collect):
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def render(self):
+        lines = [
+            "# HELP app_span_duration_seconds Duration of traced phases.",
+            "# TYPE app_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {name: dict(values, buckets=list(values["buckets"])) for name, values in self._histograms.items()}
+            attribute_totals = dict(self._attribute_totals)
+            errors = dict(self._errors)
+            collectors = dict(self._collectors)
+        for name, histogram in sorted(histograms.items()):
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f'app_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'app_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'app_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'app_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+        lines.append("# TYPE app_span_errors_total counter")
+        for name, count in sorted(errors.items()):
+            lines.append(f'app_span_errors_total{{span="{name}"}} {count}')
+        lines.append("# TYPE app_span_attribute_total counter")
+        for (name, key), total in sorted(attribute_totals.items()):
+            lines.append(f'app_span_attribute_total{{span="{name}",attribute="{key}"}} {total}')
+        for prefix, collect in sorted(collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", prefix, e)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"app_{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    def __init__(self, exporters):
+        self.exporters = exporters
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not ENABLED:
+            yield _NoopSpan()
+            return
+        parent = _current.get()
+        span = Span(name, parent.trace_id if parent else secrets.token_hex(16), parent.span_id if parent else None, attributes)
+        token = _current.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current.reset(token)
+            for exporter in self.exporters:
+                try:
+                    exporter.export(span)
+                except Exception as e:
+                    logger.warning("Span export failed: %s", e)
+
+
+metrics = PrometheusExporter()
+tracer = Tracer([JsonlExporter(TRACE_FILE), metrics] if ENABLED else [])
+
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+
+# The innermost open span of this thread (a no-op stand-in outside any span)
+def current_span():
+    return _current.get() or _NoopSpan()
+
+
+# Run fn in another thread as a child of the span that is current here
+def wrap(fn):
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+# Serve /metrics on METRICS_PORT (once per process; does nothing when the port isn't set)
+def start_metrics_server(port=METRICS_PORT):
+    global _server, _server_started
+    with _server_lock:
+        if _server_started or not port:
+            return _server
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        except OSError as e:
+            logger.error("Metrics endpoint not started on port %s: %s", port, e)
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,162 @@
+import os
+import gzip
+import time
+import queue
+import logging
+import shutil
+import atexit
+import datetime
+import threading
+
+import file_lock
+
+# Background writer for the inputs_and_outputs transcript (and the routing log). Lines are put on a
+# bounded queue and written by one thread in batches (group commit on a time or size
+# threshold), each batch followed by an fsync, so a crash loses at most the batch in
+# progress. The file is rotated by size or by date and closed segments are gzipped.
+# Processes sharing a file take turns under a lock on <file>.lock, which also holds the
+# date the current segment was started, so only one of them rotates it.
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", 1.0))
+FLUSH_SIZE = int(os.getenv("TRANSCRIPT_FLUSH_SIZE", 50))
+MAX_QUEUE = int(os.getenv("TRANSCRIPT_MAX_QUEUE", 10000))
+ROTATE_BYTES = int(os.getenv("TRANSCRIPT_ROTATE_BYTES", 10 * 1024 * 1024))
+
+_STOP = object()
+
+
+class TranscriptWriter:
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE, max_queue=MAX_QUEUE,
+                 rotate_bytes=ROTATE_BYTES, rotate_daily=True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self.lock_path = f"{path}.lock"
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _file_date(self):
+        try:
+            return datetime.date.fromtimestamp(os.path.getmtime(self.path))
+        except OSError:
+            return datetime.date.today()
+
+    # Queue text for writing; never blocks the request path for more than a moment
+    def write(self, text):
+        if self._closed:
+            return False
+        try:
+            self._queue.put(text, timeout=0.1)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Transcript queue is full; dropping an exchange.")
+            return False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._flush(batch)
+                except OSError as e:
+                    logger.error("Failed to write transcript batch: %s", e)
+
+    def _flush(self, batch):
+        with open(self.lock_path, 'a+', encoding='utf-8') as lock_file, file_lock.locked(lock_file):
+            self._rotate_if_needed(lock_file)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write("".join(batch))
+                file.flush()
+                os.fsync(file.fileno())
+        self.written += len(batch)
+        self.batches += 1
+
+    # Called with the lock held; the lock file holds the start date of the current segment
+    def _rotate_if_needed(self, lock_file):
+        lock_file.seek(0)
+        started = lock_file.read().strip()
+        if not os.path.exists(self.path):
+            self._start_segment(lock_file)
+            return
+        try:
+            segment_date = datetime.date.fromisoformat(started)
+        except ValueError:
+            segment_date = self._file_date()  # A file from before the lock file existed
+        too_big = self.rotate_bytes and os.path.getsize(self.path) >= self.rotate_bytes
+        new_day = self.rotate_daily and segment_date != datetime.date.today()
+        if not (too_big or new_day):
+            if not started:
+                self._start_segment(lock_file, segment_date)
+            return
+
+        # Closed segments are named after the time of rotation and compressed
+        segment_path = f"{self.path}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, segment_path)
+        with open(segment_path, 'rb') as source, gzip.open(segment_path + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(segment_path)
+        self._start_segment(lock_file)
+
+    @staticmethod
+    def _start_segment(lock_file, date=None):
+        lock_file.truncate(0)
+        lock_file.write((date or datetime.date.today()).isoformat())
+        lock_file.flush()
+
+    # Write everything still queued and stop the writer thread
+    def close(self, timeout=10):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+# Process-wide writer per transcript file
+def get_transcript_writer(path):
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = TranscriptWriter(path)
+        return _writers[path]